@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+dbus_command_check - exercise the structured D-Bus commands of
+commands.yaml (CmdRunner.compile_dbus_plan() and DBusTool.call_entry())
+against a private session dbus-daemon.
+
+Starts 'dbus-daemon --session', exports a fake org.kde.Shutdown (and a
+test method taking arguments) on it, and checks that the entries are
+called in-process with the right arguments, that a call to a missing
+service reports an error (so the qdbus fallback would run), and that the
+fallback commands are as qdbus expects.  Exits 0 if all checks pass.
+
+Usage (from the top-level directory; needs dbus-daemon and PyQt5):
+    python3 bench/dbus_command_check.py
+"""
+# pylint: disable=invalid-name,broad-exception-caught,import-outside-toplevel
+import os
+import sys
+import shutil
+import subprocess
+
+TOP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TOP_DIR)
+
+ENTRIES = {
+    'logoff': {'service': 'org.kde.Shutdown', 'path': '/Shutdown',
+               'interface': 'org.kde.Shutdown', 'method': 'logout'},
+    'record': {'service': 'org.kde.Shutdown', 'path': '/Shutdown',
+               'interface': 'org.kde.Shutdown', 'method': 'record',
+               'args': [3, 'Turn Off Screen', True]},
+    'missing': {'service': 'org.example.Missing', 'path': '/Missing',
+                'interface': 'org.example.Missing', 'method': 'nothing'},
+}
+
+
+def main():
+    """ Run a private dbus-daemon and the checks """
+    if not shutil.which('dbus-daemon'):
+        print('dbus_command_check: dbus-daemon is not installed', file=sys.stderr)
+        sys.exit(2)
+    daemon = subprocess.Popen(['dbus-daemon', '--session', '--nofork', '--print-address=1'],
+                              stdout=subprocess.PIPE, text=True)
+    try:
+        os.environ['DBUS_SESSION_BUS_ADDRESS'] = daemon.stdout.readline().strip()
+        sys.exit(check())
+    finally:
+        daemon.terminate()
+        daemon.wait()
+
+
+def check():
+    """ The checks; returns the exit code """
+    from PyQt5.QtCore import QCoreApplication, QObject, QTimer, pyqtSlot, Q_CLASSINFO
+    from PyQt5.QtDBus import QDBusConnection
+    from pwr_tray.CmdRunner import compile_plans
+    import pwr_tray.DBusTool as DBusTool
+    app = QCoreApplication([])
+    failures, calls, errors = [], [], {}
+
+    def expect(what, ok):
+        print(f'{"ok  " if ok else "FAIL"} {what}')
+        if not ok:
+            failures.append(what)
+
+    class FakeShutdown(QObject):
+        """ The exported object """
+        Q_CLASSINFO('D-Bus Interface', 'org.kde.Shutdown')
+
+        @pyqtSlot()
+        def logout(self):
+            calls.append(('logout',))
+
+        @pyqtSlot(int, str, bool)
+        def record(self, num, text, flag):
+            calls.append(('record', num, text, flag))
+
+    service = QDBusConnection.connectToBus(QDBusConnection.SessionBus, 'fake-kde')
+    fake = FakeShutdown()
+    expect('fake service registered', service.registerService('org.kde.Shutdown')
+           and service.registerObject('/Shutdown', fake, QDBusConnection.ExportAllSlots))
+
+    plans = compile_plans(ENTRIES, qdbus='qdbus6')
+    expect('fallback text', plans['logoff'].text
+           == 'qdbus6 org.kde.Shutdown /Shutdown org.kde.Shutdown.logout')
+    expect('fallback args', plans['record'].text
+           == "qdbus6 org.kde.Shutdown /Shutdown org.kde.Shutdown.record 3 'Turn Off Screen' true")
+    expect('no fallback without qdbus', not compile_plans(ENTRIES)['logoff'].text)
+
+    for key, plan in plans.items():
+        expect(f'{key} sent', DBusTool.call_entry(
+            plan.dbus, on_error=lambda msg, key=key: errors.__setitem__(key, msg)))
+    QTimer.singleShot(1000, app.quit)
+    app.exec_()
+    expect('logout called', ('logout',) in calls)
+    expect('record called with typed args', ('record', 3, 'Turn Off Screen', True) in calls)
+    expect(f'missing service reports an error ({errors.get("missing", "")[:40]}...)',
+           sorted(errors) == ['missing'])
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    main()
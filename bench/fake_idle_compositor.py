@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+fake_idle_compositor - a tiny Wayland "compositor" offering only wl_seat
+and ext_idle_notifier_v1, to exercise pwr-tray's 'ext-idle' backend
+(pwr_tray/WaylandIdle.py) without a real (or headless) compositor.
+
+The seat is idle from start-up until there is "user activity", which is
+simulated by SIGUSR1 or by a line on stdin; each notification reports
+'idled' once the seat has been idle for its timeout (counted from its
+creation or the last activity) and 'resumed' on the next activity.
+Events are logged to stderr.
+
+Usage (from the top-level directory):
+    python3 bench/fake_idle_compositor.py [--socket wayland-fake] &
+    WAYLAND_DISPLAY=wayland-fake pwr-tray -o --de sway-wayland  # idle_method: ext-idle
+    kill -USR1 %1   # the user touches the mouse
+"""
+# pylint: disable=invalid-name,broad-exception-caught
+import os
+import sys
+import time
+import struct
+import signal
+import socket
+import argparse
+import selectors
+
+SEAT, NOTIFIER = 'wl_seat', 'ext_idle_notifier_v1'
+GLOBALS = ((1, SEAT, 7), (2, NOTIFIER, 1)) # (name, interface, version)
+
+
+def log(*args):
+    """ Log to stderr with a time stamp """
+    print(f'{time.monotonic():.3f}', *args, file=sys.stderr, flush=True)
+
+
+def event(object_id, opcode, *args):
+    """ An event; 'args' are ints or strs """
+    body = b''
+    for arg in args:
+        if isinstance(arg, str):
+            data = arg.encode('utf-8') + b'\0'
+            body += struct.pack('=I', len(data)) + data + b'\0' * (-len(data) % 4)
+        else:
+            body += struct.pack('=I', arg)
+    return struct.pack('=II', object_id, (8 + len(body)) << 16 | opcode) + body
+
+
+class Client:
+    """ One connected client and its objects """
+    def __init__(self, conn):
+        self.conn, self.buf = conn, b''
+        self.objects = {1: 'wl_display'} # id -> interface
+        self.notes = {} # id -> [timeout_s, since_mono, idled]
+
+    def send(self, data):
+        """ Queue an event (small; the client reads promptly) """
+        self.conn.sendall(data)
+
+    def delete(self, oid):
+        """ Forget an object and tell the client it may reuse the id """
+        self.objects.pop(oid, None)
+        self.notes.pop(oid, None)
+        self.send(event(1, 1, oid))
+
+    def handle(self, oid, opcode, body):
+        """ Handle one request """
+        iface = self.objects.get(oid, None)
+        if iface == 'wl_display' and opcode == 0: # sync
+            callback, = struct.unpack_from('=I', body)
+            self.send(event(callback, 0, 0))
+            self.send(event(1, 1, callback))
+        elif iface == 'wl_display' and opcode == 1: # get_registry
+            registry, = struct.unpack_from('=I', body)
+            self.objects[registry] = 'wl_registry'
+            for name, interface, version in GLOBALS:
+                self.send(event(registry, 0, name, interface, version))
+        elif iface == 'wl_registry' and opcode == 0: # bind
+            name, size = struct.unpack_from('=II', body)
+            interface = body[8:8+size-1].decode()
+            offset = 8 + size + (-size % 4)
+            version, new_id = struct.unpack_from('=II', body, offset)
+            self.objects[new_id] = interface
+            log(f'bind {interface} v{version} as {new_id} (global {name})')
+        elif iface == NOTIFIER and opcode == 1: # get_idle_notification
+            new_id, timeout_ms, _seat = struct.unpack_from('=III', body)
+            self.objects[new_id] = 'ext_idle_notification_v1'
+            self.notes[new_id] = [timeout_ms / 1000, time.monotonic(), False]
+            log(f'notification {new_id}: {timeout_ms}ms')
+        elif iface == 'ext_idle_notification_v1' and opcode == 0: # destroy
+            log(f'notification {oid}: destroyed')
+            self.delete(oid)
+        elif iface == NOTIFIER and opcode == 0: # destroy
+            self.delete(oid)
+
+    def feed(self, data):
+        """ Parse the requests in 'data' """
+        self.buf += data
+        while len(self.buf) >= 8:
+            oid, word = struct.unpack_from('=II', self.buf)
+            size = word >> 16
+            if len(self.buf) < size:
+                return
+            body, self.buf = self.buf[8:size], self.buf[size:]
+            self.handle(oid, word & 0xffff, body)
+
+    def tick(self, activity):
+        """ Send idled/resumed events as due """
+        now = time.monotonic()
+        for oid, note in self.notes.items():
+            timeout_s, since, idled = note
+            if activity:
+                note[1] = now
+                if idled:
+                    note[2] = False
+                    self.send(event(oid, 1))
+                    log(f'notification {oid}: resumed')
+            elif not idled and now - since >= timeout_s:
+                note[2] = True
+                self.send(event(oid, 0))
+                log(f'notification {oid}: idled ({timeout_s}s)')
+
+
+def main():
+    """ Serve until interrupted """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--socket', default='wayland-fake',
+            help='socket name in $XDG_RUNTIME_DIR or a path (default: %(default)s)')
+    opts = parser.parse_args()
+    path = (opts.socket if os.path.isabs(opts.socket)
+            else os.path.join(os.environ.get('XDG_RUNTIME_DIR', '/tmp'), opts.socket))
+    if os.path.exists(path):
+        os.unlink(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(4)
+    log(f'listening on {path}')
+
+    activity = [False]
+    signal.signal(signal.SIGUSR1, lambda *_: activity.__setitem__(0, True))
+    sel = selectors.DefaultSelector()
+    sel.register(server, selectors.EVENT_READ, None)
+    if not sys.stdin.isatty():
+        try:
+            sel.register(sys.stdin, selectors.EVENT_READ, 'stdin')
+        except (OSError, ValueError):
+            pass # e.g., /dev/null
+    clients = {}
+    try:
+        while True:
+            for key, _ in sel.select(timeout=0.05):
+                if key.fileobj is server:
+                    conn, _ = server.accept()
+                    clients[conn] = Client(conn)
+                    sel.register(conn, selectors.EVENT_READ, 'client')
+                elif key.data == 'stdin':
+                    if sys.stdin.readline():
+                        activity[0] = True
+                    else:
+                        sel.unregister(sys.stdin)
+                else:
+                    data = key.fileobj.recv(4096)
+                    if not data:
+                        sel.unregister(key.fileobj)
+                        del clients[key.fileobj]
+                        log('client gone')
+                        continue
+                    clients[key.fileobj].feed(data)
+            if activity[0]:
+                log('user activity')
+            for client in list(clients.values()):
+                client.tick(activity[0])
+            activity[0] = False
+    except KeyboardInterrupt:
+        pass
+    finally:
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
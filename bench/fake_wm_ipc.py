@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+fake_wm_ipc - a tiny i3/sway IPC server to exercise pwr-tray's in-process
+WM client (pwr_tray/WmIpc.py) without a running i3 or sway.
+
+It answers RUN_COMMAND (logging each command; a command containing
+'fail' is answered with success=false), GET_TREE (one window) and
+SUBSCRIBE.  SIGUSR1 (or a line on stdin) toggles that window's fullscreen
+mode and sends the 'window' event to the subscribers.  Events are logged
+to stderr.
+
+Usage (from the top-level directory):
+    python3 bench/fake_wm_ipc.py [--socket /tmp/fake-sway.sock] &
+    SWAYSOCK=/tmp/fake-sway.sock pwr-tray -o --de sway-wayland
+    kill -USR1 %1   # the window goes fullscreen (again: it leaves it)
+"""
+# pylint: disable=invalid-name,broad-exception-caught
+import os
+import sys
+import json
+import time
+import struct
+import signal
+import socket
+import argparse
+import selectors
+
+MAGIC = b'i3-ipc'
+HEADER = struct.Struct('=6sII')
+RUN_COMMAND, SUBSCRIBE, GET_TREE = 0, 2, 4
+WINDOW_EVENT = 0x80000000 | 3
+WINDOW_ID = 42
+
+
+def log(*args):
+    """ Log to stderr with a time stamp """
+    print(f'{time.monotonic():.3f}', *args, file=sys.stderr, flush=True)
+
+
+def message(msg_type, obj):
+    """ A framed message with 'obj' as JSON """
+    data = json.dumps(obj).encode('utf-8')
+    return HEADER.pack(MAGIC, len(data), msg_type) + data
+
+
+def tree(fullscreen):
+    """ A minimal tree: root > output > workspace > one window """
+    window = {'id': WINDOW_ID, 'type': 'con', 'name': 'video',
+              'fullscreen_mode': 1 if fullscreen else 0, 'nodes': [], 'floating_nodes': []}
+    workspace = {'id': 3, 'type': 'workspace', 'nodes': [window], 'floating_nodes': []}
+    output = {'id': 2, 'type': 'output', 'nodes': [workspace], 'floating_nodes': []}
+    return {'id': 1, 'type': 'root', 'nodes': [output], 'floating_nodes': []}
+
+
+def main():
+    """ Serve until interrupted """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--socket', default='/tmp/fake-sway.sock',
+            help='socket path (default: %(default)s)')
+    opts = parser.parse_args()
+    if os.path.exists(opts.socket):
+        os.unlink(opts.socket)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(opts.socket)
+    server.listen(4)
+    log(f'listening on {opts.socket}')
+
+    toggles = [0]
+    signal.signal(signal.SIGUSR1, lambda *_: toggles.__setitem__(0, toggles[0] + 1))
+    sel = selectors.DefaultSelector()
+    sel.register(server, selectors.EVENT_READ, None)
+    if not sys.stdin.isatty():
+        try:
+            sel.register(sys.stdin, selectors.EVENT_READ, 'stdin')
+        except (OSError, ValueError):
+            pass # e.g., /dev/null
+    buffers, subscribers, fullscreen = {}, set(), False
+
+    def handle(conn, msg_type, payload):
+        text = payload.decode('utf-8')
+        if msg_type == RUN_COMMAND:
+            log(f'command: {text!r}')
+            conn.sendall(message(RUN_COMMAND, [{'success': 'fail' not in text}]))
+        elif msg_type == GET_TREE:
+            conn.sendall(message(GET_TREE, tree(fullscreen)))
+        elif msg_type == SUBSCRIBE:
+            log(f'subscribe: {text}')
+            subscribers.add(conn)
+            conn.sendall(message(SUBSCRIBE, {'success': True}))
+
+    try:
+        while True:
+            for key, _ in sel.select(timeout=0.1):
+                if key.fileobj is server:
+                    conn, _ = server.accept()
+                    buffers[conn] = b''
+                    sel.register(conn, selectors.EVENT_READ, 'client')
+                    continue
+                if key.data == 'stdin':
+                    if sys.stdin.readline():
+                        toggles[0] += 1
+                    else:
+                        sel.unregister(sys.stdin)
+                    continue
+                conn = key.fileobj
+                data = conn.recv(65536)
+                if not data:
+                    sel.unregister(conn)
+                    buffers.pop(conn, None)
+                    subscribers.discard(conn)
+                    continue
+                buffers[conn] += data
+                while len(buffers[conn]) >= HEADER.size:
+                    _, size, msg_type = HEADER.unpack_from(buffers[conn])
+                    if len(buffers[conn]) < HEADER.size + size:
+                        break
+                    payload = buffers[conn][HEADER.size:HEADER.size+size]
+                    buffers[conn] = buffers[conn][HEADER.size+size:]
+                    handle(conn, msg_type, payload)
+            while toggles[0]:
+                toggles[0] -= 1
+                fullscreen = not fullscreen
+                log(f'window {WINDOW_ID}: fullscreen={fullscreen}')
+                event = {'change': 'fullscreen_mode',
+                         'container': tree(fullscreen)['nodes'][0]['nodes'][0]['nodes'][0]}
+                for conn in list(subscribers):
+                    conn.sendall(message(WINDOW_EVENT, event))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        os.unlink(opts.socket)
+
+
+if __name__ == '__main__':
+    main()
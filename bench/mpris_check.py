@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+mpris_check - exercise the MPRIS watcher (pwr_tray/Mpris.py) against fake
+media players on a private session dbus-daemon.
+
+Starts 'dbus-daemon --session', exports fake org.mpris.MediaPlayer2
+players (each on its own connection, with a PlaybackStatus property and
+PropertiesChanged signals), and checks that the watcher finds a player
+already running, follows its status changes, notices players coming and
+going, and reports the aggregate state ('playing' wins) via on_change.
+Exits 0 if all checks pass.
+
+Usage (from the top-level directory; needs dbus-daemon and PyQt5):
+    python3 bench/mpris_check.py
+"""
+# pylint: disable=invalid-name,broad-exception-caught,import-outside-toplevel
+import os
+import sys
+import shutil
+import subprocess
+
+TOP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TOP_DIR)
+
+
+def main():
+    """ Run a private dbus-daemon and the checks """
+    if not shutil.which('dbus-daemon'):
+        print('mpris_check: dbus-daemon is not installed', file=sys.stderr)
+        sys.exit(2)
+    daemon = subprocess.Popen(['dbus-daemon', '--session', '--nofork', '--print-address=1'],
+                              stdout=subprocess.PIPE, text=True)
+    try:
+        os.environ['DBUS_SESSION_BUS_ADDRESS'] = daemon.stdout.readline().strip()
+        sys.exit(check())
+    finally:
+        daemon.terminate()
+        daemon.wait()
+
+
+def check():
+    """ The checks; returns the exit code """
+    from PyQt5.QtCore import QCoreApplication, QObject, QTimer, pyqtProperty, Q_CLASSINFO
+    from PyQt5.QtDBus import QDBusConnection, QDBusMessage
+    from pwr_tray.Mpris import MprisWatcher, MPRIS_PREFIX, MPRIS_PATH, PLAYER_IFACE
+    from pwr_tray.DBusTool import PROPS_IFACE
+    app = QCoreApplication([])
+    failures, changes = [], []
+
+    def expect(what, ok):
+        print(f'{"ok  " if ok else "FAIL"} {what}')
+        if not ok:
+            failures.append(what)
+
+    class FakePlayer(QObject):
+        """ The exported player object """
+        Q_CLASSINFO('D-Bus Interface', PLAYER_IFACE)
+
+        def __init__(self, name, status):
+            super().__init__()
+            self._status = status
+            self.conn = QDBusConnection.connectToBus(QDBusConnection.SessionBus, name)
+            self.conn.registerObject(MPRIS_PATH, self, QDBusConnection.ExportAllProperties)
+            self.conn.registerService(MPRIS_PREFIX + name)
+
+        @pyqtProperty(str)
+        def PlaybackStatus(self):
+            return self._status
+
+        def set_status(self, status):
+            self._status = status
+            msg = QDBusMessage.createSignal(MPRIS_PATH, PROPS_IFACE, 'PropertiesChanged')
+            msg.setArguments([PLAYER_IFACE, {'PlaybackStatus': status}, []])
+            self.conn.send(msg)
+
+        def quit(self):
+            self.conn.unregisterService(MPRIS_PREFIX + self.conn.name())
+
+    players = {'early': FakePlayer('early', 'Paused')}
+    watcher = [None]
+
+    def steps():
+        """ (delay_ms, action, check) run in order """
+        yield 0, lambda: watcher.__setitem__(0, MprisWatcher(
+                on_change=changes.append,
+                bus=QDBusConnection.connectToBus(QDBusConnection.SessionBus, 'watcher'))), None
+        yield 300, None, lambda: expect('running player found (paused)',
+                                        watcher[0].play_state == 'paused')
+        yield 0, lambda: players['early'].set_status('Playing'), None
+        yield 300, None, lambda: expect('status change followed (playing)',
+                                        changes[-1:] == ['playing'])
+        yield 0, lambda: players.__setitem__('late', FakePlayer('late', 'Paused')), None
+        yield 300, None, lambda: expect('new player noticed', len(watcher[0].players) == 2)
+        yield 0, lambda: players['early'].set_status('Stopped'), None
+        yield 300, None, lambda: expect('aggregate follows (paused)',
+                                        watcher[0].play_state == 'paused')
+        yield 0, lambda: players['late'].quit(), None
+        yield 300, None, lambda: expect('player exit noticed (stopped)',
+                                        len(watcher[0].players) == 1
+                                        and watcher[0].play_state == 'stopped')
+        yield 0, lambda: players['early'].quit(), None
+        yield 300, None, lambda: expect('no players left', watcher[0].play_state == ''
+                                        and changes[-1:] == [''])
+
+    todo = steps()
+
+    def run_next():
+        try:
+            delay_ms, action, verify = next(todo)
+        except StopIteration:
+            app.quit()
+            return
+        def go():
+            if action:
+                action()
+            if verify:
+                verify()
+            run_next()
+        QTimer.singleShot(delay_ms, go)
+
+    run_next()
+    QTimer.singleShot(10000, app.quit) # a safety net
+    app.exec_()
+    expect('watcher was active', bool(watcher[0] and watcher[0].active))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+policy_replay - replay an idle/activity/battery trace against the idle
+policy (pwr_tray/Policy.py) on a virtual clock; no Qt or display needed,
+and hours of trace take milliseconds.
+
+A trace has one event per line, 'when kind [value]' ('when' in seconds or
+with an h/m/s suffix; '#' starts a comment):
+    0      mode      SleepAfterLock
+    10m    activity
+    1h     selector  LoBattery
+    2h     inhibited on
+    10h    end       # idle on to here (the trace's horizon)
+Prints the transitions (when, rule, action, new state) and the timing.
+With --expect, exits 1 if the transitions differ from that file's (as
+written by -o), so policy changes can be regression-tested in bulk.
+
+Usage (from the top-level directory):
+    python3 bench/policy_replay.py bench/workday.trace
+            [--expect bench/workday.expected] [-o out.txt] [--until 12h]
+            [--limits Settings=15/30,HiBattery=10/15,LoBattery=5/5]
+"""
+# pylint: disable=invalid-name
+import os
+import sys
+import time
+import argparse
+
+TOP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TOP_DIR)
+import pwr_tray.Policy as Policy # pylint: disable=wrong-import-position
+
+DEFAULT_LIMITS = 'Settings=15/30,HiBattery=10/15,LoBattery=5/5'
+
+
+def parse_limits(text):
+    """ 'Settings=15/30,...' as {selector: (lock_min, sleep_min)} """
+    limits = {}
+    for item in text.split(','):
+        selector, mins = item.split('=', 1)
+        lock_min, sleep_min = mins.split('/', 1)
+        limits[selector.strip()] = (int(lock_min), int(sleep_min))
+    return limits
+
+
+def format_transition(transition):
+    """ One transition as a line of text """
+    when_s, rule, action, state = transition
+    return f'{when_s:>10.3f} {rule:<6} {action or "-":<9} {state or "-"}'
+
+
+def main():
+    """ Replay the trace; print and check the transitions """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('trace', help='the trace file')
+    parser.add_argument('--limits', default=DEFAULT_LIMITS,
+            help='lock/sleep minutes per selector (default: %(default)s)')
+    parser.add_argument('--blank-s', type=int, default=20,
+            help='seconds from Locked to blanking (default: %(default)s)')
+    parser.add_argument('--power-off', action='store_true',
+            help='power off rather than suspend')
+    parser.add_argument('--until', default=None,
+            help='idle on to this time (e.g., 12h) past the trace\'s end')
+    parser.add_argument('--expect', default=None,
+            help='fail unless the transitions match this file')
+    parser.add_argument('-o', '--output', default=None,
+            help='write the transitions to this file')
+    opts = parser.parse_args()
+
+    with open(opts.trace, 'r', encoding='utf-8') as fh:
+        events = Policy.parse_trace(fh)
+    until_s = Policy.parse_trace([f'{opts.until} activity'])[0][0] if opts.until else None
+    sim = Policy.Simulator(parse_limits(opts.limits), blank_s=opts.blank_s,
+                           power_off=opts.power_off)
+    began = time.perf_counter()
+    transitions = sim.run(events, until_s=until_s)
+    elapsed_ms = (time.perf_counter() - began) * 1000
+    lines = [format_transition(transition) for transition in transitions]
+    for line in lines:
+        print(line)
+    span_s = max([until_s or 0] + [event[0] for event in events])
+    print(f'# {len(events)} events over {span_s/3600:.2f}h: {sim.decisions} decisions,'
+          f' {sim.resets} idle resets, {len(transitions)} transitions'
+          f' in {elapsed_ms:.2f}ms', file=sys.stderr)
+
+    if opts.output:
+        with open(opts.output, 'w', encoding='utf-8') as fh:
+            fh.write('\n'.join(lines) + '\n')
+    if opts.expect:
+        with open(opts.expect, 'r', encoding='utf-8') as fh:
+            expected = [line.rstrip('\n') for line in fh if line.strip()]
+        if expected != lines:
+            for idx in range(max(len(expected), len(lines))):
+                want = expected[idx] if idx < len(expected) else '(none)'
+                got = lines[idx] if idx < len(lines) else '(none)'
+                if want != got:
+                    print(f'FAIL at #{idx}: expected {want.strip()!r}, got {got.strip()!r}',
+                          file=sys.stderr)
+                    break
+            sys.exit(1)
+        print(f'ok: matches {opts.expect}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+prt_bench - micro-benchmark of the per-call cost of Utils.prt()
+
+Compares the former prt() (inspect.stack(), fstat per call, StringIO,
+synchronous flush) against the current queued one, and a DEBUG-level call
+that is disabled.  Output goes to a throw-away log in a temp folder.
+
+Usage (from the top-level directory):
+    python3 bench/prt_bench.py [-n CALLS]
+"""
+# pylint: disable=invalid-name,broad-exception-caught,import-outside-toplevel
+import os
+import sys
+import stat
+import time
+import shutil
+import inspect
+import argparse
+import tempfile
+from datetime import datetime
+from io import StringIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pwr_tray.Utils as Utils # pylint: disable=wrong-import-position
+
+
+def legacy_prt(*args, **kwargs):
+    """ The prt() of pwr-tray 1.0.7, inlined for comparison """
+    def where(above=0):
+        stack, frameNo = inspect.stack(), 2 + above
+        if frameNo < 0 or len(stack) < frameNo + 2:
+            return '[n/a]'
+        filename, line_number = stack[frameNo][1:3]
+        return f'[{filename.split("/")[-1]}:{line_number}]'
+
+    def check_stdout():
+        if Utils.prt_kb > 0 and Utils.prt_path:
+            try:
+                stat.S_ISREG(os.fstat(sys.stdout.fileno()).st_mode)
+            except Exception:
+                pass
+            if os.fstat(sys.stdout.fileno()).st_size > Utils.prt_kb*1024:
+                shutil.move(Utils.prt_path, f'{Utils.prt_path}1')
+                sys.stdout = open(Utils.prt_path, "a+", encoding='utf-8')
+
+    check_stdout()
+    dt = datetime.now().strftime('%m-%d^%H:%M:%S')
+    s = StringIO()
+    print(dt, end=' ', file=s)
+    kwargs['end'] = ' '
+    kwargs['file'] = s
+    print(*args, **kwargs)
+    string = f'{s.getvalue()} {where()}'
+    print(string, flush=True)
+
+
+def timed(label, func, count):
+    """ Return a result line with the mean µs per call """
+    began = time.perf_counter()
+    for idx in range(count):
+        func('DB', 'on_timeout() wakeups:', idx, {'lock_s': 900, 'state': 'Awake'})
+    Utils.prt_flush(timeout=30)
+    elapsed = time.perf_counter() - began
+    return f'{label:>16}: {elapsed*1e6/count:8.2f} µs/call'
+
+
+def main():
+    """ Run each variant into the temp log; report on the real stderr """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--calls', type=int, default=20000)
+    opts = parser.parse_args()
+
+    report = os.fdopen(os.dup(2), 'w', encoding='utf-8')
+    folder = tempfile.mkdtemp(prefix='prt-bench-')
+    try:
+        Utils.prt_path = os.path.join(folder, 'debug.log')
+        Utils.prt_kb = 100*1024 # no rotation while timing
+        Utils.prt('bench: start', to_stdout=False) # redirect stdout to the log
+        Utils.prt_flush()
+        results = [timed('legacy prt', legacy_prt, opts.calls),
+                   timed('prt', Utils.prt, opts.calls)]
+        Utils.prt_level = Utils.INFO
+        results.append(timed('dbg (disabled)', Utils.dbg, opts.calls))
+        print(f'{opts.calls} calls each:', *results, sep='\n  ', file=report)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
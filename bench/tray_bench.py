@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+tray_bench - headless benchmark of the tray's main loop
+
+Runs PwrTray under QT_QPA_PLATFORM=offscreen with a forced desktop (--de)
+and stub DE commands (xprintidle, systemd-inhibit, playerctl, swayidle, ...)
+on $PATH, in a throw-away $HOME, and reports as JSON:
+ - startup: seconds to import and to construct the tray (first icon)
+ - ticks: CPU/wall time per on_timeout() (idle policy forced each tick)
+   and of check_inhibited() and build_menu() alone (with the QActions the
+   latter created), over a simulated span of --hours at the old 2s cadence
+ - forks: stub executions and Popen() calls, in total and per tick
+ - rss_kb: resident size before and after the simulated span
+ - live: scheduler wakeups/hour with the real event loop for --secs
+
+With --baseline, exits 1 if a key metric regressed by more than
+--tolerance (e.g., for CI on a plain Linux box with PyQt5).
+
+Usage (from the top-level directory):
+    python3 bench/tray_bench.py [--de i3-x11] [--hours 1] [--secs 10]
+            [-o results.json] [--baseline old.json [--tolerance 0.25]]
+"""
+# pylint: disable=invalid-name,broad-exception-caught,import-outside-toplevel
+# pylint: disable=too-many-locals
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+TOP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STUBS = ('xprintidle', 'systemd-inhibit', 'playerctl', 'swayidle', 'systemctl',
+         'loginctl', 'xset', 'i3-msg', 'i3lock', 'swaymsg', 'swaylock',
+         'hyprctl', 'qdbus', 'kstart5', 'xfce4-session-logout', 'xfce4-panel',
+         'cinnamon-session-quit', 'mate-session-save', 'lxqt-leave')
+
+STUB_SCRIPT = r'''#!/bin/sh
+echo "$(basename "$0") $*" >> "$BENCH_DIR/forks.log"
+case "$(basename "$0")" in
+  xprintidle) cat "$BENCH_DIR/idle_ms" 2>/dev/null || echo 1000;;
+  systemd-inhibit) printf "WHO UID USER PID COMM WHAT WHY MODE\n\n0 inhibitors listed.\n";;
+  playerctl) echo Stopped;;
+  swayidle) exec sleep 100000;;
+esac
+exit 0
+'''
+
+# metric -> how it is found in the results (regressions are increases)
+KEY_METRICS = {
+    'tick_cpu_us': ('ticks', 'cpu_us', 'mean'),
+    'check_inhibited_cpu_us': ('check_inhibited', 'cpu_us', 'mean'),
+    'build_menu_cpu_us': ('build_menu', 'cpu_us', 'mean'),
+    'forks_per_tick': ('forks', 'per_tick'),
+    'startup_s': ('startup', 'total_s'),
+}
+
+
+def make_env(bench_dir):
+    """ The environment of the child: stubs first on $PATH, a fresh $HOME """
+    bin_dir = os.path.join(bench_dir, 'bin')
+    os.makedirs(bin_dir)
+    for name in STUBS:
+        path = os.path.join(bin_dir, name)
+        with open(path, 'w', encoding='utf-8') as handle:
+            handle.write(STUB_SCRIPT)
+        os.chmod(path, 0o755)
+    for sub in ('home', 'run'):
+        os.makedirs(os.path.join(bench_dir, sub), mode=0o700)
+    env = dict(os.environ)
+    for var in ('DISPLAY', 'WAYLAND_DISPLAY', 'SWAYSOCK', 'I3SOCK'):
+        env.pop(var, None)
+    env.update(BENCH_DIR=bench_dir, HOME=os.path.join(bench_dir, 'home'),
+               XDG_RUNTIME_DIR=os.path.join(bench_dir, 'run'),
+               PATH=f'{bin_dir}:{env.get("PATH", "/usr/bin:/bin")}',
+               QT_QPA_PLATFORM='offscreen', PYTHONPATH=TOP_DIR)
+    return env
+
+
+def summarize(samples):
+    """ mean/p50/p95/max of a list of numbers """
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    def pick(frac):
+        return ordered[min(len(ordered)-1, int(frac*len(ordered)))]
+    return {'mean': round(sum(ordered)/len(ordered), 1), 'p50': round(pick(0.50), 1),
+            'p95': round(pick(0.95), 1), 'max': round(ordered[-1], 1)}
+
+
+def rss_kb():
+    """ Resident set size of this process """
+    with open('/proc/self/statm', 'r', encoding='utf-8') as handle:
+        return int(handle.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+
+
+def child(opts):
+    """ Runs in the benchmark environment; prints the results as JSON """
+    began = time.monotonic()
+    bench_dir = os.environ['BENCH_DIR']
+    forks_log = os.path.join(bench_dir, 'forks.log')
+    popens = [0]
+
+    def forks():
+        try:
+            with open(forks_log, 'r', encoding='utf-8') as handle:
+                return [line.split()[0] for line in handle if line.strip()]
+        except OSError:
+            return []
+
+    # count Popen()s (subprocess.run() etc. use it) on top of the stub log
+    class CountingPopen(subprocess.Popen):
+        """ Popen that counts its instances """
+        def __init__(self, *args, **kwargs):
+            popens[0] += 1
+            super().__init__(*args, **kwargs)
+    subprocess.Popen = CountingPopen
+
+    from PyQt5.QtWidgets import QSystemTrayIcon
+    from PyQt5.QtCore import QTimer
+    # offscreen has no tray; pretend there is one
+    QSystemTrayIcon.isSystemTrayAvailable = staticmethod(lambda: True)
+    import pwr_tray.Utils as Utils
+    from pwr_tray.IniTool import IniTool
+    from pwr_tray.main import PwrTray
+    imported = time.monotonic()
+
+    ini_tool = IniTool(paths_only=False)
+    Utils.prt_path = ini_tool.log_path
+    Utils.prt('BENCH START-UP', to_stdout=False)
+    ini_tool.update_config()
+    tray = PwrTray(ini_tool=ini_tool, force_de=opts.de)
+    tray.app.processEvents()
+    ready = time.monotonic()
+    results = {'de': opts.de, 'python': sys.version.split()[0],
+               'startup': {'import_s': round(imported - began, 3),
+                           'init_s': round(ready - imported, 3),
+                           'total_s': round(ready - began, 3)}}
+
+    def timed(func, count):
+        cpus, walls = [], []
+        for _ in range(count):
+            wall0, cpu0 = time.perf_counter(), time.process_time()
+            func()
+            cpus.append((time.process_time() - cpu0) * 1e6)
+            walls.append((time.perf_counter() - wall0) * 1e6)
+            tray.app.processEvents()
+        return {'cpu_us': summarize(cpus), 'wall_us': summarize(walls)}
+
+    def tick():
+        tray.sample_due_mono = 0 # force the idle policy each time
+        tray.on_timeout()
+        while tray.probes.running: # the probes answer between real ticks
+            tray.app.processEvents()
+            time.sleep(0.0002)
+
+    ticks = max(1, int(opts.hours * 3600 / 2))
+    timed(tick, min(20, ticks)) # warm up
+    rss0, forks0, popens0 = rss_kb(), len(forks()), popens[0]
+    results['ticks'] = timed(tick, ticks)
+    results['ticks']['count'] = ticks
+    tick_forks = forks()[forks0:]
+    by_cmd = {}
+    for name in tick_forks:
+        by_cmd[name] = by_cmd.get(name, 0) + 1
+    results['forks'] = {'total': len(tick_forks), 'per_tick': round(len(tick_forks)/ticks, 3),
+                        'popen_per_tick': round((popens[0]-popens0)/ticks, 3),
+                        'by_command': by_cmd}
+    results['rss_kb'] = {'before': rss0, 'after': rss_kb(), 'growth': rss_kb() - rss0,
+                         'simulated_hours': opts.hours}
+    count = min(ticks, 500)
+    results['check_inhibited'] = timed(tray.check_inhibited, count)
+    created0 = tray.menu_items.created
+    results['build_menu'] = timed(tray.build_menu, count)
+    results['build_menu']['qactions_created'] = tray.menu_items.created - created0
+
+    if opts.secs > 0:
+        wakeups0, forks0 = tray.scheduler.wakeups, len(forks())
+        tray.scheduler.arm(0.1)
+        QTimer.singleShot(int(opts.secs * 1000), tray.app.quit)
+        tray.app.exec_()
+        wakeups = tray.scheduler.wakeups - wakeups0
+        results['live'] = {'secs': opts.secs, 'wakeups': wakeups,
+                           'wakeups_per_hour': round(wakeups * 3600 / opts.secs, 1),
+                           'forks': len(forks()) - forks0}
+    Utils.prt_flush()
+    os.write(opts.result_fd, json.dumps(results).encode('utf-8'))
+    os._exit(0) # skip the applet's atexit handlers
+
+
+def lookup(results, path):
+    """ The value at 'path' (a tuple of keys) or None """
+    for key in path:
+        if not isinstance(results, dict) or key not in results:
+            return None
+        results = results[key]
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """ Names of the key metrics that regressed beyond 'tolerance' """
+    regressed = []
+    for name, path in KEY_METRICS.items():
+        now, was = lookup(results, path), lookup(baseline, path)
+        if isinstance(now, (int, float)) and isinstance(was, (int, float)):
+            if now > was * (1 + tolerance) and now - was > 1e-3:
+                regressed.append(f'{name}: {was} -> {now}')
+    return regressed
+
+
+def main():
+    """ Set up the environment, run the child, and report """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--de', default='i3-x11',
+            help='desktop to force (default: %(default)s)')
+    parser.add_argument('--hours', type=float, default=1.0,
+            help='simulated hours of 2s ticks (default: %(default)s)')
+    parser.add_argument('--secs', type=float, default=10.0,
+            help='seconds of the live event loop for wakeups (default: %(default)s)')
+    parser.add_argument('-o', '--output', help='write the JSON here too')
+    parser.add_argument('--baseline', help='earlier JSON results to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+            help='allowed fractional increase vs the baseline (default: %(default)s)')
+    parser.add_argument('--keep', action='store_true',
+            help='keep the benchmark folder (for its debug.log)')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--result-fd', type=int, help=argparse.SUPPRESS)
+    opts = parser.parse_args()
+    if opts.child:
+        child(opts)
+        return
+
+    bench_dir = tempfile.mkdtemp(prefix='tray-bench-')
+    try:
+        env = make_env(bench_dir)
+        read_fd, write_fd = os.pipe()
+        cmd = [sys.executable, os.path.abspath(__file__), '--child',
+               '--result-fd', str(write_fd), '--de', opts.de,
+               '--hours', str(opts.hours), '--secs', str(opts.secs)]
+        if shutil.which('dbus-run-session'): # a private session bus
+            cmd = ['dbus-run-session', '--'] + cmd
+        with subprocess.Popen(cmd, env=env, cwd=TOP_DIR, pass_fds=(write_fd,),
+                              stdout=subprocess.DEVNULL) as proc:
+            os.close(write_fd)
+            with os.fdopen(read_fd, 'rb') as pipe:
+                data = pipe.read()
+            proc.wait()
+        if proc.returncode or not data:
+            print(f'tray_bench: child failed (rc={proc.returncode});'
+                  f' see {bench_dir}/home/.config/pwr-tray/debug.log', file=sys.stderr)
+            opts.keep = True
+            sys.exit(2)
+        results = json.loads(data)
+    finally:
+        if not opts.keep:
+            shutil.rmtree(bench_dir, ignore_errors=True)
+        else:
+            print(f'tray_bench: kept {bench_dir}', file=sys.stderr)
+
+    text = json.dumps(results, indent=2)
+    print(text)
+    if opts.output:
+        with open(opts.output, 'w', encoding='utf-8') as handle:
+            handle.write(text + '\n')
+    if opts.baseline:
+        with open(opts.baseline, 'r', encoding='utf-8') as handle:
+            regressed = compare(results, json.load(handle), opts.tolerance)
+        for line in regressed:
+            print(f'REGRESSED: {line}', file=sys.stderr)
+        sys.exit(1 if regressed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+x11_control_check - exercise the in-process X11 control (X11Tool.XControl)
+and the XSync idle counter against a private Xvfb server.
+
+Starts 'Xvfb :N +extension DPMS', then checks that XControl forces the
+DPMS level (immediately and after a delay, as 'sleep 1.0; xset dpms force
+off' would), and that resetting the screen saver zeroes the idle time.
+Exits 0 if all checks pass.
+
+Usage (from the top-level directory; needs Xvfb and PyQt5):
+    python3 bench/x11_control_check.py [--display :99]
+"""
+# pylint: disable=invalid-name,broad-exception-caught,import-outside-toplevel
+import os
+import sys
+import time
+import shutil
+import argparse
+import subprocess
+
+TOP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TOP_DIR)
+
+
+def main():
+    """ Run Xvfb and the checks """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--display', default=':99', help='display for Xvfb (default: %(default)s)')
+    opts = parser.parse_args()
+    if not shutil.which('Xvfb'):
+        print('x11_control_check: Xvfb is not installed', file=sys.stderr)
+        sys.exit(2)
+    server = subprocess.Popen(['Xvfb', opts.display, '-screen', '0', '640x480x24',
+                               '+extension', 'DPMS'], stderr=subprocess.DEVNULL)
+    try:
+        time.sleep(1.0) # let it start
+        sys.exit(check(opts.display))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def check(display):
+    """ The checks; returns the exit code """
+    os.environ['QT_QPA_PLATFORM'] = 'offscreen'
+    from types import SimpleNamespace
+    from PyQt5.QtCore import QCoreApplication, QTimer
+    from pwr_tray.X11Tool import XControl, XSyncIdle, x11_natives
+    app = QCoreApplication([])
+    failures = []
+
+    def expect(what, ok):
+        print(f'{"ok  " if ok else "FAIL"} {what}')
+        if not ok:
+            failures.append(what)
+
+    idle = XSyncIdle(on_alarm=lambda: None, display=display)
+    expect('XSyncIdle is active', idle.active)
+    control = XControl(dpy=idle.dpy if idle.active else None, display=display)
+    expect('XControl is active', control.active)
+    expect('server has DPMS', control.dpms)
+    if not control.active:
+        return 1
+
+    plans = {'monitors_off': SimpleNamespace(text='sleep 0.5; exec xset dpms force off'),
+             'monitors_on': SimpleNamespace(text='xset dpms force on'),
+             'reset_idle': SimpleNamespace(text='xset s reset')}
+    natives = x11_natives(plans)
+    expect('all three commands are native', sorted(natives) == sorted(plans))
+
+    control.run(natives['monitors_on'])
+    expect('dpms on', control.dpms_level() == 'on')
+    control.run(natives['monitors_off'])
+    expect('dpms still on before the delay', control.dpms_level() == 'on')
+    QTimer.singleShot(800, app.quit)
+    app.exec_()
+    expect('dpms off after the delay', control.dpms_level() == 'off')
+    control.run(natives['monitors_on'])
+
+    if idle.active:
+        time.sleep(1.2)
+        before_ms = idle.idle_ms()
+        control.run(natives['reset_idle'])
+        after_ms = idle.idle_ms()
+        expect(f'reset_idle zeroes the idle time ({before_ms} -> {after_ms}ms)',
+               before_ms >= 1000 > after_ms)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    main()
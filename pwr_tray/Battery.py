@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Event-driven battery/AC state from sysfs (/sys/class/power_supply).
+
+The few attributes we need (AC 'online', battery 'status' and 'capacity')
+are kept open and re-read with pread() only when something may have
+changed: a kernel power_supply uevent on a netlink socket, or a UPower
+PropertiesChanged signal.  That gives sub-second reaction to plugging in
+at no steady-state cost.  Since not every driver emits a uevent per percent,
+a slow re-read runs while discharging unless UPower is running (i.e.,
+owns its name on the system bus; its comings and goings are followed).
+
+For testing, pass 'root' (a fake sysfs tree) and 'uevent_sock' (e.g., one
+end of a socketpair() that receives synthetic uevent messages).
+"""
+# pylint: disable=invalid-name,broad-exception-caught
+import os
+import socket
+from PyQt5.QtCore import QObject, QSocketNotifier, QTimer, pyqtSlot
+from PyQt5.QtDBus import QDBusMessage
+import pwr_tray.DBusTool as DBusTool
+from pwr_tray.DBusTool import PROPS_IFACE, BUS_NAME
+from pwr_tray.Utils import prt
+
+SYSFS_ROOT = '/sys/class/power_supply'
+NETLINK_KOBJECT_UEVENT = 15
+UPOWER = 'org.freedesktop.UPower'
+
+
+class SysfsBattery(QObject):
+    """ Current power state: present, plugged, percent.
+     - on_change() is called when any of those changes """
+    slow_poll_s = 60
+
+    def __init__(self, on_change=None, root=SYSFS_ROOT, uevent_sock=None,
+                 bus=None):
+        super().__init__()
+        self.on_change = None # not during construction
+        self.root = root
+        self.present, self.plugged, self.percent = False, True, 100.0
+        self.fds = {} # path -> fd
+        self.mains, self.batteries = [], [] # lists of supply dirs
+        self.scan()
+        self.read()
+        self.on_change = on_change
+
+        self.sock = uevent_sock if uevent_sock else self._open_uevent_sock()
+        self.notifier = None
+        if self.sock:
+            self.sock.setblocking(False)
+            self.notifier = QSocketNotifier(self.sock.fileno(), QSocketNotifier.Read)
+            self.notifier.activated.connect(self._on_uevent)
+        self.upower = False # is UPower running (so its signals come)?
+        self.bus = bus if bus else DBusTool.system_bus()
+        if (DBusTool.subscribe(self.bus, UPOWER, '', PROPS_IFACE,
+                               'PropertiesChanged', self._on_upower)
+                and DBusTool.subscribe(self.bus, BUS_NAME[0], BUS_NAME[1],
+                        BUS_NAME[2], 'NameOwnerChanged', self._on_owner_changed)):
+            DBusTool.async_call(self.bus, *BUS_NAME, 'NameHasOwner', UPOWER,
+                    on_reply=lambda args: self._set_upower(bool(args and args[0])))
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.read)
+        self._arm_slow_poll()
+        prt(f'battery: {len(self.batteries)} battery/{len(self.mains)} AC supplies;',
+            f'uevents={bool(self.sock)}')
+
+    @staticmethod
+    def _open_uevent_sock():
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM,
+                                 NETLINK_KOBJECT_UEVENT)
+            sock.bind((0, 1)) # group 1: kernel uevents
+            return sock
+        except Exception as exc:
+            prt(f'WARN: no uevent socket: {exc}')
+            return None
+
+    def _attr(self, supply, name, once=False):
+        """ Read one attribute via a persistent fd (unless 'once');
+        None if absent """
+        path = os.path.join(self.root, supply, name)
+        if once:
+            try:
+                with open(path, 'r', encoding='utf-8') as handle:
+                    return handle.read().strip()
+            except OSError:
+                return None
+        try:
+            fd = self.fds.get(path, None)
+            if fd is None:
+                fd = self.fds[path] = os.open(path, os.O_RDONLY)
+            return os.pread(fd, 64, 0).decode('utf-8', 'replace').strip()
+        except OSError:
+            fd = self.fds.pop(path, None)
+            if fd is not None:
+                os.close(fd)
+            return None
+
+    def scan(self):
+        """ (Re)discover the supplies (e.g., after a power_supply add/remove) """
+        for fd in self.fds.values():
+            os.close(fd)
+        self.fds, self.mains, self.batteries = {}, [], []
+        try:
+            supplies = sorted(os.listdir(self.root))
+        except OSError:
+            supplies = []
+        for supply in supplies:
+            kind = self._attr(supply, 'type', once=True)
+            if kind == 'Battery':
+                if (self._attr(supply, 'scope', once=True) != 'Device'
+                        and self._attr(supply, 'present', once=True) in (None, '1')):
+                    self.batteries.append(supply)
+            elif kind in ('Mains', 'USB'):
+                self.mains.append(supply)
+
+    def _percent(self, supply):
+        capacity = self._attr(supply, 'capacity')
+        if capacity is not None:
+            return float(capacity)
+        for now, full in (('energy_now', 'energy_full'), ('charge_now', 'charge_full')):
+            now_val, full_val = self._attr(supply, now), self._attr(supply, full)
+            if now_val and full_val and int(full_val) > 0:
+                return min(100.0, 100.0 * int(now_val) / int(full_val))
+        return 100.0
+
+    @pyqtSlot()
+    def read(self):
+        """ Re-read the attributes; returns True (and calls on_change) if
+        the state changed. """
+        try:
+            present = bool(self.batteries)
+            percent, plugged = 100.0, True
+            if present:
+                percent = round(sum(self._percent(bat) for bat in self.batteries)
+                                / len(self.batteries), 1)
+                if self.mains:
+                    plugged = any(self._attr(ac, 'online') == '1' for ac in self.mains)
+                else:
+                    plugged = any(self._attr(bat, 'status') != 'Discharging'
+                                  for bat in self.batteries)
+        except Exception as exc:
+            prt(f'WARN: battery read failed: {exc}')
+            return False
+        state = (present, plugged, percent)
+        if state == (self.present, self.plugged, self.percent):
+            return False
+        self.present, self.plugged, self.percent = state
+        self._arm_slow_poll()
+        if self.on_change:
+            self.on_change()
+        return True
+
+    def _arm_slow_poll(self):
+        timer = getattr(self, 'timer', None)
+        if not timer:
+            return
+        if self.present and not self.plugged and not self.upower:
+            if not timer.isActive():
+                timer.start(self.slow_poll_s * 1000)
+        else:
+            timer.stop()
+
+    def _on_uevent(self, _fd=None):
+        relevant, rescan = False, False
+        while True:
+            try:
+                data = self.sock.recv(8192)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as exc:
+                prt(f'WARN: uevent socket: {exc}')
+                break
+            if not data:
+                break
+            if b'SUBSYSTEM=power_supply' in data:
+                relevant = True
+                rescan = rescan or data.startswith((b'add@', b'remove@'))
+        if rescan:
+            self.scan()
+        if relevant:
+            self.read()
+
+    @pyqtSlot(QDBusMessage)
+    def _on_upower(self, _msg):
+        self.read()
+
+    @pyqtSlot(QDBusMessage)
+    def _on_owner_changed(self, msg):
+        args = msg.arguments()
+        if len(args) >= 3 and args[0] == UPOWER:
+            self._set_upower(bool(args[2]))
+
+    def _set_upower(self, running):
+        if running != self.upower:
+            self.upower = running
+            prt(f'battery: upower={running}')
+            self._arm_slow_poll()
+            if running:
+                self.read() # catch up on what it may have signalled
+
+    def close(self):
+        """ Release the fds and socket """
+        if self.notifier:
+            self.notifier.setEnabled(False)
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+        for fd in self.fds.values():
+            os.close(fd)
+        self.fds = {}
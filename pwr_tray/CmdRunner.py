@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Runs the DE commands (locker, suspend, monitors_off, ...) without blocking
+the Qt event loop.
+
+Each command runs as a child (in its own session so a timeout can kill the
+whole pipeline) waited upon by a short-lived worker thread; completion comes
+back to the Qt thread as a queued signal, which records the latency per
+command key and calls the optional on_done(job) callback.  Rules:
+ - a key is never run twice at once (e.g., a second 'locker' is dropped)
+ - only one of suspend/poweroff/reboot is in flight at a time
+ - per-key timeouts; 0 means never killed (the locker must survive)
+Children are not killed when the applet exits or restarts.
+
+Commands are compiled once into plans (see compile_plans()): those that
+need no shell become argv lists with the executable resolved to an absolute
+path, so they run with a single fork/exec instead of via /bin/sh.  Structured
+D-Bus entries become plans with a 'dbus' call (made in-process by the caller)
+and a qdbus command as the fallback (see compile_dbus_plan()).
+"""
+# pylint: disable=invalid-name,broad-exception-caught
+import os
+import time
+import shlex
+import shutil
+import signal
+import threading
+import subprocess
+from types import SimpleNamespace
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+from pwr_tray.Utils import prt
+from pwr_tray.TickStats import note_spawn
+
+
+class CmdRunner(QObject):
+    """ Asynchronous command runner; see run() """
+    finished = pyqtSignal(object)
+
+    default_timeout_s = 30
+    timeouts_s = {'locker': 0, 'edit_config': 0, 'restart_wm': 0,
+                  'reset_idle': 5, 'monitors_off': 10, 'monitors_on': 10,
+                  'dimmer': 10, 'undim': 10, 'reload_wm': 20,
+                  'suspend': 60, 'poweroff': 60, 'reboot': 60}
+    exclusive = ('suspend', 'poweroff', 'reboot')
+    slow_s = 1.0 # completions slower than this are flagged in the log
+
+    def __init__(self):
+        super().__init__()
+        self.running = {} # key -> job
+        self.stats = {}   # key -> SimpleNamespace(count, fails, last_s, max_s, total_s)
+        self.finished.connect(self._on_finished)
+
+    def busy(self, key):
+        """ Is a command for 'key' in flight? """
+        return key in self.running
+
+    def run(self, key, command, on_done=None, settle_s=None, timeout_s=None):
+        """ Start 'command' (a plan, a string, or an argv list) for 'key'.
+         - on_done(job) is called once when it ends or, if 'settle_s' is given
+           and it is still running then (e.g., a locker that does not fork),
+           after 'settle_s' with job.running True.
+         - job has: key, command, rc (None if not started or killed),
+           timed_out, elapsed_s, running.
+        Returns the job, or None if not started per the rules. """
+        if not command:
+            return None
+        if key in self.running:
+            prt(f'NOTE: {key!r} still running; not repeated')
+            return None
+        if key in self.exclusive:
+            busy = [other for other in self.exclusive if other in self.running]
+            if busy:
+                prt(f'NOTE: {key!r} refused; {busy[0]!r} in progress')
+                return None
+        if timeout_s is None:
+            timeout_s = self.timeouts_s.get(key, self.default_timeout_s)
+        text = command.text if isinstance(command, SimpleNamespace) else command
+        job = SimpleNamespace(key=key, command=command, on_done=on_done,
+                rc=None, timed_out=False, elapsed_s=0.0, running=True,
+                began_mono=time.monotonic(), notified=False)
+        self.running[key] = job
+        prt(f'+ {text}')
+        note_spawn()
+        threading.Thread(target=self._wait, args=(job, timeout_s),
+                         name=f'cmd-{key}', daemon=True).start()
+        if on_done and settle_s is not None:
+            QTimer.singleShot(int(settle_s*1000), lambda: self._notify(job))
+        return job
+
+    @staticmethod
+    def _argv(command):
+        """ (args, shell) for Popen """
+        if isinstance(command, (list, tuple)):
+            return list(command), False
+        if isinstance(command, SimpleNamespace): # a plan
+            return (command.argv, False) if command.argv else (command.text, True)
+        plan = compile_plan(command)
+        return (plan.argv, False) if plan.argv else (plan.text, True)
+
+    def _wait(self, job, timeout_s):
+        """ Worker thread: run the child to completion (or timeout) """
+        args, shell = self._argv(job.command)
+        try:
+            proc = subprocess.Popen(args, shell=shell, stdin=subprocess.DEVNULL,
+                                    start_new_session=True)
+            try:
+                job.rc = proc.wait(timeout=timeout_s if timeout_s > 0 else None)
+            except subprocess.TimeoutExpired:
+                job.timed_out = True
+                try:
+                    os.killpg(proc.pid, signal.SIGKILL)
+                except OSError:
+                    pass
+                proc.wait()
+        except Exception as exc:
+            job.error = str(exc)
+        job.elapsed_s = time.monotonic() - job.began_mono
+        self.finished.emit(job)
+
+    def _on_finished(self, job):
+        """ Qt thread: account for the completed job """
+        job.running = False
+        if self.running.get(job.key, None) is job:
+            del self.running[job.key]
+        stat = self.stats.get(job.key, None)
+        if not stat:
+            stat = self.stats[job.key] = SimpleNamespace(
+                    count=0, fails=0, last_s=0.0, max_s=0.0, total_s=0.0)
+        stat.count += 1
+        stat.last_s = job.elapsed_s
+        stat.max_s = max(stat.max_s, job.elapsed_s)
+        stat.total_s += job.elapsed_s
+        failed = job.rc != 0
+        stat.fails += 1 if failed else 0
+
+        msg = f'{job.key}: {job.elapsed_s*1000:.0f}ms'
+        if job.timed_out:
+            prt(f'WARN: {msg} timed out; killed')
+        elif job.rc is None:
+            prt(f'WARN: {msg} not started: {getattr(job, "error", "?")}')
+        elif failed:
+            prt(f'   NOTE: {msg} returncode={job.rc}')
+        elif job.elapsed_s >= self.slow_s:
+            prt(f'   NOTE: {msg} (slow)')
+        else:
+            prt(f'   {msg}')
+        self._notify(job)
+
+    @staticmethod
+    def _notify(job):
+        if job.on_done and not job.notified:
+            job.notified = True
+            try:
+                job.on_done(job)
+            except Exception as exc:
+                prt(f'WARN: {job.key} on_done failed: {exc}')
+
+
+SHELL_CHARS = set('|&;<>()$`*?[{!#\\\n')
+
+
+def needs_shell(text):
+    """ Does 'text' use shell syntax (pipes, lists such as '&&' or ';',
+    redirection, variables, globs, ...) outside of quotes? """
+    quote = ''
+    for char in text:
+        if quote:
+            if char == quote:
+                quote = ''
+            elif quote == '"' and char in '$`\\':
+                return True
+        elif char in '\'"':
+            quote = char
+        elif char in SHELL_CHARS:
+            return True
+    words = text.split()
+    return bool(quote) or not words or '=' in words[0]
+
+
+def compile_plan(text):
+    """ Compile a command string into a plan with attributes:
+     - text: the command
+     - argv: absolute-path argv list, or None to run 'text' via /bin/sh """
+    argv = None
+    if not needs_shell(text):
+        try:
+            argv = [os.path.expanduser(word) if word.startswith('~') else word
+                    for word in shlex.split(text)]
+            argv[0] = shutil.which(argv[0]) or argv[0]
+        except ValueError:
+            argv = None
+    return SimpleNamespace(text=text, argv=argv, dbus=None)
+
+
+DBUS_KEYS = ('service', 'path', 'interface', 'method')
+
+
+def compile_dbus_plan(entry, qdbus=None):
+    """ Compile a structured D-Bus entry, e.g.,
+        {service: org.kde.Shutdown, path: /Shutdown,
+         interface: org.kde.Shutdown, method: logout}
+    with optional 'args' (a list) and 'bus' (session or system), into a plan
+    whose 'dbus' is the normalized call; its text/argv run the same call
+    with 'qdbus' (the qdbus/qdbus6 name, if any) as the fallback. """
+    missing = [name for name in DBUS_KEYS if not entry.get(name, None)]
+    assert not missing, f'D-Bus entry {dict(entry)} lacks {missing}'
+    call = {name: str(entry[name]) for name in DBUS_KEYS}
+    call['args'] = list(entry.get('args', None) or [])
+    call['bus'] = str(entry.get('bus', 'session'))
+    assert call['bus'] in ('session', 'system'), f'D-Bus bus {call["bus"]!r} unknown'
+    plan = SimpleNamespace(text='', argv=None, dbus=call)
+    if qdbus:
+        words = ([qdbus] + (['--system'] if call['bus'] == 'system' else [])
+                 + [call['service'], call['path'], f'{call["interface"]}.{call["method"]}']
+                 + [str(arg).lower() if isinstance(arg, bool) else str(arg)
+                    for arg in call['args']])
+        plan.text = shlex.join(words)
+        plan.argv = compile_plan(plan.text).argv
+    return plan
+
+
+def compile_plans(variables, skip=('wallpaper',), qdbus=None):
+    """ Plans for each non-empty command string or D-Bus entry in 'variables' """
+    plans = {key: compile_plan(val.strip()) for key, val in variables.items()
+             if key not in skip and isinstance(val, str) and val.strip()}
+    plans.update({key: compile_dbus_plan(val, qdbus) for key, val in variables.items()
+                  if key not in skip and isinstance(val, dict)})
+    shelled = sorted(key for key, plan in plans.items() if not plan.argv and not plan.dbus)
+    dbus = sorted(key for key, plan in plans.items() if plan.dbus)
+    prt(f'command plans: {len(plans)-len(shelled)-len(dbus)} direct;',
+        f'via shell: {shelled}' + (f'; via D-Bus: {dbus}' if dbus else ''))
+    return plans
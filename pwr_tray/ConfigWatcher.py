@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Watches the files in ~/.config/pwr-tray/ (config.ini, my-commands.yaml,
+picks.json) so nothing needs to stat them on every tick.
+
+QFileSystemWatcher (inotify underneath) watches the folder itself, which
+catches editors that save by writing a temp file and renaming it over the
+original (a file watch alone is dropped on rename), plus each file for
+in-place writes.  Bursts of events are debounced; then only the files whose
+(mtime, size, inode) stamp actually changed are reported.
+"""
+# pylint: disable=invalid-name
+import os
+from PyQt5.QtCore import QObject, QFileSystemWatcher, QTimer
+
+
+class ConfigWatcher(QObject):
+    """ Calls on_change(names) with the set of changed file basenames """
+    def __init__(self, folder, names, on_change, debounce_ms=300):
+        super().__init__()
+        self.folder = folder
+        self.names = list(names)
+        self.on_change = on_change
+        self.stamps = {name: self._stamp(name) for name in self.names}
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(debounce_ms)
+        self.timer.timeout.connect(self._on_settled)
+        self.watcher = QFileSystemWatcher()
+        self.watcher.addPath(folder)
+        self._watch_files()
+        self.watcher.directoryChanged.connect(self._on_event)
+        self.watcher.fileChanged.connect(self._on_event)
+
+    def _path(self, name):
+        return os.path.join(self.folder, name)
+
+    def _stamp(self, name):
+        try:
+            stat = os.stat(self._path(name))
+            return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        except OSError:
+            return None
+
+    def _watch_files(self):
+        """ (Re-)add file watches; those replaced by rename are dropped """
+        watched = set(self.watcher.files())
+        for name in self.names:
+            path = self._path(name)
+            if path not in watched and os.path.exists(path):
+                self.watcher.addPath(path)
+
+    def _on_event(self, _path):
+        self.timer.start() # (re)start the debounce period
+
+    def _on_settled(self):
+        self._watch_files()
+        changed = set()
+        for name in self.names:
+            stamp = self._stamp(name)
+            if stamp != self.stamps[name]:
+                self.stamps[name] = stamp
+                changed.add(name)
+        if changed:
+            self.on_change(changed)
+
+    def note_written(self, name):
+        """ Forget a change we made ourselves (e.g., saving picks) """
+        self.stamps[name] = self._stamp(name)
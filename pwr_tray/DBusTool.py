@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Small helpers over QtDBus (which ships with PyQt5) so that pwr-tray can talk
+to logind and friends in-process rather than forking command line clients.
+PyQt5 converts replies to python types (structs -> tuples, arrays -> lists,
+a{sv} -> dicts, variants unwrapped), so callers get plain values back.
+"""
+# pylint: disable=invalid-name,broad-exception-caught
+from PyQt5.QtCore import QObject, pyqtSlot
+from PyQt5.QtDBus import QDBus, QDBusConnection, QDBusMessage, QDBusError
+from pwr_tray.Utils import prt
+
+PROPS_IFACE = 'org.freedesktop.DBus.Properties'
+BUS_NAME = ('org.freedesktop.DBus', '/org/freedesktop/DBus',
+            'org.freedesktop.DBus')
+LOGIN1 = ('org.freedesktop.login1', '/org/freedesktop/login1',
+          'org.freedesktop.login1.Manager')
+
+
+def system_bus():
+    """ The shared system bus connection (may be disconnected) """
+    return QDBusConnection.systemBus()
+
+
+def session_bus():
+    """ The shared session bus connection (may be disconnected) """
+    return QDBusConnection.sessionBus()
+
+
+def call(bus, service, path, interface, method, *args, timeout_ms=2000):
+    """ Make a blocking method call.  Returns the list of reply arguments,
+    or None on any error (which is logged). """
+    try:
+        if not bus.isConnected():
+            return None
+        msg = QDBusMessage.createMethodCall(service, path, interface, method)
+        if args:
+            msg.setArguments(list(args))
+        reply = bus.call(msg, QDBus.Block, timeout_ms)
+        if reply.type() == QDBusMessage.ErrorMessage:
+            prt(f'WARN: dbus {interface}.{method}: {reply.errorMessage()}')
+            return None
+        return reply.arguments()
+    except Exception as exc:
+        prt(f'WARN: dbus {interface}.{method}: {exc}')
+        return None
+
+
+class _Reply(QObject):
+    """ Adapts python callables to callWithCallback() which wants slots;
+    instances are held in 'pending' until the reply or error arrives. """
+    pending = set()
+
+    def __init__(self, on_reply, on_error):
+        super().__init__()
+        self.on_reply, self.on_error = on_reply, on_error
+        _Reply.pending.add(self)
+
+    @pyqtSlot(QDBusMessage)
+    def reply(self, msg):
+        _Reply.pending.discard(self)
+        self.on_reply(msg.arguments())
+
+    @pyqtSlot(QDBusError, QDBusMessage)
+    def error(self, err, _msg):
+        _Reply.pending.discard(self)
+        if self.on_error:
+            self.on_error(err.message())
+
+
+def async_call(bus, service, path, interface, method, *args,
+               on_reply, on_error=None, timeout_ms=2000):
+    """ Make a non-blocking method call; on_reply(arguments) or
+    on_error(message) runs later from the event loop.  Returns True if sent. """
+    try:
+        if not bus.isConnected():
+            return False
+        msg = QDBusMessage.createMethodCall(service, path, interface, method)
+        if args:
+            msg.setArguments(list(args))
+        rx = _Reply(on_reply, on_error)
+        if not bus.callWithCallback(msg, rx.reply, rx.error, timeout_ms):
+            _Reply.pending.discard(rx)
+            return False
+        return True
+    except Exception as exc:
+        prt(f'WARN: dbus {interface}.{method}: {exc}')
+        return False
+
+
+def get_property(bus, service, path, interface, name, timeout_ms=2000):
+    """ Fetch one property; returns None on error. """
+    rv = call(bus, service, path, PROPS_IFACE, 'Get', interface, name,
+              timeout_ms=timeout_ms)
+    return rv[0] if rv else None
+
+
+def get_property_async(bus, service, path, interface, name, on_value,
+                       timeout_ms=2000):
+    """ Fetch one property without blocking; on_value(value) runs later. """
+    return async_call(bus, service, path, PROPS_IFACE, 'Get', interface, name,
+                      on_reply=lambda args: on_value(args[0] if args else None),
+                      timeout_ms=timeout_ms)
+
+
+def subscribe(bus, service, path, interface, name, slot):
+    """ Connect a pyqtSlot(QDBusMessage) to a signal; returns True if OK. """
+    try:
+        return bool(bus.isConnected()
+                    and bus.connect(service, path, interface, name, slot))
+    except Exception as exc:
+        prt(f'WARN: dbus subscribe {interface}.{name}: {exc}')
+        return False
+
+
+def call_entry(call, on_reply=None, on_error=None, timeout_ms=5000):
+    """ Make the call of a structured commands.yaml entry (see
+    CmdRunner.compile_dbus_plan()) without blocking; ints go as int32,
+    strings as strings, and booleans as booleans.  Returns True if sent. """
+    bus = system_bus() if call['bus'] == 'system' else session_bus()
+    return async_call(bus, call['service'], call['path'], call['interface'],
+                      call['method'], *call['args'], timeout_ms=timeout_ms,
+                      on_reply=on_reply if on_reply else lambda _: None,
+                      on_error=on_error)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cache of the resolved DE commands so that a normal start-up need not
+import ruamel.yaml, parse the YAML, detect the DE, expand the variables,
+find qdbus, check the must_haves on $PATH, or compile the command plans.
+
+The cache is one small JSON file keyed by a hash of everything those steps
+depend upon: the YAML text, $PATH, the XDG/desktop environment variables,
+and any --de override.  A plan whose resolved executable has vanished, or
+a must_have no longer on $PATH, also invalidates it (so the full
+resolution runs and reports it).
+"""
+# pylint: disable=invalid-name,broad-exception-caught
+import os
+import json
+import shutil
+import hashlib
+from types import SimpleNamespace
+
+VERSION = 3 # bump when the cached layout or the resolution logic changes
+ENV_VARS = ('PATH', 'XDG_CURRENT_DESKTOP', 'XDG_SESSION_DESKTOP',
+            'DESKTOP_SESSION', 'XDG_SESSION_TYPE', 'HOME')
+
+
+def cache_key(yaml_bytes, force_de=None):
+    """ Hash of the inputs of the DE resolution """
+    digest = hashlib.sha256(yaml_bytes)
+    for var in ENV_VARS:
+        digest.update(f'\0{var}={os.environ.get(var, "")}'.encode('utf-8'))
+    digest.update(f'\0{force_de}\0{VERSION}'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def load(path, key):
+    """ Returns (de_config, variables, plans) if cached for 'key', else None """
+    try:
+        with open(path, 'r', encoding='utf-8') as handle:
+            data = json.load(handle)
+        if data.get('key') != key:
+            return None
+        plans = {name: SimpleNamespace(text=text, argv=argv, dbus=dbus)
+                 for name, (text, argv, dbus) in data['plans'].items()}
+        for plan in plans.values():
+            if plan.argv and os.path.isabs(plan.argv[0]) and not os.path.exists(plan.argv[0]):
+                return None
+        if any(shutil.which(cmd) is None for cmd in data['de_config'].get('must_haves', [])):
+            return None
+        return data['de_config'], data['variables'], plans
+    except Exception:
+        return None
+
+
+def save(path, key, de_config, variables, plans):
+    """ Store the resolution (atomically); failures only cost a re-parse """
+    data = {'key': key, 'de_config': de_config, 'variables': variables,
+            'plans': {name: [plan.text, plan.argv, plan.dbus] for name, plan in plans.items()}}
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as handle:
+            json.dump(data, handle, separators=(',', ':'))
+        os.replace(tmp_path, path)
+    except Exception:
+        pass
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tray icons rasterised once and kept on disk, so that later starts load a
+few small PNGs instead of parsing SVGs (and the tray host need not
+re-render an SVG at each size).
+
+Each icon is rendered at the usual tray sizes (scaled for the screen) and
+stored as '<svg-hash>-<size>.png' in the cache folder; an edited or
+different SVG has a new hash, so stale files are simply not used.  Badged
+variants (e.g., the minutes until the screen locks) are painted from the
+same pixmaps and kept in a small LRU.
+"""
+# pylint: disable=invalid-name,broad-exception-caught
+import os
+import hashlib
+from collections import OrderedDict
+from PyQt5.QtGui import QIcon, QPixmap, QPainter, QFont, QColor
+from PyQt5.QtCore import Qt, QRectF
+from pwr_tray.Utils import prt
+
+
+class IconCache:
+    """ The icons of one icon set, by state number.
+     - icon(num, badge=None) returns the QIcon, badged if 'badge' """
+    sizes = (16, 22, 24, 32, 48, 64) # logical pixels
+    lru_max = 24 # badged variants kept
+
+    def __init__(self, cache_dir, scale=1.0):
+        self.cache_dir = cache_dir
+        self.pixel_sizes = sorted({max(8, round(size * scale)) for size in self.sizes})
+        self.pixmaps, self.icons = [], [] # per state number
+        self.badged = OrderedDict() # (num, badge) -> QIcon
+        self.rendered, self.loaded = 0, 0
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+        except OSError as exc:
+            prt(f'WARN: icon cache {cache_dir!r}: {exc}')
+
+    def load(self, svg_paths):
+        """ (Re)load the icons from 'svg_paths' (one per state number) """
+        self.pixmaps, self.icons = [], []
+        self.badged.clear()
+        self.rendered, self.loaded = 0, 0
+        for path in svg_paths:
+            pixmaps = self._pixmaps(path)
+            icon = QIcon()
+            for pixmap in pixmaps:
+                icon.addPixmap(pixmap)
+            self.pixmaps.append(pixmaps)
+            self.icons.append(icon)
+        prt(f'icons: {len(self.icons)} x {len(self.pixel_sizes)} sizes;'
+            f' {self.loaded} cached, {self.rendered} rendered')
+        return self.icons
+
+    def _pixmaps(self, path):
+        """ The pixmaps of one SVG at each size, from the cache if there """
+        try:
+            with open(path, 'rb') as handle:
+                digest = hashlib.sha1(handle.read()).hexdigest()[:16]
+        except OSError as exc:
+            prt(f'WARN: cannot read icon {path!r}: {exc}')
+            return []
+        source, pixmaps = None, []
+        for size in self.pixel_sizes:
+            png_path = os.path.join(self.cache_dir, f'{digest}-{size}.png')
+            pixmap = QPixmap(png_path) if os.path.exists(png_path) else QPixmap()
+            if not pixmap.isNull():
+                self.loaded += 1
+            else:
+                if source is None:
+                    source = QIcon(path)
+                pixmap = source.pixmap(size, size)
+                self.rendered += 1
+                tmp_path = f'{png_path}.tmp'
+                if pixmap.save(tmp_path, 'PNG'):
+                    os.replace(tmp_path, png_path)
+            pixmaps.append(pixmap)
+        return pixmaps
+
+    def icon(self, num, badge=None):
+        """ The icon for state 'num', with 'badge' (short text) if given """
+        if not badge:
+            return self.icons[num]
+        key = (num, badge)
+        icon = self.badged.get(key, None)
+        if icon is not None:
+            self.badged.move_to_end(key)
+            return icon
+        icon = QIcon()
+        for pixmap in self.pixmaps[num]:
+            icon.addPixmap(self.paint_badge(pixmap, badge))
+        self.badged[key] = icon
+        if len(self.badged) > self.lru_max:
+            self.badged.popitem(last=False)
+        return icon
+
+    @staticmethod
+    def paint_badge(pixmap, badge):
+        """ A copy of 'pixmap' with 'badge' in its lower right corner """
+        rv = QPixmap(pixmap)
+        size = rv.width()
+        font = QFont()
+        font.setBold(True)
+        font.setPixelSize(max(6, int(size * 0.5)))
+        painter = QPainter(rv)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setFont(font)
+        width = painter.fontMetrics().horizontalAdvance(badge) + size * 0.12
+        height = size * 0.55
+        rect = QRectF(size - width, size - height, width, height)
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(QColor(0, 0, 0, 200))
+        painter.drawRoundedRect(rect, size * 0.12, size * 0.12)
+        painter.setPen(QColor(255, 255, 255))
+        painter.drawText(rect, Qt.AlignCenter, badge)
+        painter.end()
+        return rv
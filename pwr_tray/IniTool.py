@@ -11,6 +11,7 @@ TBD
 # pylint: disable=
 
 import os
+import re
 import configparser
 from types import SimpleNamespace
 import copy
@@ -29,6 +30,12 @@ class IniTool:
                 'sleep_min_list': '[5, 30]',
                 'lo_battery_pct': 10,
                 'gui_editor': 'geany',
+                'log_gens': 1,
+                'log_gzip': False,
+                'icon_set': 'Default',
+                'icon_countdown': False,
+                'fullscreen_presentation': False,
+                'config_version': 2,
             #   'dim_pct_brightness': 100,
             #   'dim_pct_lock_min': 100,
 
@@ -40,7 +47,7 @@ class IniTool:
             #   'dim_pct_lock_min': 70,
 
             }, 'LoBattery': {
-                'power_down': True,
+                'power_down': False,
                 'lock_min_list': '[1]',
                 'sleep_min_list': '[1]',
             #   'dim_pct_brightness': 50,
@@ -51,9 +58,14 @@ class IniTool:
         self.ini_path =  os.path.join(self.folder, "config.ini")
         self.log_path =  os.path.join(self.folder, "debug.log")
         self.picks_path =  os.path.join(self.folder, "picks.json")
+        self.stats_path =  os.path.join(self.folder, "stats.json")
+        self.cache_path = os.path.join(os.environ.get('XDG_CACHE_HOME', '')
+                or os.path.expanduser('~/.cache'), 'pwr-tray', 'de-config.json')
+        self.icon_cache_dir = os.path.join(os.path.dirname(self.cache_path), 'icons')
         self.config = configparser.ConfigParser()
         self.last_mod_time = None
         self.section_params = {'Settings': {}, 'HiBattery': {}, 'LoBattery': {}, }
+        self.section_raws = {} # selector -> raw dict last parsed
         self.params_by_selector = {}
         if not paths_only:
             self.ensure_ini_file()
@@ -93,9 +105,83 @@ class IniTool:
             self.config.read_dict(self.defaults)
             with open(self.ini_path, 'w', encoding='utf-8') as configfile:
                 self.config.write(configfile)
+        else:
+            self.migrate_ini_file()
+
+    def migrate_ini_file(self):
+        """ Bring a config.ini written by an earlier version up to date (in
+        place, keeping comments and order):
+         - v2: power_down is honored; earlier versions ignored it but wrote
+           'power_down = True' under [LoBattery], so that becomes False
+           (keeping the suspend those laptops always did). """
+        try:
+            with open(self.ini_path, 'r', encoding='utf-8') as handle:
+                lines = handle.read().splitlines(keepends=True)
+        except Exception as exc:
+            prt(f'WARN: cannot read {self.ini_path!r}: {exc}')
+            return
+        section, version, settings_at = None, 1, None
+        for idx, line in enumerate(lines):
+            header = re.match(r'\s*\[([^\]]+)\]', line)
+            if header:
+                section = header.group(1).strip()
+                if section == 'Settings':
+                    settings_at = idx
+                continue
+            match = re.match(r'\s*config_version\s*[=:]\s*(\d+)', line)
+            if match and section == 'Settings':
+                version = int(match.group(1))
+        if version >= 2:
+            return
+        section = None
+        for idx, line in enumerate(lines):
+            header = re.match(r'\s*\[([^\]]+)\]', line)
+            if header:
+                section = header.group(1).strip()
+            elif (section == 'LoBattery'
+                    and re.match(r'\s*power_down\s*[=:]\s*true\s*$', line, re.IGNORECASE)):
+                lines[idx] = 'power_down = False\n'
+                prt('NOTE: config.ini: [LoBattery] power_down = True became False'
+                    ' (it was never honored; set it again to power off on low battery)')
+        if settings_at is None:
+            lines[:0] = ['[Settings]\n', 'config_version = 2\n', '\n']
+        else:
+            lines.insert(settings_at + 1, 'config_version = 2\n')
+        try:
+            tmp_path = f'{self.ini_path}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as handle:
+                handle.writelines(lines)
+            os.replace(tmp_path, self.ini_path)
+        except Exception as exc:
+            prt(f'WARN: cannot update {self.ini_path!r}: {exc}')
 
     def update_config(self):
-        """ Check if the file has been modified since the last read """
+        """ Re-read config.ini if modified since the last read; only the
+        sections whose contents changed are re-parsed.  Returns True if
+        any section was (re-)parsed. """
+        current_mod_time = os.path.getmtime(self.ini_path)
+        if current_mod_time == self.last_mod_time:
+            return False # not updated
+        # Re-read the configuration file (fresh, so removed keys vanish)
+        self.config = configparser.ConfigParser()
+        self.config.read(self.ini_path)
+        self.last_mod_time = current_mod_time
+
+        updated = False
+        for selector in self.get_selectors():
+            raws = dict(self.config[selector]) if selector in self.config else None
+            if (selector in self.params_by_selector
+                    and raws == self.section_raws.get(selector, None)):
+                continue # section unchanged
+            prt(f'parsing config.ini [{selector}]...')
+            self.params_by_selector[selector] = self.parse_section(selector, raws)
+            self.section_raws[selector] = raws
+            updated = True
+        return updated
+
+    def parse_section(self, selector, candidates):
+        """ Parse the raw key/values of one section (None if absent) into
+        a namespace; missing/invalid values get the defaults. """
         def to_array(val_str):
             # Expecting string of form: "[1,2,...]" or just "20"
             try:
@@ -116,76 +202,55 @@ class IniTool:
                 rvs.append(vals[0])
             return rvs
 
-        current_mod_time = os.path.getmtime(self.ini_path)
-        if current_mod_time == self.last_mod_time:
-            return False # not updated
-        # Re-read the configuration file if it has changed
-        self.config.read(self.ini_path)
-        self.last_mod_time = current_mod_time
-
         goldens = self.defaults['Settings']
-        running = goldens
-        all_params = {}
+        params = copy.deepcopy(goldens)
+        if candidates is None:
+            return SimpleNamespace(**params)
 
-        # Access the configuration values in order
-        prt('parsing config.ini...')
-        for selector in self.get_selectors():
-            all_params[selector] = params = copy.deepcopy(running)
-            if selector not in self.config:
-                all_params[selector] = SimpleNamespace(**params)
+        # iterate the candidates
+        for key, value in candidates.items():
+            if key not in goldens:
+                prt(f'skip {selector}.{key}: {value!r} [unknown key]')
                 continue
 
-            # iterate the candidates
-            candidates = dict(self.config[selector])
-            for key, value in candidates.items():
-                if key not in goldens:
-                    prt(f'skip {selector}.{key}: {value!r} [unknown key]')
-                    continue
+            if key.endswith('_list'):
+                list_value = to_array(value)
+                if not value:
+                    params[key] = self.the_default(selector, key)
+                    prt(f'skip {selector}.{key}: {value!r} [bad list spec]')
+                else:
+                    params[key] = list_value
+                continue
 
-                if key.endswith('_list'):
-                    list_value = to_array(value)
-                    if not value:
-                        params[key] = self.the_default(selector, key)
-                        prt(f'skip {selector}.{key}: {value!r} [bad list spec]')
-                    else:
-                        params[key] = list_value
-                    continue
+            if isinstance(goldens[key], bool):
+                if isinstance(value, str):
+                    if value.lower() == 'true':
+                        value = True
+                    elif value.lower() == 'false':
+                        value = False
+                if isinstance(value, bool):
+                    params[key] = value
+                else:
+                    params[key] = self.the_default(selector, key)
+                    prt(f'skip {selector}.{key}: {value!r} [expecting bool]')
+                continue
 
-                if isinstance(goldens[key], bool):
-                    if isinstance(value, str):
-                        if value.lower() == 'true':
-                            value = True
-                        elif value.lower() == 'false':
-                            value = False
-                    if isinstance(value, bool):
-                        params[key] = value
-                    else:
-                        params[key] = self.the_default(selector, key)
-                        prt(f'skip {selector}.{key}: {value!r} [expecting bool]')
+            if isinstance(goldens[key], int):
+                try:
+                    params[key] = int(value)
                     continue
-
-                if isinstance(goldens[key], int):
-                    try:
-                        params[key] = int(value)
-                        continue
-                    except Exception:
-                        params[key] = self.the_default(selector, key)
-                        prt(f'skip {selector}.{key}: {value!r} [expecting int repr]')
-                        continue
-
-                if isinstance(goldens[key], str):
-                    if isinstance(value, str):
-                        params[key] = value
-                    else:
-                        params[key] = self.the_default(selector, key)
-                        prt(f'skip {selector}.{key}: {value!r} [expecting string]')
+                except Exception:
+                    params[key] = self.the_default(selector, key)
+                    prt(f'skip {selector}.{key}: {value!r} [expecting int repr]')
                     continue
 
-                assert False, f'unhandled goldens[{key}]: {value!r}'
-            all_params[selector] = SimpleNamespace(**params)
-
-        self.params_by_selector = all_params
-
-        prt('DONE parsing config.ini...')
+            if isinstance(goldens[key], str):
+                if isinstance(value, str):
+                    params[key] = value
+                else:
+                    params[key] = self.the_default(selector, key)
+                    prt(f'skip {selector}.{key}: {value!r} [expecting string]')
+                continue
 
-        return True # updated
+            assert False, f'unhandled goldens[{key}]: {value!r}'
+        return SimpleNamespace(**params)
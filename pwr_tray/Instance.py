@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Single-instance handling, replacing the old 'ps'/kill/sleep loop.
+
+The running applet holds an flock() on 'instance.lock' in the config folder
+(which also records its pid) and serves a small control socket in the
+abstract namespace (keyed by uid and config folder; peers of another uid
+are refused).  A new instance that finds the lock held asks the old one to
+'quit' over the socket and waits on its pidfd for exactly as long as it
+takes; if the old one does not answer, it is sent SIGTERM (then SIGKILL).
+
+Scanning /proc for pwr-tray interpreters is only a fallback for stale
+instances that predate the lock (the first start after an upgrade) or
+whose lock holder cannot be identified.
+"""
+# pylint: disable=invalid-name,broad-exception-caught,consider-using-with
+import os
+import time
+import fcntl
+import errno
+import select
+import signal
+import socket
+import struct
+import hashlib
+from PyQt5.QtCore import QObject, QSocketNotifier
+from pwr_tray.Utils import prt
+
+
+def socket_name(folder):
+    """ Abstract socket address for the applet using 'folder' """
+    digest = hashlib.sha1(os.path.abspath(folder).encode('utf-8')).hexdigest()[:16]
+    return f'\0pwr-tray-{os.getuid()}-{digest}'
+
+
+def request(folder, command, timeout_s=1.0):
+    """ Send 'command' to the running applet; returns its reply or None """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout_s)
+            sock.connect(socket_name(folder))
+            sock.sendall(f'{command}\n'.encode('utf-8'))
+            return sock.recv(4096).decode('utf-8', 'replace').strip()
+    except OSError:
+        return None
+
+
+def wait_pid(pid, timeout_s):
+    """ Wait until 'pid' exits (via its pidfd if possible); returns True
+    if it is gone. """
+    try:
+        pidfd = os.pidfd_open(pid)
+    except AttributeError: # python < 3.9: poll
+        deadline = time.monotonic() + timeout_s
+        while time.monotonic() < deadline:
+            if not pid_alive(pid):
+                return True
+            time.sleep(0.05)
+        return not pid_alive(pid)
+    except OSError as exc:
+        return exc.errno == errno.ESRCH
+    try:
+        poller = select.poll()
+        poller.register(pidfd, select.POLLIN)
+        return bool(poller.poll(int(timeout_s * 1000)))
+    finally:
+        os.close(pidfd)
+
+
+def pid_alive(pid):
+    """ Does 'pid' exist? """
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+def stop_pid(pid, grace_s=2.0):
+    """ SIGTERM 'pid', then SIGKILL if it lingers; returns True if gone """
+    for sig, wait_s in ((signal.SIGTERM, grace_s), (signal.SIGKILL, 1.0)):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            return False
+        if wait_pid(pid, wait_s):
+            prt(f'INFO: stopped pid={pid} [sig={sig}]')
+            return True
+    return False
+
+
+def scan_stale(targets=('pwr-tray', 'pwr_tray.main')):
+    """ pids of other python processes running pwr-tray (via /proc) """
+    pids, me = [], os.getpid()
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit() or int(entry) == me:
+            continue
+        try:
+            with open(f'/proc/{entry}/cmdline', 'rb') as handle:
+                args = handle.read().split(b'\0')
+        except OSError:
+            continue
+        if len(args) < 2 or not os.path.basename(args[0]).startswith(b'python'):
+            continue
+        words = [os.path.basename(arg).decode('utf-8', 'replace') for arg in args[1:3]]
+        if any(word in targets or word == f'{targets[0]}.py' for word in words):
+            pids.append(int(entry))
+    return pids
+
+
+class Instance(QObject):
+    """ The single-instance lock and control socket of the applet """
+    def __init__(self, folder):
+        super().__init__()
+        self.folder = folder
+        self.lock_path = os.path.join(folder, 'instance.lock')
+        self.lock_fd = None
+        self.server, self.notifier, self.handlers = None, None, {}
+
+    def _try_lock(self):
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.pwrite(fd, f'{os.getpid()}\n'.encode('utf-8'), 0)
+        self.lock_fd = fd
+        return True
+
+    def _holder_pid(self):
+        try:
+            with open(self.lock_path, 'r', encoding='utf-8') as handle:
+                return int(handle.read().strip())
+        except Exception:
+            return None
+
+    def acquire(self, quit_timeout_s=5.0):
+        """ Become the single instance, asking any running one to quit;
+        returns False if it could not be replaced. """
+        fresh = not os.path.exists(self.lock_path) # perhaps an older version runs
+        if self._try_lock():
+            if fresh:
+                for pid in scan_stale():
+                    stop_pid(pid)
+            return True
+        pid = self._holder_pid()
+        began = time.monotonic()
+        reply = request(self.folder, 'quit')
+        if pid and reply and wait_pid(pid, quit_timeout_s):
+            prt(f'INFO: previous pwr-tray (pid={pid}) quit in'
+                f' {(time.monotonic()-began)*1000:.0f}ms')
+        elif pid and pid != os.getpid():
+            prt(f'WARN: previous pwr-tray (pid={pid}) did not quit; stopping it')
+            stop_pid(pid)
+        else:
+            for stale in scan_stale():
+                stop_pid(stale)
+        for _ in range(20): # the lock is freed as the old one exits
+            if self._try_lock():
+                return True
+            time.sleep(0.05)
+        return False
+
+    def release(self):
+        """ Give up the lock and socket (e.g., just before a restart) """
+        if self.notifier:
+            self.notifier.setEnabled(False)
+            self.notifier = None
+        if self.server:
+            self.server.close()
+            self.server = None
+        if self.lock_fd is not None:
+            os.close(self.lock_fd)
+            self.lock_fd = None
+
+    def serve(self, handlers):
+        """ Answer control requests; 'handlers' maps a command (e.g., 'quit')
+        to a function returning the reply text. """
+        self.handlers = handlers
+        try:
+            self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.server.bind(socket_name(self.folder))
+            self.server.listen(4)
+            self.server.setblocking(False)
+        except OSError as exc:
+            prt(f'WARN: no control socket: {exc}')
+            self.server = None
+            return
+        self.notifier = QSocketNotifier(self.server.fileno(), QSocketNotifier.Read)
+        self.notifier.activated.connect(self._on_connect)
+
+    def _on_connect(self, _fd=None):
+        try:
+            conn, _ = self.server.accept()
+        except OSError:
+            return
+        with conn:
+            try:
+                creds = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                                        struct.calcsize('3i'))
+                _, uid, _ = struct.unpack('3i', creds)
+                if uid != os.getuid():
+                    prt(f'WARN: control request from uid={uid} refused')
+                    return
+                conn.settimeout(0.5)
+                command = conn.recv(256).decode('utf-8', 'replace').strip()
+                handler = self.handlers.get(command, None)
+                reply = handler() if handler else f'unknown: {command}'
+                conn.sendall(f'{reply}\n'.encode('utf-8'))
+            except Exception as exc:
+                prt(f'WARN: control request failed: {exc}')
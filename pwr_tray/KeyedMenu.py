@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A QMenu kept in step with a keyed list of items, instead of being cleared
+and rebuilt.  Each key owns one QAction for as long as it is listed; an
+update only calls setText()/setVisible() on the actions that differ and
+inserts/removes the rows whose keys come or go (e.g., inhibitors), so an
+open menu does not flicker and the steady state creates no Qt objects.
+"""
+# pylint: disable=invalid-name
+from PyQt5.QtWidgets import QAction
+
+
+class KeyedMenu:
+    """ Keeps 'menu' showing the items of the last update().
+     - 'created' and 'removed' count the QActions made and dropped. """
+    def __init__(self, menu):
+        self.menu = menu
+        self.actions = {} # key -> QAction (in menu order)
+        self.created, self.removed = 0, 0
+
+    def update(self, items):
+        """ 'items' are (key, text, callback, visible) in menu order; a
+        key's callback is bound when its action is created. """
+        wanted = [key for key, *_ in items]
+        listed = set(wanted)
+        for key in [key for key in self.actions if key not in listed]:
+            action = self.actions.pop(key)
+            self.menu.removeAction(action)
+            action.deleteLater()
+            self.removed += 1
+        kept = [key for key in wanted if key in self.actions]
+        if kept != list(self.actions): # reordered; rare, so simply re-add
+            for key in kept:
+                self.menu.removeAction(self.actions[key])
+                self.menu.addAction(self.actions[key])
+            self.actions = {key: self.actions[key] for key in kept}
+
+        ordered, following = {}, None
+        for key, text, callback, visible in reversed(items):
+            action = self.actions.get(key, None)
+            if action is None:
+                action = QAction(text, self.menu)
+                action.triggered.connect(callback)
+                self.menu.insertAction(following, action)
+                self.created += 1
+            else:
+                if action.text() != text:
+                    action.setText(text)
+            if action.isVisible() != visible:
+                action.setVisible(visible)
+            ordered[key] = action
+            following = action
+        self.actions = dict(reversed(ordered.items()))
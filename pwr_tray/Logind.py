@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tracks systemd/logind state over the system bus.
+
+Inhibitors: rather than forking 'systemd-inhibit' every tick and parsing its
+table, we call org.freedesktop.login1.Manager.ListInhibitors in-process, and
+only again when logind announces a change (PropertiesChanged on
+Block/DelayInhibited), when the cheap 'BlockInhibited' property differs, or
+after 'refresh_s' (10 minutes) as a safety net: adding a second inhibitor of
+the same kind changes no property, but neither does it change whether we are
+inhibited, so only the menu's list could lag.  Without a system bus, we fall
+back to 'systemd-inhibit' (polled).
+The listing (probe()) may run off the Qt thread, so it only reads a snapshot
+and returns its result; apply() takes that on the Qt thread.
+
+Sleep: logind's PrepareForSleep signal (true before suspending, false on
+resume) is received as a real signal, so the handlers run at once.  To act
+before the system sleeps (e.g., lock the screen when the lid closes), a
+'delay' inhibitor is held and let go once done; logind waits for that (up
+to its InhibitDelayMaxSec).
+"""
+# pylint: disable=invalid-name,broad-exception-caught
+import os
+import time
+import subprocess
+from types import SimpleNamespace
+from PyQt5.QtCore import QObject, pyqtSlot
+from PyQt5.QtDBus import QDBusMessage
+import pwr_tray.DBusTool as DBusTool
+from pwr_tray.DBusTool import LOGIN1, PROPS_IFACE
+from pwr_tray.Utils import prt
+from pwr_tray.TickStats import note_spawn
+
+
+class InhibitorWatcher(QObject):
+    """ Keeps the current list of blocking inhibitors as records with
+    attributes: what, who, why, mode, uid, pid.
+     - on_change() is called when logind signals a change """
+    ignored_whos = ('xfce4-power-manager', 'xfce4-power-man',
+                    'org_kde_powerdevil', 'org_kde_powerde')
+
+    def __init__(self, refresh_s=600, on_change=None):
+        super().__init__()
+        self.on_change = on_change
+        self.records = []
+        self.refresh_s = refresh_s
+        self.changes, self.listed_changes = 0, -1 # dirty while they differ
+        self.block_what = None
+        self.listed_mono = 0.0
+        self.bus = DBusTool.system_bus()
+        self.native = DBusTool.subscribe(self.bus, LOGIN1[0], LOGIN1[1],
+                PROPS_IFACE, 'PropertiesChanged', self._on_props_changed)
+        prt('inhibitors:', 'logind over dbus' if self.native
+                else 'systemd-inhibit (no system bus)')
+
+    @pyqtSlot(QDBusMessage)
+    def _on_props_changed(self, msg):
+        args = msg.arguments()
+        if len(args) < 3 or args[0] != LOGIN1[2]:
+            return
+        changed = set(args[1]) | set(args[2])
+        if changed & {'BlockInhibited', 'DelayInhibited'}:
+            self.mark_dirty()
+            if self.on_change:
+                self.on_change()
+
+    def mark_dirty(self):
+        """ Re-list on the next probe (e.g., logind signalled, or resumed) """
+        self.changes += 1
+
+    def snapshot(self):
+        """ What probe() goes by (taken on the Qt thread when submitting) """
+        return SimpleNamespace(changes=self.changes, block_what=self.block_what,
+                dirty=self.changes != self.listed_changes, listed_mono=self.listed_mono)
+
+    def probe(self, snap):
+        """ Re-list the inhibitors if anything may have changed since
+        'snap'; touches no state (so it may run on the probe pool).
+        Returns the listing for apply(), or None if not re-listed. """
+        now = time.monotonic()
+        what = None
+        if self.native:
+            what = DBusTool.get_property(self.bus, *LOGIN1, 'BlockInhibited')
+            if (not snap.dirty and what == snap.block_what
+                    and now - snap.listed_mono < self.refresh_s):
+                return None
+            records = self._list_native()
+            if records is None:
+                return None # keep what we have; retry next time
+        else:
+            records = self._list_by_command()
+        records = [rec for rec in records if rec.mode == 'block'
+                        and rec.who not in self.ignored_whos]
+        return SimpleNamespace(changes=snap.changes, block_what=what,
+                               listed_mono=now, records=records)
+
+    def apply(self, listing):
+        """ Take a listing of probe() (on the Qt thread); a change signalled
+        meanwhile leaves it dirty.  Returns True if the records changed. """
+        if listing is None:
+            return False
+        self.listed_changes = listing.changes
+        self.block_what, self.listed_mono = listing.block_what, listing.listed_mono
+        if listing.records == self.records:
+            return False
+        self.records = listing.records
+        return True
+
+    def refresh(self):
+        """ probe() and apply() in one (blocking) step """
+        return self.apply(self.probe(self.snapshot()))
+
+    def _list_native(self):
+        rv = DBusTool.call(self.bus, *LOGIN1, 'ListInhibitors')
+        if rv is None:
+            return None
+        return [SimpleNamespace(what=what, who=who, why=why, mode=mode,
+                                uid=uid, pid=pid)
+                for what, who, why, mode, uid, pid in rv[0]]
+
+    @staticmethod
+    def _list_by_command():
+        """ Parse the fixed-width table of 'systemd-inhibit' (fallback) """
+        def to_int(val):
+            try:
+                return int(val)
+            except Exception:
+                return 0
+        note_spawn()
+        try:
+            output = subprocess.run(
+                    ['systemd-inhibit', '--no-pager', '--mode=block'],
+                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                    check=False, timeout=10).stdout.decode('utf-8')
+        except Exception as exc:
+            prt(f'WARN: systemd-inhibit failed: {exc}')
+            return []
+        lines = output.splitlines()
+        if not lines or 'WHO' not in lines[0]:
+            return []
+        header = lines[0]
+        cols = [(name.lower(), header.index(name)) for name in header.split()]
+        records = []
+        for line in lines[1:]:
+            vals = {}
+            for idx, (name, start) in enumerate(cols):
+                end = cols[idx+1][1] if idx + 1 < len(cols) else None
+                vals[name] = line[start:end].strip()
+            records.append(SimpleNamespace(what=vals.get('what', ''),
+                    who=vals.get('who', ''), why=vals.get('why', ''),
+                    mode=vals.get('mode', ''), uid=to_int(vals.get('uid')),
+                    pid=to_int(vals.get('pid'))))
+        return records
+
+
+class SleepWatcher(QObject):
+    """ Calls on_sleep() as logind is about to suspend and on_resume() as
+    it resumes (per PrepareForSleep).
+     - 'active' is False without a system bus (no sleep/resume events)
+     - after hold_delay(), logind waits for release_delay() before sleeping
+       (the delay is taken again on each resume) """
+    def __init__(self, on_sleep=None, on_resume=None):
+        super().__init__()
+        self.on_sleep, self.on_resume = on_sleep, on_resume
+        self.sleeping = False
+        self.bus = DBusTool.system_bus()
+        self.delay_why = None # set by hold_delay()
+        self.delay_fd, self.delay_pending = None, False
+        self.active = DBusTool.subscribe(self.bus, LOGIN1[0],
+                LOGIN1[1], LOGIN1[2], 'PrepareForSleep', self._on_prepare)
+        prt('sleep/resume: logind over dbus' if self.active
+                else 'WARN: sleep/resume: not detected (no system bus)')
+
+    @pyqtSlot(QDBusMessage)
+    def _on_prepare(self, msg):
+        args = msg.arguments()
+        if not args:
+            return
+        self.sleeping = bool(args[0])
+        if not self.sleeping and self.delay_why:
+            self.hold_delay(self.delay_why)
+        callback = self.on_sleep if self.sleeping else self.on_resume
+        if callback:
+            try:
+                callback()
+            except Exception as exc:
+                prt(f'WARN: {"sleep" if self.sleeping else "resume"} handler: {exc}')
+
+    def hold_delay(self, why):
+        """ Take a 'delay' inhibitor on sleep (if not held already) """
+        self.delay_why = why
+        if not self.active or self.delay_fd is not None or self.delay_pending:
+            return
+
+        def on_reply(args):
+            self.delay_pending = False
+            try:
+                fd = os.dup(args[0].fileDescriptor()) # the original closes with args
+            except Exception as exc:
+                prt(f'WARN: sleep delay inhibitor: {exc}')
+                return
+            if self.sleeping: # too late to matter
+                os.close(fd)
+            else:
+                self.delay_fd = fd
+
+        def on_error(message):
+            self.delay_pending = False
+            prt(f'WARN: sleep delay inhibitor: {message}')
+
+        self.delay_pending = DBusTool.async_call(self.bus, *LOGIN1, 'Inhibit',
+                'sleep', 'pwr-tray', why, 'delay', on_reply=on_reply, on_error=on_error)
+
+    def release_delay(self):
+        """ Let logind go ahead with sleeping """
+        if self.delay_fd is not None:
+            try:
+                os.close(self.delay_fd)
+            except OSError:
+                pass
+            self.delay_fd = None
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Watches MPRIS media players on the session bus so that playing media can
+inhibit locking/sleeping without forking 'playerctl status' every tick.
+
+We subscribe to NameOwnerChanged (players coming and going) and to
+PropertiesChanged on /org/mpris/MediaPlayer2 (PlaybackStatus), and keep an
+in-memory map of players keyed by their unique bus name.  All calls are
+asynchronous, so a wedged player cannot stall the tray.
+"""
+# pylint: disable=invalid-name,broad-exception-caught
+from types import SimpleNamespace
+from PyQt5.QtCore import QObject, pyqtSlot
+from PyQt5.QtDBus import QDBusMessage
+import pwr_tray.DBusTool as DBusTool
+from pwr_tray.DBusTool import BUS_NAME, PROPS_IFACE
+from pwr_tray.Utils import prt
+
+MPRIS_PREFIX = 'org.mpris.MediaPlayer2.'
+MPRIS_PATH = '/org/mpris/MediaPlayer2'
+PLAYER_IFACE = 'org.mpris.MediaPlayer2.Player'
+
+
+class MprisWatcher(QObject):
+    """ Keeps 'players' (unique name -> namespace(name, status)) current.
+     - on_change(play_state) is called when the aggregate state changes
+     - pass 'bus' to watch a private bus (e.g., for testing) """
+    def __init__(self, on_change=None, bus=None):
+        super().__init__()
+        self.on_change = on_change
+        self.players = {}
+        self.bus = bus if bus else DBusTool.session_bus()
+        self.was_play_state = ''
+        self.active = (DBusTool.subscribe(self.bus, *BUS_NAME,
+                            'NameOwnerChanged', self._on_owner_changed)
+                       and DBusTool.subscribe(self.bus, '', MPRIS_PATH,
+                            PROPS_IFACE, 'PropertiesChanged', self._on_props_changed)
+                       and DBusTool.async_call(self.bus, *BUS_NAME, 'ListNames',
+                            on_reply=self._on_list_names))
+        prt('mpris:', 'watching session bus' if self.active
+                else 'unavailable (no session bus)')
+
+    @property
+    def play_state(self):
+        """ Aggregate state in the words of 'playerctl status' """
+        statuses = {player.status for player in self.players.values()}
+        return ('playing' if 'Playing' in statuses
+                else 'paused' if 'Paused' in statuses
+                else 'stopped' if statuses else '')
+
+    def _notify(self):
+        play_state = self.play_state
+        if play_state != self.was_play_state:
+            self.was_play_state = play_state
+            if self.on_change:
+                self.on_change(play_state)
+
+    def _add_player(self, name, owner):
+        self.players[owner] = SimpleNamespace(name=name, status='')
+        def on_status(status, owner=owner):
+            player = self.players.get(owner, None)
+            if player and isinstance(status, str):
+                player.status = status
+                self._notify()
+        DBusTool.get_property_async(self.bus, owner, MPRIS_PATH,
+                PLAYER_IFACE, 'PlaybackStatus', on_status, timeout_ms=1000)
+
+    def _on_list_names(self, args):
+        for name in (args[0] if args else []):
+            if not name.startswith(MPRIS_PREFIX):
+                continue
+            DBusTool.async_call(self.bus, *BUS_NAME, 'GetNameOwner', name,
+                on_reply=lambda args, name=name: self._add_player(name, args[0]),
+                timeout_ms=1000)
+
+    @pyqtSlot(QDBusMessage)
+    def _on_owner_changed(self, msg):
+        args = msg.arguments()
+        if len(args) < 3 or not args[0].startswith(MPRIS_PREFIX):
+            return
+        name, old_owner, new_owner = args[:3]
+        if old_owner:
+            self.players.pop(old_owner, None)
+        if new_owner:
+            self._add_player(name, new_owner)
+        self._notify()
+
+    @pyqtSlot(QDBusMessage)
+    def _on_props_changed(self, msg):
+        args = msg.arguments()
+        if len(args) < 2 or args[0] != PLAYER_IFACE:
+            return
+        status = args[1].get('PlaybackStatus', None)
+        player = self.players.get(msg.service(), None)
+        if player and isinstance(status, str):
+            player.status = status
+            self._notify()
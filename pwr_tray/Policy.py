@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The idle policy (when to lock, blank the monitors, or take the system
+down) as a pure function, so it can be replayed and checked without Qt,
+a display, or waiting.
+
+decide(facts) returns what to do now from a record with attributes:
+ - idle_s: the idle seconds
+ - state, state_when_s: Awake/Locked/Blanked/Asleep and the idle seconds
+   when it was entered
+ - mode: the effective mode (Presentation, LockOnly or SleepAfterLock)
+ - inhibited: something (an inhibitor or playing media) holds the screen on
+ - lock_s, down_s, blank_s: the limits of the current selector (blank_s
+   counts from entering Locked)
+ - can_blank: monitors may be turned off (setting and command)
+ - power_off: take the system down by powering off rather than suspending
+ - external: an idle manager (swayidle) does the timeouts itself
+
+The rules are the table RULES, scanned in order; the first row whose mode,
+state and condition (None: always) match wins; 'down' is 'suspend' or
+'poweroff' per power_off.  An inhibitor counts as Presentation.
+
+Simulator replays a trace of timed events (user activity, mode and
+selector changes, inhibitors) against a virtual clock, stepping straight
+from one event or threshold to the next, so hours of trace take
+milliseconds.
+"""
+# pylint: disable=invalid-name
+from types import SimpleNamespace
+
+MODES = ('Presentation', 'LockOnly', 'SleepAfterLock')
+STATES = ('Awake', 'Locked', 'Blanked', 'Asleep')
+LOCKING = ('LockOnly', 'SleepAfterLock')
+
+
+def hold_s(facts):
+    """ While held, the idle seconds past which the idle time is reset """
+    return min(50, facts.lock_s * 0.40)
+
+
+def _hold_due(f):
+    return f.external or f.idle_s >= hold_s(f)
+
+def _down_due(f):
+    return f.idle_s >= f.down_s
+
+def _lock_due(f):
+    return f.idle_s >= f.lock_s
+
+def _blank_due(f):
+    return f.can_blank and f.idle_s >= f.state_when_s + f.blank_s
+
+def _returned(f):
+    return f.idle_s < f.lock_s
+
+
+RULES = (
+    # name    modes               from states                      condition   action        next state
+    ('hold',  ('Presentation',),  STATES,                          _hold_due,  'reset_idle', None),
+    ('held',  ('Presentation',),  STATES,                          None,       None,         None),
+    ('down',  ('SleepAfterLock',), ('Awake', 'Locked', 'Blanked'), _down_due,  'down',       'Asleep'),
+    ('lock',  LOCKING,            ('Awake',),                      _lock_due,  'lock',       'Locked'),
+    ('blank', LOCKING,            ('Locked',),                     _blank_due, 'blank',      'Blanked'),
+    ('wake',  LOCKING,            ('Locked', 'Blanked', 'Asleep'), _returned,  None,         'Awake'),
+)
+
+
+def policy_mode(facts):
+    """ The mode the rules see (an inhibitor acts as Presentation) """
+    return 'Presentation' if facts.inhibited else facts.mode
+
+
+def decide(facts):
+    """ The decision for 'facts' with attributes:
+     - rule: the name of the matching row (or None)
+     - action: None, 'reset_idle', 'lock', 'blank', 'suspend' or 'poweroff'
+     - state: the state to enter (or None to stay) """
+    mode = policy_mode(facts)
+    for name, modes, states, condition, action, state in RULES:
+        if (mode in modes and facts.state in states
+                and (condition is None or condition(facts))):
+            if action == 'down':
+                action = 'poweroff' if facts.power_off else 'suspend'
+            return SimpleNamespace(rule=name, action=action, state=state)
+    return SimpleNamespace(rule=None, action=None, state=None)
+
+
+def thresholds(facts):
+    """ The idle seconds at which decide() may next change its answer """
+    secs = [facts.lock_s, facts.down_s]
+    if facts.state == 'Locked':
+        secs.append(facts.state_when_s + facts.blank_s)
+    if policy_mode(facts) == 'Presentation':
+        secs.append(hold_s(facts))
+    return secs
+
+
+class VirtualClock:
+    """ A clock that only moves when told (for replays) """
+    def __init__(self, now_s=0.0):
+        self.now_s = now_s
+
+    def __call__(self):
+        return self.now_s
+
+    def advance_to(self, when_s):
+        """ Move forward to 'when_s' (never back) """
+        self.now_s = max(self.now_s, when_s)
+
+
+class Simulator:
+    """ Replays a trace against the policy.
+     - limits: {selector: (lock_min, sleep_min)}
+     - events: (when_s, kind, value) sorted by time; kinds are 'activity',
+       'mode' (a mode name), 'selector' (Settings/HiBattery/LoBattery),
+       'inhibited' (True/False) and 'end' (nothing; the replay runs to it)
+    run() returns the transitions as (when_s, rule, action, state); the
+    idle time resets while held are only counted (in 'resets'). """
+    def __init__(self, limits, clock=None, blank_s=20, can_blank=True,
+                 power_off=False, external=False, mode='SleepAfterLock',
+                 selector='Settings'):
+        self.limits = limits
+        self.clock = clock if clock else VirtualClock()
+        self.fixed = SimpleNamespace(blank_s=blank_s, can_blank=can_blank,
+                                     power_off=power_off, external=external)
+        self.mode, self.selector, self.inhibited = mode, selector, False
+        self.state, self.state_when_s = 'Awake', 0.0
+        self.active_s = self.clock() # when the user was last active
+        self.decisions, self.resets = 0, 0
+
+    def facts(self):
+        """ The inputs of decide() as of now """
+        lock_min, sleep_min = self.limits[self.selector]
+        mode = 'SleepAfterLock' if self.selector == 'LoBattery' else self.mode
+        return SimpleNamespace(idle_s=round(self.clock() - self.active_s, 6),
+                state=self.state, state_when_s=self.state_when_s, mode=mode,
+                inhibited=self.inhibited, lock_s=lock_min*60,
+                down_s=(lock_min + sleep_min)*60, **vars(self.fixed))
+
+    def step(self):
+        """ Apply the policy once; returns the decision """
+        facts = self.facts()
+        decision = decide(facts)
+        self.decisions += 1
+        if decision.action == 'reset_idle':
+            self.active_s = self.clock()
+            self.resets += 1
+        if decision.state:
+            self.state, self.state_when_s = decision.state, facts.idle_s
+        return decision
+
+    def apply(self, kind, value):
+        """ Apply one trace event """
+        if kind == 'activity':
+            self.active_s = self.clock()
+        elif kind == 'mode':
+            self.mode = value
+        elif kind == 'selector':
+            self.selector = value
+        elif kind == 'inhibited':
+            self.inhibited = bool(value)
+        elif kind != 'end':
+            raise ValueError(f'unknown trace event {kind!r}')
+
+    def run(self, events, until_s=None):
+        """ Replay 'events' (and then idle until 'until_s') """
+        transitions = []
+        events = list(events)
+        until_s = max([until_s or 0] + [when for when, *_ in events])
+        idx = 0
+        while True:
+            decision = self.step()
+            if decision.state or decision.action not in (None, 'reset_idle'):
+                transitions.append((round(self.clock(), 3), decision.rule,
+                                    decision.action, decision.state))
+                if decision.state:
+                    continue # decide again at once (as the tray's next tick would)
+            facts = self.facts()
+            ahead = [sec - facts.idle_s for sec in thresholds(facts) if sec > facts.idle_s]
+            next_s = self.clock() + max(min(ahead), 1e-3) if ahead else None
+            event_s = events[idx][0] if idx < len(events) else None
+            candidates = [when for when in (next_s, event_s) if when is not None]
+            if not candidates or min(candidates) > until_s:
+                break
+            self.clock.advance_to(min(candidates))
+            while idx < len(events) and events[idx][0] <= self.clock():
+                _, kind, value = events[idx]
+                self.apply(kind, value)
+                idx += 1
+        return transitions
+
+
+def parse_trace(lines):
+    """ Trace events from lines of 'when kind [value]' (when: seconds, or
+    with an h/m/s suffix); '#' starts a comment """
+    events = []
+    for line in lines:
+        words = line.split('#', 1)[0].split()
+        if not words:
+            continue
+        when, kind, value = words[0], words[1], (words[2] if len(words) > 2 else None)
+        scale = {'h': 3600, 'm': 60, 's': 1}.get(when[-1], None)
+        when_s = float(when[:-1]) * scale if scale else float(when)
+        if kind == 'inhibited':
+            value = value.lower() in ('1', 'true', 'yes', 'on')
+        events.append((when_s, kind, value))
+    return sorted(events, key=lambda event: event[0])
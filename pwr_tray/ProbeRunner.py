@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Runs the blocking probes (an idle-time command such as xprintidle,
+'playerctl status', the logind inhibitor listing, ...) on a small pool of
+worker threads so that one that hangs (e.g., playerctl on a wedged MPRIS
+player, or xprintidle on a dead display) cannot stall the menu or the
+idle policy.
+
+Each probe has a name and a deadline, and a name is never in flight twice
+(so a hung probe ties up one worker, not all of them; asking again for a
+probe still hung past its deadline counts as another miss).  Results come
+back to the Qt thread as a queued signal and go to on_result(value).
+A probe that misses its deadline counts a strike and its late result is
+dropped; after 'trip_after' strikes in a row, its circuit breaker opens:
+the probe is refused for a back-off that doubles (up to 'backoff_max_s')
+with each failed trial, and a trial answered in time closes it again.
+on_breaker() is called when a breaker opens or closes (e.g., to flag the
+probe in the menu).  The subprocesses a probe spawns (per note_spawn()) are
+counted in its stats rather than in the tick phase that happens to be
+running.  The workers are daemon threads so that a probe hung
+for good never holds up an exit.
+"""
+# pylint: disable=invalid-name,broad-exception-caught
+import time
+import queue
+import threading
+from types import SimpleNamespace
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+from pwr_tray.Utils import prt
+from pwr_tray.TickStats import charge_spawns_to
+
+
+class ProbeRunner(QObject):
+    """ Runs probes off the Qt thread; see submit() """
+    finished = pyqtSignal(object)
+
+    workers = 3
+    trip_after = 3 # strikes in a row that open the breaker
+    backoff_min_s = 30
+    backoff_max_s = 600
+
+    def __init__(self, on_breaker=None):
+        super().__init__()
+        self.on_breaker = on_breaker
+        self.running = {} # name -> job
+        self.probes = {}  # name -> SimpleNamespace(stats and breaker state)
+        self.jobs = queue.SimpleQueue()
+        self.finished.connect(self._on_finished)
+        for idx in range(self.workers):
+            threading.Thread(target=self._work, name=f'probe-{idx}',
+                             daemon=True).start()
+
+    def _probe(self, name):
+        probe = self.probes.get(name, None)
+        if not probe:
+            probe = self.probes[name] = SimpleNamespace(count=0, timeouts=0,
+                    errors=0, spawns=0, strikes=0, last_s=0.0, max_s=0.0,
+                    backoff_s=0, open_until_mono=0.0)
+        return probe
+
+    def busy(self, name):
+        """ Is probe 'name' in flight? """
+        return name in self.running
+
+    def tripped(self):
+        """ The names of the probes whose breaker is open """
+        return sorted(name for name, probe in self.probes.items() if probe.backoff_s)
+
+    def submit(self, name, func, on_result, deadline_s=2.0):
+        """ Run func() on a worker; on_result(value) runs later on the Qt
+        thread if it returns within 'deadline_s'.  Returns False if not
+        started: still in flight, or its breaker is open. """
+        probe = self._probe(name)
+        if probe.backoff_s and time.monotonic() < probe.open_until_mono:
+            return False
+        job = self.running.get(name, None)
+        if job:
+            if job.late: # still hung; that counts against it too
+                self._strike(name, probe)
+            return False
+        job = SimpleNamespace(name=name, func=func, on_result=on_result,
+                value=None, error=None, late=False, done=False, spawns=0,
+                began_mono=time.monotonic(), elapsed_s=0.0)
+        self.running[name] = job
+        self.jobs.put(job)
+        QTimer.singleShot(int(deadline_s*1000), lambda: self._on_deadline(job, deadline_s))
+        return True
+
+    def _work(self):
+        """ Worker thread: run the queued probes """
+        while True:
+            job = self.jobs.get()
+            charge_spawns_to(job)
+            try:
+                job.value = job.func()
+            except Exception as exc:
+                job.error = str(exc)
+            charge_spawns_to(None)
+            job.elapsed_s = time.monotonic() - job.began_mono
+            self.finished.emit(job)
+
+    def _on_deadline(self, job, deadline_s):
+        """ Qt thread: the probe's time is up """
+        if job.done:
+            return
+        job.late = True
+        probe = self._probe(job.name)
+        probe.timeouts += 1
+        prt(f'WARN: probe {job.name!r}: no result within {deadline_s}s')
+        self._strike(job.name, probe)
+
+    def _on_finished(self, job):
+        """ Qt thread: account for the probe and pass on its result """
+        job.done = True
+        if self.running.get(job.name, None) is job:
+            del self.running[job.name]
+        probe = self._probe(job.name)
+        probe.count += 1
+        probe.spawns += job.spawns
+        probe.last_s = job.elapsed_s
+        probe.max_s = max(probe.max_s, job.elapsed_s)
+        if job.late:
+            prt(f'NOTE: probe {job.name!r}: late result dropped'
+                f' ({job.elapsed_s*1000:.0f}ms)')
+            return
+        if job.error is not None:
+            probe.errors += 1
+            prt(f'WARN: probe {job.name!r} failed: {job.error}')
+            return
+        probe.strikes = 0
+        if probe.backoff_s:
+            probe.backoff_s = 0
+            prt(f'NOTE: probe {job.name!r}: answering again; breaker closed')
+            if self.on_breaker:
+                self.on_breaker()
+        try:
+            job.on_result(job.value)
+        except Exception as exc:
+            prt(f'WARN: probe {job.name!r} on_result failed: {exc}')
+
+    def _strike(self, name, probe):
+        probe.strikes += 1
+        if probe.strikes < self.trip_after and not probe.backoff_s:
+            return
+        opened = not probe.backoff_s
+        probe.backoff_s = min(max(probe.backoff_s * 2, self.backoff_min_s),
+                              self.backoff_max_s)
+        probe.open_until_mono = time.monotonic() + probe.backoff_s
+        prt(f'WARN: probe {name!r}: breaker open; next try in {probe.backoff_s}s')
+        if opened and self.on_breaker:
+            self.on_breaker()
+
+    def reset(self):
+        """ Close every breaker (e.g., the user asked to retry) """
+        for probe in self.probes.values():
+            probe.strikes, probe.backoff_s = 0, 0
+        if self.on_breaker:
+            self.on_breaker()
+
+    def stats(self):
+        """ Per probe counts and times for stats.json """
+        return {name: {'count': probe.count, 'timeouts': probe.timeouts,
+                       'errors': probe.errors, 'spawns': probe.spawns,
+                       'spawns_per_run': round(probe.spawns / max(probe.count, 1), 3),
+                       'last_ms': round(probe.last_s*1000),
+                       'max_ms': round(probe.max_s*1000), 'tripped': bool(probe.backoff_s)}
+                for name, probe in self.probes.items()}
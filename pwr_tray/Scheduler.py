@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Deadline scheduling for the tray's main loop.  Rather than waking every
+couple of seconds whether or not anything can change, the applet computes
+when it next has work to do (e.g., the earliest an idle threshold could be
+crossed) and arms one single-shot timer for that instant; external events
+(D-Bus signals, X11 alarms, menu picks) wake it early.
+
+Long delays use Qt.VeryCoarseTimer (full second accuracy) so the kernel can
+batch the wakeup with others; short ones use Qt.CoarseTimer.
+"""
+# pylint: disable=invalid-name
+import time
+from PyQt5.QtCore import Qt, QTimer
+
+
+class DeadlineScheduler:
+    """ Calls 'callback' at the armed deadline, counting wakeups.
+     - fixed_s: if set, never sleep longer (e.g., 2.0 to mimic the old poll) """
+    def __init__(self, callback, fixed_s=None):
+        self.callback = callback
+        self.fixed_s = fixed_s
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self._on_timer)
+        self.due_mono = None
+        self.wakeups = 0
+        self.began_mono = time.monotonic()
+
+    def arm(self, delay_s):
+        """ (Re)arm for 'delay_s' from now, replacing any pending deadline """
+        if self.fixed_s:
+            delay_s = min(delay_s, self.fixed_s)
+        delay_s = max(0.0, delay_s)
+        self.timer.setTimerType(Qt.VeryCoarseTimer if delay_s >= 2
+                                else Qt.CoarseTimer)
+        self.due_mono = time.monotonic() + delay_s
+        self.timer.start(int(round(delay_s * 1000)))
+
+    def wake(self, delay_s=0.0):
+        """ Wake early for an external event unless already due sooner """
+        if (self.due_mono is None
+                or time.monotonic() + delay_s < self.due_mono):
+            self.arm(delay_s)
+
+    def _on_timer(self):
+        self.due_mono = None
+        self.wakeups += 1
+        self.callback()
+
+    def per_hour(self):
+        """ Wakeups per hour since started (for the log) """
+        hours = max(time.monotonic() - self.began_mono, 60) / 3600
+        return round(self.wakeups / hours, 1)
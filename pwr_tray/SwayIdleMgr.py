@@ -5,23 +5,83 @@ Wayland compositors do not provide a way to poll idle time, so the fundamental
 design of pwr-tray using idle time polling does not work.  Instead, for Wayland,
 we manage swayidle to run our config, and if there are special actions like
 blank now, we kill the running swayidle and start one that does what we want.
+
+Supervision is event driven: the exit of our swayidle (and of any strays
+being reaped) is noticed via its pidfd on a QSocketNotifier, so nothing
+polls or sleeps.  An unexpected exit restarts swayidle after a delay that
+doubles with each quick failure (0.5s up to 60s), so a crash-looping
+swayidle cannot become a fork storm.  Without pidfds (python < 3.9 or an
+old kernel), checkup() is called now and then instead.
 """
-# pylint: disable=invalid-name,consider-using-with
+# pylint: disable=invalid-name,consider-using-with,broad-exception-caught
 import subprocess
 import time
 import os
 import signal
 from types import SimpleNamespace
+from PyQt5.QtCore import QSocketNotifier, QTimer
 from pwr_tray.Utils import prt
+from pwr_tray.TickStats import note_spawn
+
+
+class PidWatch:
+    """ Calls on_exit(pid) when 'pid' exits (any process; via its pidfd).
+    'active' is False if pidfds are unavailable. """
+    def __init__(self, pid, on_exit):
+        self.pid, self.on_exit = pid, on_exit
+        self.fd, self.notifier = None, None
+        try:
+            self.fd = os.pidfd_open(pid)
+        except (AttributeError, OSError):
+            self.active = False
+            return
+        self.active = True
+        self.notifier = QSocketNotifier(self.fd, QSocketNotifier.Read)
+        self.notifier.activated.connect(self._on_ready)
+
+    def _on_ready(self, _fd=None):
+        self.close()
+        self.on_exit(self.pid)
+
+    def close(self):
+        """ Stop watching """
+        if self.notifier:
+            self.notifier.setEnabled(False)
+            self.notifier = None
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
 
 class SwayIdleManager:
     """ Class to manage 'swayidle' for Wayland compositors """
+    backoff_min_s, backoff_max_s = 0.5, 60.0
+    stable_s = 30 # a run this long resets the backoff
+    grace_s = 2.0 # SIGTERM to SIGKILL
+
     def __init__(self, applet):
         self.process = None
         self.applet = applet
         self.current_cmd = ''
-        # Build clauses from merged variables (no DE-specific branching)
-        v = applet.variables
+        self.clauses = None
+        self.watch = None # PidWatch of self.process
+        self.strays = {} # pid -> PidWatch while being reaped
+        self.started_mono = 0.0
+        self.backoff_s = 0.0
+        self.restart_timer = QTimer()
+        self.restart_timer.setSingleShot(True)
+        self.restart_timer.timeout.connect(self.start)
+        self.build_clauses()
+        self.kill_other_swayidle()
+
+    @property
+    def event_driven(self):
+        """ Is our swayidle's exit signalled (else checkup() must poll)? """
+        return bool(self.watch and self.watch.active)
+
+    def build_clauses(self):
+        """ Build clauses from merged variables (no DE-specific branching);
+        called again if the DE commands are reloaded. """
+        v = self.applet.variables
         locker = v.get('locker', '')
         blanker = v.get('monitors_off', '')
         unblanker = v.get('monitors_on', '')
@@ -33,25 +93,55 @@ class SwayIdleManager:
             before_sleep=f""" before-sleep '{locker}'""" if locker else "",
             after_resume=f""" after-resume '{unblanker}'""" if unblanker else "",
         )
-        self.kill_other_swayidle()
 
     @staticmethod
-    def kill_other_swayidle():
-        """ Kills any stray swayidles"""
+    def find_swayidles():
+        """ pids of our user's swayidle processes (via /proc) """
+        pids, uid = [], os.getuid()
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                if os.stat(f'/proc/{entry}').st_uid != uid:
+                    continue
+                with open(f'/proc/{entry}/comm', 'r', encoding='utf-8') as handle:
+                    if handle.read().strip() == 'swayidle':
+                        pids.append(int(entry))
+            except OSError:
+                continue
+        return pids
+
+    def kill_other_swayidle(self):
+        """ SIGTERM any stray swayidles and SIGKILL those still there after
+        the grace period; does not wait (their exits are watched). """
+        mine = self.process.pid if self.process else None
+        for pid in self.find_swayidles():
+            if pid == mine or pid in self.strays:
+                continue
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                continue
+            watch = PidWatch(pid, self._on_stray_exit)
+            self.strays[pid] = watch
+            QTimer.singleShot(int(self.grace_s*1000),
+                              lambda pid=pid: self._kill_stray(pid))
+        if self.strays:
+            prt(f'swayidle: reaping strays {sorted(self.strays)}')
+
+    def _on_stray_exit(self, pid):
+        self.strays.pop(pid, None)
+
+    def _kill_stray(self, pid):
+        watch = self.strays.pop(pid, None)
+        if watch is None:
+            return # gone already
+        watch.close()
         try:
-            pids = subprocess.check_output(['pgrep', 'swayidle']).decode().split()
-            if pids:
-                subprocess.run(['pkill', 'swayidle'])
-            time.sleep(2) # Wait a moment to ensure processes are terminated
-
-            pids = subprocess.check_output(['pgrep', 'swayidle']).decode().split()
-            if pids:
-                prt(f"Force killing remaining swayidle processes... {pids}")
-                for pid in pids:
-                    os.kill(int(pid), signal.SIGKILL)
-            return
-        except Exception:
-            return # none left
+            os.kill(pid, signal.SIGKILL)
+            prt(f'swayidle: force killed stray {pid}')
+        except OSError:
+            pass
 
     def build_cmd(self, mode=None):
         """ Build the swayidle command line from the current state. """
@@ -101,18 +191,63 @@ class SwayIdleManager:
             prt(f'SWAYIDLE: {self.current_cmd}')
 
         if not self.process and self.current_cmd:
+            self.restart_timer.stop()
+            note_spawn()
             self.process = subprocess.Popen(self.current_cmd, shell=True)
+            self.started_mono = time.monotonic()
+            self.watch = PidWatch(self.process.pid, self._on_exit)
 
         return self.process
 
     def stop(self):
-        """ Stop the current swayidle (normally to replace it) """
-        self.process.terminate()
-        self.process.wait()
-        self.process = None
+        """ Stop the current swayidle (normally to replace it) without
+        waiting; it is reaped when it exits (or SIGKILLed if it lingers). """
+        proc, self.process = self.process, None
+        if self.watch:
+            self.watch.close()
+            self.watch = None
+        try:
+            proc.terminate()
+        except OSError:
+            pass
+        if proc.poll() is None:
+            watch = PidWatch(proc.pid, lambda _pid: self._reap(proc))
+            self.strays[proc.pid] = watch
+            QTimer.singleShot(int(self.grace_s*1000), lambda: self._reap(proc, kill=True))
+
+    def _reap(self, proc, kill=False):
+        watch = self.strays.pop(proc.pid, None)
+        if watch:
+            watch.close()
+        if kill and proc.poll() is None:
+            proc.kill()
+            prt(f'swayidle: force killed {proc.pid}')
+        try:
+            proc.wait(timeout=0.5)
+        except subprocess.TimeoutExpired:
+            pass
+
+    def _on_exit(self, _pid):
+        """ Our swayidle exited unexpectedly: restart it with backoff """
+        proc, self.process, self.watch = self.process, None, None
+        if not proc:
+            return
+        rc = proc.wait()
+        ran_s = time.monotonic() - self.started_mono
+        if ran_s >= self.stable_s:
+            self.backoff_s = 0.0
+        self.backoff_s = min(self.backoff_max_s,
+                             max(self.backoff_min_s, self.backoff_s * 2))
+        prt(f'WARN: swayidle exited (rc={rc}) after {ran_s:.1f}s;'
+            f' restarting in {self.backoff_s}s')
+        self.current_cmd = '' # forces a rebuild on start()
+        self.restart_timer.start(int(self.backoff_s * 1000))
 
     def checkup(self):
-        """ Check whether swayidle is running, normally to restart it
-        with the current command. """
-        if self.process.poll() is not None:
-            self.start()
+        """ Without pidfds: check whether swayidle is running, normally to
+        restart it with the current command. """
+        if self.event_driven or self.restart_timer.isActive():
+            return
+        if self.process and self.process.poll() is not None:
+            self.watch = None
+            self._on_exit(self.process.pid)
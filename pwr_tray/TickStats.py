@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-phase timing of the tray's tick (tray check, battery, inhibitors, menu,
+idle policy, ...).  Each phase keeps the wall and CPU time of every run in
+fixed-size histograms backed by arrays (bucket i counts runs taking less
+than 2**i µs), plus totals and the subprocess spawns charged to it, so the
+cost is constant however long the applet runs.
+
+Spawn sites call note_spawn(); a phase is charged with the spawns counted
+between its start and its end on the Qt thread.  Spawns on a probe worker
+are charged to that probe instead (see charge_spawns_to() and ProbeRunner).
+
+Usage within a tick:
+    mark = stats.start()
+    ... the 'battery' work ...
+    mark = stats.lap('battery', mark)
+"""
+# pylint: disable=invalid-name,broad-exception-caught
+import os
+import json
+import time
+import threading
+from array import array
+
+NBUCKETS = 25 # up to 2**24 µs (~17s); longer lands in the last bucket
+_spawns = [0]
+_local = threading.local() # .holder: where this thread's spawns go, if set
+
+
+def note_spawn(count=1):
+    """ Count a subprocess spawn (charged to the running phase, or to this
+    thread's holder; see charge_spawns_to()) """
+    holder = getattr(_local, 'holder', None)
+    if holder is None:
+        _spawns[0] += count
+    else:
+        holder.spawns += count
+
+
+def charge_spawns_to(holder):
+    """ Charge the spawns of the calling thread to holder.spawns (None: to
+    the running phase again) """
+    _local.holder = holder
+
+
+class PhaseStats:
+    """ The runs of one phase """
+    __slots__ = ('count', 'spawns', 'wall_s', 'cpu_s', 'max_wall_s',
+                 'wall_hist', 'cpu_hist')
+
+    def __init__(self):
+        self.count, self.spawns = 0, 0
+        self.wall_s, self.cpu_s, self.max_wall_s = 0.0, 0.0, 0.0
+        self.wall_hist = array('L', [0] * NBUCKETS)
+        self.cpu_hist = array('L', [0] * NBUCKETS)
+
+    def add(self, wall_s, cpu_s, spawns):
+        """ Record one run """
+        self.count += 1
+        self.spawns += spawns
+        self.wall_s += wall_s
+        self.cpu_s += cpu_s
+        self.max_wall_s = max(self.max_wall_s, wall_s)
+        self.wall_hist[min(int(wall_s*1e6).bit_length(), NBUCKETS-1)] += 1
+        self.cpu_hist[min(int(cpu_s*1e6).bit_length(), NBUCKETS-1)] += 1
+
+    @staticmethod
+    def percentile_us(hist, frac):
+        """ Upper bound (µs) of the bucket holding the 'frac' quantile """
+        want, seen = frac * sum(hist), 0
+        for idx, num in enumerate(hist):
+            seen += num
+            if num and seen >= want:
+                return 1 << idx
+        return 0
+
+    def as_dict(self):
+        """ Summary (and the histograms) for stats.json """
+        count = max(self.count, 1)
+        return {'count': self.count,
+                'wall_mean_us': round(self.wall_s * 1e6 / count, 1),
+                'wall_p50_us': self.percentile_us(self.wall_hist, 0.50),
+                'wall_p95_us': self.percentile_us(self.wall_hist, 0.95),
+                'wall_max_us': round(self.max_wall_s * 1e6, 1),
+                'cpu_mean_us': round(self.cpu_s * 1e6 / count, 1),
+                'cpu_p95_us': self.percentile_us(self.cpu_hist, 0.95),
+                'spawns': self.spawns,
+                'spawns_per_run': round(self.spawns / count, 3),
+                'wall_hist': list(self.wall_hist),
+                'cpu_hist': list(self.cpu_hist)}
+
+
+class TickStats:
+    """ The PhaseStats by name, with a periodic summary """
+    def __init__(self, summary_s=600):
+        self.phases = {} # name -> PhaseStats
+        self.began_mono = time.monotonic()
+        self.summary_s = summary_s
+        self.summary_due_mono = self.began_mono + summary_s
+
+    @staticmethod
+    def start():
+        """ A mark to time a phase from """
+        return (time.perf_counter(), time.process_time(), _spawns[0])
+
+    def lap(self, name, mark):
+        """ Charge the time since 'mark' to phase 'name'; returns a new mark """
+        now = self.start()
+        phase = self.phases.get(name, None)
+        if not phase:
+            phase = self.phases[name] = PhaseStats()
+        phase.add(now[0] - mark[0], now[1] - mark[1], now[2] - mark[2])
+        return now
+
+    def summary_due(self):
+        """ Is the periodic summary due (and if so, re-arm it)? """
+        now = time.monotonic()
+        if now < self.summary_due_mono:
+            return False
+        self.summary_due_mono = now + self.summary_s
+        return True
+
+    def summary_lines(self):
+        """ One line per phase for the log or a popup """
+        hours = (time.monotonic() - self.began_mono) / 3600
+        lines = [f'stats over {hours:.2f}h:']
+        for name, phase in self.phases.items():
+            info = phase.as_dict()
+            line = (f'{name}: n={info["count"]} cpu={info["cpu_mean_us"]:.0f}us'
+                    f' wall={info["wall_mean_us"]:.0f}us'
+                    f' p95<{info["wall_p95_us"]}us')
+            if phase.spawns:
+                line += f' spawns={info["spawns_per_run"]}/run'
+            lines.append(line)
+        return lines
+
+    def dump(self, path, extra=None):
+        """ Write the stats as JSON (atomically) for 'pwr-tray --stats' """
+        data = {'written': time.time(),
+                'uptime_s': round(time.monotonic() - self.began_mono, 1),
+                'phases': {name: phase.as_dict() for name, phase in self.phases.items()}}
+        data.update(extra or {})
+        try:
+            tmp_path = f'{path}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as handle:
+                json.dump(data, handle)
+            os.replace(tmp_path, path)
+        except Exception:
+            pass
+
+
+def show_file(path):
+    """ Print a stats file written by a running applet ('--stats') """
+    try:
+        with open(path, 'r', encoding='utf-8') as handle:
+            data = json.load(handle)
+    except Exception as exc:
+        print(f'no stats in {path!r}: {exc}')
+        return 1
+    age_s = time.time() - data.get('written', 0)
+    print(f'{path}: written {age_s:.0f}s ago; uptime {data.get("uptime_s", 0)/3600:.2f}h;'
+          f' wakeups {data.get("wakeups_per_hour", "?")}/h')
+    print(f'{"phase":>12} {"runs":>7} {"cpu_us":>8} {"wall_us":>8}'
+          f' {"p50<us":>8} {"p95<us":>8} {"max_us":>9} {"spawns/run":>10}')
+    for name, info in data.get('phases', {}).items():
+        print(f'{name:>12} {info["count"]:>7} {info["cpu_mean_us"]:>8.0f}'
+              f' {info["wall_mean_us"]:>8.0f} {info["wall_p50_us"]:>8}'
+              f' {info["wall_p95_us"]:>8} {info["wall_max_us"]:>9.0f}'
+              f' {info["spawns_per_run"]:>10}')
+    commands = data.get('commands', {})
+    if commands:
+        print(f'{"command":>12} {"runs":>7} {"fails":>6} {"last_ms":>8} {"max_ms":>8}')
+        for key, info in commands.items():
+            print(f'{key:>12} {info["count"]:>7} {info["fails"]:>6}'
+                  f' {info["last_ms"]:>8} {info["max_ms"]:>8}')
+    probes = data.get('probes', {})
+    if probes:
+        print(f'{"probe":>12} {"runs":>7} {"late":>6} {"errors":>6} {"last_ms":>8}'
+              f' {"max_ms":>8} {"spawns/run":>10}')
+        for name, info in probes.items():
+            print(f'{name:>12} {info["count"]:>7} {info["timeouts"]:>6} {info["errors"]:>6}'
+                  f' {info["last_ms"]:>8} {info["max_ms"]:>8}'
+                  f' {info.get("spawns_per_run", 0):>10}'
+                  + ('  (breaker open)' if info['tripped'] else ''))
+    resumes = data.get('resumes', [])
+    if resumes:
+        print(f'resumes: {len(resumes)}; ready_ms (latest last):',
+              ' '.join(f'{info["ready_ms"]:.0f}' for info in resumes))
+    return 0
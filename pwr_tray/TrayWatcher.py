@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tracks whether a system tray exists without polling or sleeping.
+
+A tray is either a StatusNotifier host (org.kde.StatusNotifierWatcher on
+the session bus; KDE, waybar, ...) or an XEmbed tray (the owner of the X11
+selection _NET_SYSTEM_TRAY_S<screen>; i3bar, ...).  We watch the watcher's
+bus name for owner changes (and its StatusNotifierHostRegistered signal)
+and the X11 selection via XFixes; after a short debounce (a panel restart
+is a burst of events) the availability is re-evaluated once, and
+on_change(available) is called so the applet can show or re-register its
+icon in-process.
+"""
+# pylint: disable=invalid-name,broad-exception-caught
+import os
+from PyQt5.QtCore import QObject, QTimer, pyqtSlot
+from PyQt5.QtDBus import QDBusMessage
+from PyQt5.QtWidgets import QSystemTrayIcon
+import pwr_tray.DBusTool as DBusTool
+from pwr_tray.DBusTool import BUS_NAME
+from pwr_tray.Utils import prt
+
+SNI_WATCHER = 'org.kde.StatusNotifierWatcher'
+SNI_PATH = '/StatusNotifierWatcher'
+XEMBED_SELECTION = '_NET_SYSTEM_TRAY_S{screen}'
+
+
+class TrayWatcher(QObject):
+    """ 'available' is whether a tray exists (per Qt).
+     - on_change(available) is called after each (debounced) change of the
+       tray's owner, so the icon can be re-registered with a new panel.
+     - 'active' is False if neither D-Bus nor X11 can be watched; then the
+       caller must call check() now and then. """
+    def __init__(self, on_change, bus=None, debounce_ms=250):
+        super().__init__()
+        self.on_change = on_change
+        self.bus = bus if bus else DBusTool.session_bus()
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(debounce_ms)
+        self.timer.timeout.connect(self.check)
+        self.sni = (DBusTool.subscribe(self.bus, *BUS_NAME,
+                        'NameOwnerChanged', self._on_owner_changed)
+                    and DBusTool.subscribe(self.bus, '', SNI_PATH, SNI_WATCHER,
+                        'StatusNotifierHostRegistered', self._on_host_registered))
+        self.xembed = None
+        if os.environ.get('DISPLAY', ''):
+            from pwr_tray.X11Tool import XSelectionWatch # pylint: disable=import-outside-toplevel
+            self.xembed = XSelectionWatch(XEMBED_SELECTION, self._on_selection)
+            if not self.xembed.active:
+                self.xembed = None
+        self.active = bool(self.sni or self.xembed)
+        self.available = QSystemTrayIcon.isSystemTrayAvailable()
+        prt('tray:', 'available;' if self.available else 'NOT available;',
+            'watching', ' + '.join(([SNI_WATCHER] if self.sni else [])
+                                   + (['XEmbed selection'] if self.xembed else []))
+            if self.active else '(polling; no session bus or X11)')
+
+    @pyqtSlot(QDBusMessage)
+    def _on_owner_changed(self, msg):
+        args = msg.arguments()
+        if len(args) >= 3 and args[0] == SNI_WATCHER:
+            self.timer.start()
+
+    @pyqtSlot(QDBusMessage)
+    def _on_host_registered(self, _msg):
+        self.timer.start()
+
+    def _on_selection(self, _owner):
+        self.timer.start()
+
+    def check(self, polled=False):
+        """ Re-evaluate the availability and report it (if 'polled', only
+        when it differs) """
+        available = QSystemTrayIcon.isSystemTrayAvailable()
+        if polled and available == self.available:
+            return
+        self.available = available
+        prt(f'tray: owner changed; available={available}')
+        self.on_change(available)
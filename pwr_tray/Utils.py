@@ -11,24 +11,43 @@ import os
 import sys
 import stat
 import time
-import signal
+import gzip
+import queue
+import atexit
 import shutil
+import threading
 import subprocess
-import inspect
-from datetime import datetime
-from io import StringIO
 
-import importlib.resources as pkg_resources
-# from pathlib import Path
+DEBUG, INFO, WARN = 10, 20, 30
 
-prt_kb = 512
+prt_kb = 512          # rotate the log file when it exceeds this
+prt_gens = 1          # rotated generations kept (debug.log1 ... debug.logN)
+prt_compress = False  # gzip the rotated generations (debug.log1.gz ...)
+prt_level = INFO      # calls below this level return before any formatting
+prt_queue_max = 4096  # lines buffered for the writer thread; excess is dropped
 prt_path = ''
 prt_to_init = True
 
-def copy_to_folder(resource_name, dest):
-    """ Get the path of a resource """
+def copy_to_folder(resource_name, dest, if_changed=False):
+    """ Copy a resource to the folder 'dest' (if 'if_changed', only when
+    the content differs); returns the path of the resource. """
+    def copy(file_path):
+        dest_path = os.path.join(dest, resource_name)
+        if if_changed and os.path.exists(dest_path):
+            with open(file_path, 'rb') as src, open(dest_path, 'rb') as dst:
+                if src.read() == dst.read():
+                    return
+        shutil.copy(file_path, dest_path)
+
+    # normally installed as plain files; avoid importing importlib.resources
+    file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'resources', resource_name)
+    if os.path.isfile(file_path):
+        copy(file_path)
+        return file_path
+    import importlib.resources as pkg_resources # pylint: disable=import-outside-toplevel
     with pkg_resources.path('pwr_tray.resources', resource_name) as file_path:
-        shutil.copy(file_path, os.path.join(dest, resource_name))
+        copy(file_path)
     return file_path
 
 
@@ -36,72 +55,181 @@ def where(above=0):
     """Get the file and line of the caller. Arguments:
      -  above -- how many frames to go up (or down) from the reference
         frame (which is 2 above). above=0 means the caller of the
-        caller of the function (which is the frame ofkjk interest usually).
-    Then keep going up until we get out of this file if possible
+        caller of the function (which is the frame of interest usually).
+    Uses sys._getframe() which is far cheaper than inspect.stack().
     Returns:
         [file:line]
     """
-    stack, frameNo = inspect.stack(), 2 + above
-    if frameNo < 0 or len(stack) < frameNo + 2:
+    try:
+        frame = sys._getframe(2 + above) # pylint: disable=protected-access
+    except ValueError:
         return '[n/a]'
-    filename, line_number = stack[frameNo][1:3]
-        # lg.db(f'YES {os.path.basename(filename)}:{line_number}')
-    return f'[{filename.split("/")[-1]}:{line_number}]'
-    # return f'[:{line_number}]'
+    return f'[{frame.f_code.co_filename.split("/")[-1]}:{frame.f_lineno}]'
+
+
+class _LogWriter(threading.Thread):
+    """ Drains the log queue, writing in batches with one flush per batch,
+    and rotates the log file by a running byte count. """
+    def __init__(self):
+        super().__init__(name='prt-writer', daemon=True)
+        self.queue = queue.Queue(maxsize=prt_queue_max)
+        self.dropped = 0
+        self.nbytes = 0
+        self.to_file = False
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < 256:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self.write(batch)
+
+    def write(self, batch):
+        events = []
+        out = sys.stdout
+        try:
+            if self.dropped:
+                out.write(f'WARN: {self.dropped} log lines dropped\n')
+                self.dropped = 0
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    events.append(item)
+                    continue
+                out.write(item)
+                self.nbytes += len(item)
+            out.flush()
+        except Exception:
+            pass
+        if self.to_file and self.nbytes > prt_kb*1024:
+            self.rotate()
+        for event in events:
+            event.set()
+
+    def rotate(self):
+        """ Shift debug.log -> debug.log1 -> ... debug.logN (optionally
+        gzipped) and reopen; the count is re-synced with the file size
+        since children write to the same fd. """
+        try:
+            self.nbytes = os.fstat(sys.stdout.fileno()).st_size
+            if self.nbytes <= prt_kb*1024:
+                return
+            ext = '.gz' if prt_compress else ''
+            for gen in range(max(prt_gens, 1), 1, -1):
+                older = f'{prt_path}{gen-1}{ext}'
+                if os.path.exists(older):
+                    os.replace(older, f'{prt_path}{gen}{ext}')
+            if prt_compress:
+                with open(prt_path, 'rb') as src, gzip.open(f'{prt_path}1.gz', 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+                os.unlink(prt_path)
+            else:
+                shutil.move(prt_path, f'{prt_path}1')
+            _reopen()
+        except Exception:
+            pass
+
+
+_writer = None
+_stdout_checked = False
+_stamp = [0, ''] # [epoch secs, formatted] so strftime runs once a second
+
+
+def _reopen():
+    global prt_to_init
+    sys.stdout = open(prt_path, "a+", encoding='utf-8')
+    sys.stderr = sys.stdout
+    os.dup2(sys.stdout.fileno(), 1)
+    os.dup2(sys.stderr.fileno(), 2)
+    prt_to_init = False
+    if _writer:
+        _writer.to_file = True
+        _writer.nbytes = os.fstat(sys.stdout.fileno()).st_size
+
+
+def _check_stdout(use_stdout=None):
+    """ Decide (once, or when forced) whether stdout is redirected to the log """
+    global _stdout_checked
+    def is_tty():
+        try:
+            os.ttyname(sys.stdout.fileno())
+            return True
+        except Exception:
+            return False
+    def is_reg():
+        try:
+            return stat.S_ISREG(os.fstat(sys.stdout.fileno()).st_mode)
+        except Exception:
+            return False
+
+    if prt_kb > 0 and prt_path: # non-positive disables stdout "tuning"
+        _stdout_checked = True
+        if use_stdout is False:
+            _reopen()
+        elif prt_to_init and sys.stdout.closed: # Check if stdout is closed
+            _reopen()
+        elif prt_to_init and not is_tty() and not is_reg():
+            _reopen()
+
+
+def _emit(args, kwargs, above):
+    global _writer
+    to_stdout = kwargs.pop('to_stdout', None)
+    if to_stdout is not None or (not _stdout_checked and prt_path):
+        _check_stdout(None if to_stdout is None else bool(to_stdout))
+    if _writer is None:
+        _writer = _LogWriter()
+        _writer.to_file = bool(prt_path) and not prt_to_init
+        if _writer.to_file:
+            _writer.nbytes = os.fstat(sys.stdout.fileno()).st_size
+        _writer.start()
+
+    now = int(time.time())
+    if now != _stamp[0]:
+        _stamp[0], _stamp[1] = now, time.strftime('%m-%d^%H:%M:%S', time.localtime(now))
+    sep = kwargs.get('sep', ' ')
+    line = f'{_stamp[1]} {sep.join(str(arg) for arg in args)}  {where(above+1)}\n'
+    try:
+        _writer.queue.put_nowait(line)
+    except queue.Full:
+        _writer.dropped += 1
 
 
 def prt(*args, **kwargs):
     """ Our custom print routine ...
      - use instead of print() to get time stamps.
      - unless stdout is a tty, say for debugging, ~/.config/pwr-tray/debug.log is used for stdout
-     - if we create a log file, its size is limited to 512K and then it is truncated
+     - if we create a log file, its size is limited to 'prt_kb' and then it is
+       rotated keeping 'prt_gens' generations (gzipped if 'prt_compress')
+     - lines are queued and written by a background thread
+     - level=DEBUG (etc.) lines are skipped, unformatted, below 'prt_level'
      """
-    def check_stdout(use_stdout=None):
-        global prt_to_init
-        def is_tty():
-            try:
-                os.ttyname(sys.stdout.fileno())
-                return True
-            except Exception:
-                return False
-        def is_reg():
-            try:
-                return stat.S_ISREG(os.fstat(sys.stdout.fileno()).st_mode)
-            except Exception:
-                return False
-        def reopen():
-            global prt_to_init
-            sys.stdout = open(prt_path, "a+", encoding='utf-8')
-            sys.stderr = sys.stdout
-            os.dup2(sys.stdout.fileno(), 1)
-            os.dup2(sys.stderr.fileno(), 2)
-            prt_to_init = False
-
-        if prt_kb > 0 and prt_path: # non-positive disables stdout "tuning"
-            if use_stdout is False:
-                reopen()
-            elif prt_to_init and sys.stdout.closed: # Check if stdout is closed
-                reopen()
-            elif prt_to_init and not is_tty() and not is_reg():
-                reopen()
-            if os.fstat(sys.stdout.fileno()).st_size > prt_kb*1024:
-                shutil.move(prt_path, f'{prt_path}1')
-                reopen()
-
-    to_stdout = None
-    if 'to_stdout' in kwargs:
-        to_stdout = bool(kwargs['to_stdout'])
-        del kwargs['to_stdout']
-    check_stdout(to_stdout)
-
-    dt = datetime.now().strftime('%m-%d^%H:%M:%S')
-    s = StringIO()
-    print(dt, end=' ', file=s)
-    kwargs['end'] = ' '
-    kwargs['file'] = s
-    print(*args, **kwargs)
-    string = f'{s.getvalue()} {where()}'
-    print(string, flush=True)
+    if kwargs.get('level', INFO) < prt_level:
+        return
+    kwargs.pop('level', None)
+    _emit(args, kwargs, 0)
+
+
+def dbg(*args, **kwargs):
+    """ prt() at DEBUG level, prefixed with 'DB' """
+    if prt_level > DEBUG:
+        return
+    _emit(('DB',) + args, kwargs, 0)
+
+
+def prt_flush(timeout=2.0):
+    """ Wait (briefly) until the queued lines are written """
+    if _writer and _writer.is_alive():
+        event = threading.Event()
+        try:
+            _writer.queue.put(event, timeout=timeout)
+            event.wait(timeout)
+        except queue.Full:
+            pass
+
+atexit.register(prt_flush)
 
 def x_restart_self():
     """ TBD """
@@ -111,52 +239,3 @@ def x_restart_self():
 
     # Use subprocess to run the script with the same arguments
     subprocess.run([sys.executable, script_name] + script_args, check=True)
-
-class PyKill:
-    """Class to kill python scripts and explain how; avoids suicide. """
-    def __init__(self):
-        self.last_sig = {} # keyed by target
-        self.alive = {} # ps line of found targets
-
-    def _kill_script(self, targets, sig):
-        """ one iteration through very instance of the remaining processes """
-        def kill_pid(pid, sig):
-            # terminate the process
-            alive = True
-            try:
-                os.kill(pid, sig)
-            except OSError:
-                alive = False
-            return alive
-        self.alive = {} # reset each time thru
-        for line in os.popen("ps -eo pid,args"):
-            words = line.split()
-            if len(words) < 3:
-                continue
-            pid, cmd = int(words[0]), os.path.basename(words[1])
-            if pid == os.getpid():
-                continue  # no suicides
-            script = os.path.basename(words[2])
-            for target in targets:
-                if cmd in ('python', 'python3') and script in (target, f'{target}.py'):
-                    self.last_sig[target] = sig
-                    if kill_pid(pid, sig): # returns True if alive
-                        self.alive[target] = line
-        return self.alive
-
-    def kill_loop(self, targets):
-        """Loops thru the remaining process until all or gone or we
-        become exhausted (e.g., unkillable processes)."""
-        targets = targets if isinstance(targets, (list, tuple)) else [targets]
-        for sig in [signal.SIGTERM, signal.SIGTERM, signal.SIGTERM,
-                    signal.SIGKILL, signal.SIGKILL,]:
-            if not self._kill_script(targets, sig):
-                break
-            time.sleep(1)
-        for target, line in self.alive.items():
-            prt(f'ALERT: running: {line} [sig={self.last_sig[target]}]')
-        for target in targets:
-            if target in self.alive:
-                continue
-            prt(f'INFO: gone: {target} [sig={self.last_sig.get(target, None)}]')
-        return not bool(self.alive)
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Idle time and idle threshold alarms on Wayland, in-process, via the
+ext-idle-notify-v1 protocol (sway, Hyprland, KDE 6, ...); the Wayland
+counterpart of X11Tool.XSyncIdle, used when 'idle_method' is 'ext-idle'.
+
+This speaks the Wayland wire protocol directly over $WAYLAND_DISPLAY (only
+the handful of requests needed: get_registry, sync, bind, and the idle
+notifier's), so it needs neither libwayland nor a new dependency.
+
+The compositor reports only "idle for T" (idled) and "active again"
+(resumed) per notification, so:
+ - a short 'base' notification tells when the idle period began, which
+   gives idle_ms() to within a second, and the return of the user;
+ - each threshold armed gets its own notification; if armed while already
+   idle, its timeout is shortened by the idle time so far (the compositor
+   counts from creation) and restored in place on the next resume.
+"""
+# pylint: disable=invalid-name,broad-exception-caught
+import os
+import time
+import socket
+import struct
+from PyQt5.QtCore import QObject, QSocketNotifier
+from pwr_tray.Utils import prt
+
+DISPLAY_ID = 1
+NOTIFIER_IFACE = 'ext_idle_notifier_v1'
+SEAT_IFACE = 'wl_seat'
+# requests (by opcode)
+DISPLAY_SYNC, DISPLAY_GET_REGISTRY = 0, 1
+REGISTRY_BIND = 0
+NOTIFIER_GET_IDLE_NOTIFICATION = 1
+NOTIFICATION_DESTROY = 0
+# events (by opcode)
+DISPLAY_ERROR, DISPLAY_DELETE_ID = 0, 1
+REGISTRY_GLOBAL = 0
+CALLBACK_DONE = 0
+NOTIFICATION_IDLED, NOTIFICATION_RESUMED = 0, 1
+
+
+def socket_path():
+    """ Path of the compositor's socket per $WAYLAND_DISPLAY (or None) """
+    name = os.environ.get('WAYLAND_DISPLAY', '') or 'wayland-0'
+    if os.path.isabs(name):
+        return name
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR', '')
+    return os.path.join(runtime_dir, name) if runtime_dir else None
+
+
+def pack_message(object_id, opcode, *args):
+    """ A request; 'args' are ints (uint/object/new_id) or strs """
+    body = b''
+    for arg in args:
+        if isinstance(arg, str):
+            data = arg.encode('utf-8') + b'\0'
+            body += struct.pack('=I', len(data)) + data + b'\0' * (-len(data) % 4)
+        else:
+            body += struct.pack('=I', arg)
+    return struct.pack('=II', object_id, (8 + len(body)) << 16 | opcode) + body
+
+
+def unpack_string(body, offset):
+    """ (the string at 'offset' of an event body, the offset after it) """
+    size, = struct.unpack_from('=I', body, offset)
+    offset += 4
+    text = body[offset:offset+size-1].decode('utf-8', 'replace') if size else ''
+    return text, offset + size + (-size % 4)
+
+
+class Notification:
+    """ One ext_idle_notification_v1 """
+    __slots__ = ('oid', 'threshold_ms', 'timeout_ms', 'idled')
+
+    def __init__(self, oid, threshold_ms, timeout_ms):
+        self.oid, self.threshold_ms, self.timeout_ms = oid, threshold_ms, timeout_ms
+        self.idled = False
+
+
+class WaylandIdle(QObject):
+    """ Idle time and idle threshold alarms from ext-idle-notify-v1.
+     - on_alarm() is called (from the event loop) when an armed threshold
+       is crossed or the user returns from idle (once armed while idle).
+     - 'active' is False if there is no compositor or it lacks the protocol.
+     - on_lost() is called if the compositor drops the connection (after
+       which this object is dead; idle_ms() reads 0). """
+    base_ms = 1000 # the notification that marks the start of an idle period
+
+    def __init__(self, on_alarm, on_lost=None, path=None, timeout_s=1.0):
+        super().__init__()
+        self.on_alarm, self.on_lost = on_alarm, on_lost
+        self.active = False
+        self.sock, self.notifier, self.buf = None, None, b''
+        self.next_id, self.free_ids = 2, []
+        self.handlers = {} # object id -> event handler
+        self.globals = {} # interface -> (name, version)
+        self.synced = set() # callback ids that are done
+        self.base, self.alarms = None, {} # threshold_ms -> Notification
+        self.idle_since = None # monotonic start of the idle period
+        self.want_return = False
+        self.notifier_id, self.seat_id = None, None
+        path = path if path else socket_path()
+        if not path:
+            return
+        try:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(timeout_s)
+            self.sock.connect(path)
+            registry_id = self._new_id(self._on_registry)
+            self._send(DISPLAY_ID, DISPLAY_GET_REGISTRY, registry_id)
+            self._roundtrip()
+            if NOTIFIER_IFACE not in self.globals or SEAT_IFACE not in self.globals:
+                prt(f'WARN: WaylandIdle: compositor lacks {NOTIFIER_IFACE}')
+                self.close()
+                return
+            self.notifier_id = self._bind(registry_id, NOTIFIER_IFACE, 1, None)
+            self.seat_id = self._bind(registry_id, SEAT_IFACE, 1, lambda *_: None)
+            self.base = self._create(self.base_ms, self.base_ms)
+            self._roundtrip()
+        except Exception as exc:
+            prt(f'WARN: WaylandIdle: cannot use {path!r}: {exc}')
+            self.close()
+            return
+        self.sock.setblocking(False)
+        self.notifier = QSocketNotifier(self.sock.fileno(), QSocketNotifier.Read)
+        self.notifier.activated.connect(self._drain)
+        self.active = True
+        prt(f'WaylandIdle: idle alarms via {NOTIFIER_IFACE} on {path}')
+
+    def _new_id(self, handler):
+        oid = self.free_ids.pop() if self.free_ids else self.next_id
+        if oid == self.next_id:
+            self.next_id += 1
+        self.handlers[oid] = handler
+        return oid
+
+    def _send(self, object_id, opcode, *args):
+        self.sock.sendall(pack_message(object_id, opcode, *args))
+
+    def _bind(self, registry_id, interface, version, handler):
+        name, offered = self.globals[interface]
+        oid = self._new_id(handler)
+        self._send(registry_id, REGISTRY_BIND, name, interface,
+                   min(version, offered), oid)
+        return oid
+
+    def _roundtrip(self):
+        """ Block until the compositor has handled our requests so far
+        (only while starting; later, events arrive via the notifier) """
+        callback_id = self._new_id(None)
+        self.handlers[callback_id] = lambda _opcode, _body: self.synced.add(callback_id)
+        self._send(DISPLAY_ID, DISPLAY_SYNC, callback_id)
+        while callback_id not in self.synced:
+            data = self.sock.recv(4096)
+            if not data:
+                raise ConnectionError('compositor closed the connection')
+            self.buf += data
+            self._dispatch()
+        self.synced.discard(callback_id)
+
+    def _create(self, threshold_ms, timeout_ms):
+        oid = self._new_id(None)
+        note = Notification(oid, threshold_ms, timeout_ms)
+        self.handlers[oid] = lambda opcode, _body: self._on_notification(note, opcode)
+        self._send(self.notifier_id, NOTIFIER_GET_IDLE_NOTIFICATION,
+                   oid, max(1, int(timeout_ms)), self.seat_id)
+        return note
+
+    def _destroy(self, note):
+        self._send(note.oid, NOTIFICATION_DESTROY)
+        self.handlers[note.oid] = None # until the compositor's delete_id
+
+    def _dispatch(self):
+        while len(self.buf) >= 8:
+            oid, word = struct.unpack_from('=II', self.buf)
+            size = word >> 16
+            if size < 8 or len(self.buf) < size:
+                return
+            body, self.buf = self.buf[8:size], self.buf[size:]
+            if oid == DISPLAY_ID:
+                self._on_display(word & 0xffff, body)
+                continue
+            handler = self.handlers.get(oid, None)
+            if handler:
+                handler(word & 0xffff, body)
+
+    def _on_display(self, opcode, body):
+        if opcode == DISPLAY_ERROR:
+            oid, code = struct.unpack_from('=II', body)
+            message, _ = unpack_string(body, 8)
+            raise ConnectionError(f'protocol error on {oid} ({code}): {message}')
+        if opcode == DISPLAY_DELETE_ID:
+            oid, = struct.unpack_from('=I', body)
+            if oid in self.handlers:
+                del self.handlers[oid]
+                self.free_ids.append(oid)
+
+    def _on_registry(self, opcode, body):
+        if opcode == REGISTRY_GLOBAL:
+            name, = struct.unpack_from('=I', body)
+            interface, offset = unpack_string(body, 4)
+            version, = struct.unpack_from('=I', body, offset)
+            if interface not in self.globals: # the first seat will do
+                self.globals[interface] = (name, version)
+
+    def _on_notification(self, note, opcode):
+        now = time.monotonic()
+        note.idled = opcode == NOTIFICATION_IDLED
+        if note is self.base:
+            if note.idled:
+                self.idle_since = now - self.base_ms / 1000
+                return
+            self.idle_since = None
+            self._restore_timeouts()
+            if self.want_return:
+                self.want_return = False
+                self.on_alarm()
+            return
+        if note.idled:
+            if self.idle_since is None: # idled before the base (shortened)
+                self.idle_since = now - note.threshold_ms / 1000
+            self.on_alarm()
+
+    def _restore_timeouts(self):
+        """ After a resume, re-create any shortened notifications with
+        their full thresholds """
+        for threshold_ms, note in list(self.alarms.items()):
+            if note.timeout_ms != threshold_ms:
+                self._destroy(note)
+                self.alarms[threshold_ms] = self._create(threshold_ms, threshold_ms)
+
+    def idle_ms(self):
+        """ Current idle time in ms (from the last events; no round trip) """
+        if self.idle_since is None:
+            return 0
+        return int((time.monotonic() - self.idle_since) * 1000)
+
+    def arm(self, thresholds_ms):
+        """ (Re)arm alarms at the given idle thresholds (ms) that are still
+        ahead, plus a "user returned" alarm if already idle; notifications
+        whose thresholds are unchanged are kept. """
+        if not self.active:
+            return
+        idle_ms = self.idle_ms()
+        ahead = {int(ms) for ms in thresholds_ms if ms > idle_ms}
+        try:
+            for threshold_ms in set(self.alarms) - ahead:
+                self._destroy(self.alarms.pop(threshold_ms))
+            for threshold_ms in ahead - set(self.alarms):
+                self.alarms[threshold_ms] = self._create(threshold_ms,
+                                                         threshold_ms - idle_ms)
+            self.want_return = idle_ms >= self.base_ms
+        except OSError as exc:
+            self._lost(exc)
+
+    def _drain(self, _fd=None):
+        try:
+            while True:
+                try:
+                    data = self.sock.recv(4096)
+                except BlockingIOError:
+                    break
+                if not data:
+                    raise ConnectionError('compositor closed the connection')
+                self.buf += data
+                self._dispatch()
+        except Exception as exc:
+            self._lost(exc)
+
+    def _lost(self, exc):
+        prt(f'WARN: WaylandIdle: {exc}')
+        self.close()
+        if self.on_lost:
+            self.on_lost()
+
+    def close(self):
+        """ Release the connection (the compositor drops its objects) """
+        if self.notifier:
+            self.notifier.setEnabled(False)
+            self.notifier = None
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+        self.alarms, self.idle_since = {}, None
+        self.active = False
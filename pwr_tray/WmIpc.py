@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+An in-process i3/sway IPC client on $SWAYSOCK (or $I3SOCK), so that
+commands like 'swaymsg reload' or 'i3-msg exit' are one write on a kept
+socket rather than a forked client (see wm_natives()), and so that
+fullscreen windows can be followed via 'window' events.
+
+Two connections are kept: one for commands (replies are read as they
+come and only failures logged; nothing waits) and one subscribed to
+'window' events.  The fullscreen containers are seeded from GET_TREE and
+kept current from the events; on_fullscreen(bool) is called whenever
+"some window is fullscreen" changes.  If the WM drops the connections
+(e.g., 'i3-msg restart'), they are re-opened a few times a second apart;
+meanwhile the last known fullscreen state holds (until the new GET_TREE
+answers, or reconnecting is given up).
+"""
+# pylint: disable=invalid-name,broad-exception-caught
+import os
+import json
+import socket
+import struct
+from PyQt5.QtCore import QObject, QSocketNotifier, QTimer
+from pwr_tray.Utils import prt
+
+MAGIC = b'i3-ipc'
+HEADER = struct.Struct('=6sII') # magic, payload length, type
+RUN_COMMAND, SUBSCRIBE, GET_TREE = 0, 2, 4
+EVENT_BIT, WINDOW_EVENT = 0x80000000, 3
+CLIENTS = ('swaymsg', 'i3-msg')
+
+
+def socket_path():
+    """ The WM's IPC socket per $SWAYSOCK/$I3SOCK (or None) """
+    for var in ('SWAYSOCK', 'I3SOCK'):
+        path = os.environ.get(var, '')
+        if path:
+            return path
+    return None
+
+
+def wm_natives(plans):
+    """ The commands of 'plans' that are plain 'swaymsg ...'/'i3-msg ...'
+    invocations (no options, no shell) as {key: ipc_command_text} """
+    natives = {}
+    for key, plan in plans.items():
+        argv = plan.argv if plan else None
+        if (argv and len(argv) > 1 and os.path.basename(argv[0]) in CLIENTS
+                and not any(arg.startswith('-') for arg in argv[1:])):
+            natives[key] = ' '.join(argv[1:])
+    return natives
+
+
+class Connection:
+    """ One IPC connection: framed writes, and framed messages (type,
+    payload) to on_message as they arrive """
+    def __init__(self, path, on_message, on_lost):
+        self.on_message, self.on_lost = on_message, on_lost
+        self.buf = b''
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(1.0)
+        self.sock.connect(path)
+        self.sock.setblocking(False)
+        self.notifier = QSocketNotifier(self.sock.fileno(), QSocketNotifier.Read)
+        self.notifier.activated.connect(self._drain)
+
+    def send(self, msg_type, payload=''):
+        """ One framed message (small, so one write) """
+        data = payload.encode('utf-8')
+        self.sock.sendall(HEADER.pack(MAGIC, len(data), msg_type) + data)
+
+    def _drain(self, _fd=None):
+        try:
+            while True:
+                try:
+                    data = self.sock.recv(65536)
+                except BlockingIOError:
+                    break
+                if not data:
+                    raise ConnectionError('the WM closed the IPC socket')
+                self.buf += data
+            while len(self.buf) >= HEADER.size:
+                magic, size, msg_type = HEADER.unpack_from(self.buf)
+                if magic != MAGIC:
+                    raise ConnectionError('bad IPC magic')
+                if len(self.buf) < HEADER.size + size:
+                    break
+                payload = self.buf[HEADER.size:HEADER.size+size]
+                self.buf = self.buf[HEADER.size+size:]
+                self.on_message(msg_type, payload)
+        except Exception as exc:
+            self.close()
+            self.on_lost(exc)
+
+    def close(self):
+        """ Drop the connection """
+        if self.notifier:
+            self.notifier.setEnabled(False)
+            self.notifier = None
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
+
+class WmIpc(QObject):
+    """ i3/sway IPC for commands and fullscreen tracking.
+     - 'active' is False if there is no socket or it cannot be used.
+     - 'fullscreen' is whether some window is fullscreen. """
+    retries = 5 # re-connects after a loss (one second apart)
+
+    def __init__(self, on_fullscreen=None, path=None):
+        super().__init__()
+        self.on_fullscreen = on_fullscreen
+        self.path = path if path else socket_path()
+        self.active, self.fullscreen = False, False
+        self.fullscreen_ids = set()
+        self.commands, self.events = None, None
+        self.pending = [] # command texts awaiting replies (in order)
+        self.retries_left = 0
+        if self.path:
+            self.connect()
+
+    def connect(self):
+        """ Open the connections (and subscribe); sets 'active' """
+        try:
+            self.commands = Connection(self.path, self._on_reply, self._lost)
+            if self.on_fullscreen:
+                self.events = Connection(self.path, self._on_event, self._lost)
+                self.events.send(SUBSCRIBE, '["window"]')
+                self.commands.send(GET_TREE)
+        except Exception as exc:
+            self.close()
+            if self.retries_left > 0:
+                self.retries_left -= 1
+                QTimer.singleShot(1000, self.connect)
+            else:
+                prt(f'WARN: WM IPC: cannot use {self.path!r}: {exc}')
+                self.fullscreen_ids.clear() # given up; nothing to follow
+                self._report()
+            return
+        self.active = True
+        prt(f'WM IPC: {self.path}' + (' (following fullscreen)' if self.on_fullscreen else ''))
+
+    def run(self, command):
+        """ Send 'command' (e.g., 'output * dpms off'); returns False if it
+        cannot be sent here (so the caller can fork the client instead) """
+        if not self.active:
+            return False
+        try:
+            self.commands.send(RUN_COMMAND, command)
+        except OSError as exc:
+            self._lost(exc)
+            return False
+        self.pending.append(command)
+        return True
+
+    def _on_reply(self, msg_type, payload):
+        try:
+            reply = json.loads(payload)
+        except ValueError:
+            return
+        if msg_type == GET_TREE:
+            self._seed(reply)
+            return
+        command = self.pending.pop(0) if self.pending else '?'
+        if msg_type == RUN_COMMAND:
+            for result in reply if isinstance(reply, list) else []:
+                if not result.get('success', False):
+                    prt(f'WARN: WM IPC {command!r}: {result.get("error", "failed")}')
+
+    def _seed(self, node):
+        """ Note the fullscreen containers of the tree from GET_TREE (which
+        replaces what was known, e.g., from before a reconnect) """
+        self.fullscreen_ids.clear()
+        nodes = [node]
+        while nodes:
+            node = nodes.pop()
+            if node.get('fullscreen_mode', 0) and node.get('type') in ('con', 'floating_con'):
+                self.fullscreen_ids.add(node.get('id'))
+            nodes += node.get('nodes', []) + node.get('floating_nodes', [])
+        self._report()
+
+    def _on_event(self, msg_type, payload):
+        if msg_type != EVENT_BIT | WINDOW_EVENT:
+            return # e.g., the reply to SUBSCRIBE
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            return
+        container = event.get('container', {})
+        con_id, change = container.get('id'), event.get('change', '')
+        if change == 'fullscreen_mode' and container.get('fullscreen_mode', 0):
+            self.fullscreen_ids.add(con_id)
+        elif change in ('fullscreen_mode', 'close'):
+            self.fullscreen_ids.discard(con_id)
+        else:
+            return
+        self._report()
+
+    def _report(self):
+        fullscreen = bool(self.fullscreen_ids)
+        if fullscreen != self.fullscreen:
+            self.fullscreen = fullscreen
+            prt(f'WM IPC: fullscreen={fullscreen}')
+            if self.on_fullscreen:
+                self.on_fullscreen(fullscreen)
+
+    def _lost(self, exc):
+        if not self.active:
+            return # the other connection noticed first
+        prt(f'WARN: WM IPC: {exc}')
+        self.close()
+        self.pending = [] # (fullscreen_ids stand until re-seeded)
+        self.retries_left = self.retries
+        QTimer.singleShot(1000, self.connect)
+
+    def close(self):
+        """ Drop both connections """
+        for conn in (self.commands, self.events):
+            if conn:
+                conn.close()
+        self.commands, self.events = None, None
+        self.active = False
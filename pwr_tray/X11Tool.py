@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+In-process X11 helpers (via ctypes against libX11/libXext) so that X11
+sessions need not fork 'xprintidle' and friends.
+
+XSyncIdle reads the XSync extension's IDLETIME system counter and arms
+alarms at the idle thresholds that matter (lock, blank, suspend, "moon"),
+plus a negative-transition alarm that fires when the user returns.  The X
+connection's fd is watched with a QSocketNotifier, so the tray is woken
+exactly when a threshold is crossed.  If libX11, the display, or the
+extension is missing, 'active' is False and the caller keeps using the
+configured command (e.g., xprintidle).  Pass 'display' (e.g., ':99') to
+run against a private server such as Xvfb.
+
+XSelectionWatch follows the owner of a selection such as
+_NET_SYSTEM_TRAY_S0 (the XEmbed system tray) via XFixes selection events.
+
+XControl replaces forking 'xset' for the usual reset_idle and monitors_off
+commands (see x11_natives()): it resets/activates the screen saver and
+forces the DPMS level over one kept-open connection, and a delay such as
+'sleep 1.0; ...' becomes a timer.
+"""
+# pylint: disable=invalid-name,broad-exception-caught,too-few-public-methods
+import re
+import ctypes
+import ctypes.util
+from types import SimpleNamespace
+from PyQt5.QtCore import QObject, QSocketNotifier, QTimer
+from pwr_tray.Utils import prt
+
+# XSync constants (from X11/extensions/sync.h)
+XSyncAbsolute = 0
+XSyncPositiveTransition, XSyncNegativeTransition = 0, 1
+XSyncCACounter, XSyncCAValueType, XSyncCAValue = 1 << 0, 1 << 1, 1 << 2
+XSyncCATestType, XSyncCADelta, XSyncCAEvents = 1 << 3, 1 << 4, 1 << 5
+XSyncAlarmNotify = 1
+# screen saver and DPMS constants (from X11/X.h and X11/extensions/dpmsconst.h)
+ScreenSaverReset, ScreenSaverActive = 0, 1
+DPMS_LEVELS = {'on': 0, 'standby': 1, 'suspend': 2, 'off': 3}
+# XFixes constants (from X11/extensions/Xfixes.h)
+XFixesSelectionNotify = 0
+XFixesSelectionAllMasks = 1 | 2 | 4 # owner set, window destroyed, client closed
+
+
+class XSyncValue(ctypes.Structure):
+    """ 64-bit XSync value as a hi/lo pair """
+    _fields_ = [('hi', ctypes.c_int), ('lo', ctypes.c_uint)]
+
+    @staticmethod
+    def of(val):
+        val = int(val)
+        return XSyncValue(val >> 32, val & 0xffffffff)
+
+    def value(self):
+        return (self.hi << 32) | self.lo
+
+
+class XSyncSystemCounter(ctypes.Structure):
+    """ An entry of XSyncListSystemCounters() """
+    _fields_ = [('name', ctypes.c_char_p), ('counter', ctypes.c_ulong),
+                ('resolution', XSyncValue)]
+
+
+class XSyncTrigger(ctypes.Structure):
+    """ The trigger part of the alarm attributes """
+    _fields_ = [('counter', ctypes.c_ulong), ('value_type', ctypes.c_int),
+                ('wait_value', XSyncValue), ('test_type', ctypes.c_int)]
+
+
+class XSyncAlarmAttributes(ctypes.Structure):
+    """ Argument of XSyncCreateAlarm() """
+    _fields_ = [('trigger', XSyncTrigger), ('delta', XSyncValue),
+                ('events', ctypes.c_int), ('state', ctypes.c_int)]
+
+
+class XEvent(ctypes.Structure):
+    """ Opaque XEvent (a union of 24 longs); we only need the type """
+    _fields_ = [('type', ctypes.c_int), ('pad', ctypes.c_long * 24)]
+
+
+XErrorHandler = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p)
+
+_libs = None
+_xfixes = None
+
+def load_libs():
+    """ Load and prototype libX11 and libXext once; returns the tuple
+    (x11, xext) or None if unavailable. """
+    global _libs # pylint: disable=global-statement
+    if _libs is not None:
+        return _libs or None
+    _libs = False
+    try:
+        x11 = ctypes.CDLL(ctypes.util.find_library('X11') or 'libX11.so.6')
+        xext = ctypes.CDLL(ctypes.util.find_library('Xext') or 'libXext.so.6')
+    except OSError as exc:
+        prt(f'WARN: X11 libs unavailable: {exc}')
+        return None
+    vp, ul, ip = ctypes.c_void_p, ctypes.c_ulong, ctypes.POINTER(ctypes.c_int)
+    x11.XOpenDisplay.argtypes, x11.XOpenDisplay.restype = [ctypes.c_char_p], vp
+    x11.XCloseDisplay.argtypes = [vp]
+    x11.XConnectionNumber.argtypes, x11.XConnectionNumber.restype = [vp], ctypes.c_int
+    x11.XPending.argtypes, x11.XPending.restype = [vp], ctypes.c_int
+    x11.XNextEvent.argtypes = [vp, ctypes.POINTER(XEvent)]
+    x11.XFlush.argtypes = [vp]
+    x11.XSetErrorHandler.argtypes, x11.XSetErrorHandler.restype = [XErrorHandler], vp
+    xext.XSyncQueryExtension.argtypes = [vp, ip, ip]
+    xext.XSyncInitialize.argtypes = [vp, ip, ip]
+    xext.XSyncListSystemCounters.argtypes = [vp, ip]
+    xext.XSyncListSystemCounters.restype = ctypes.POINTER(XSyncSystemCounter)
+    xext.XSyncFreeSystemCounterList.argtypes = [ctypes.POINTER(XSyncSystemCounter)]
+    xext.XSyncQueryCounter.argtypes = [vp, ul, ctypes.POINTER(XSyncValue)]
+    xext.XSyncCreateAlarm.argtypes = [vp, ul, ctypes.POINTER(XSyncAlarmAttributes)]
+    xext.XSyncCreateAlarm.restype = ul
+    xext.XSyncDestroyAlarm.argtypes = [vp, ul]
+    x11.XDefaultScreen.argtypes, x11.XDefaultScreen.restype = [vp], ctypes.c_int
+    x11.XDefaultRootWindow.argtypes, x11.XDefaultRootWindow.restype = [vp], ul
+    x11.XInternAtom.argtypes = [vp, ctypes.c_char_p, ctypes.c_int]
+    x11.XInternAtom.restype = ul
+    x11.XGetSelectionOwner.argtypes, x11.XGetSelectionOwner.restype = [vp, ul], ul
+    x11.XResetScreenSaver.argtypes = [vp]
+    x11.XForceScreenSaver.argtypes = [vp, ctypes.c_int]
+    xext.DPMSQueryExtension.argtypes = [vp, ip, ip]
+    xext.DPMSCapable.argtypes = [vp]
+    xext.DPMSEnable.argtypes = [vp]
+    xext.DPMSForceLevel.argtypes = [vp, ctypes.c_ushort]
+    xext.DPMSInfo.argtypes = [vp, ctypes.POINTER(ctypes.c_ushort),
+                              ctypes.POINTER(ctypes.c_ubyte)]
+    x11.XSetErrorHandler(_on_x_error)
+    _libs = (x11, xext)
+    return _libs
+
+
+def load_xfixes():
+    """ Load and prototype libXfixes once; None if unavailable """
+    global _xfixes # pylint: disable=global-statement
+    if _xfixes is not None:
+        return _xfixes or None
+    _xfixes = False
+    try:
+        xfixes = ctypes.CDLL(ctypes.util.find_library('Xfixes') or 'libXfixes.so.3')
+    except OSError as exc:
+        prt(f'WARN: libXfixes unavailable: {exc}')
+        return None
+    vp, ip = ctypes.c_void_p, ctypes.POINTER(ctypes.c_int)
+    xfixes.XFixesQueryExtension.argtypes = [vp, ip, ip]
+    xfixes.XFixesSelectSelectionInput.argtypes = [vp, ctypes.c_ulong,
+                                                  ctypes.c_ulong, ctypes.c_ulong]
+    _xfixes = xfixes
+    return _xfixes
+
+
+@XErrorHandler
+def _on_x_error(_display, _event):
+    # the default handler exits the process; just note it
+    prt('WARN: X11 protocol error (ignored)')
+    return 0
+
+
+class XSyncIdle(QObject):
+    """ Idle time and idle threshold alarms from the XSync IDLETIME counter.
+     - on_alarm() is called (from the event loop) when an armed threshold
+       is crossed or the user returns from idle. """
+    def __init__(self, on_alarm, display=None):
+        super().__init__()
+        self.on_alarm = on_alarm
+        self.active = False
+        self.dpy, self.counter, self.event_base = None, None, 0
+        self.alarms, self.armed = [], None
+        self.notifier = None
+        libs = load_libs()
+        if not libs:
+            return
+        self.x11, self.xext = libs
+        self.dpy = self.x11.XOpenDisplay(display.encode() if display else None)
+        if not self.dpy:
+            prt('WARN: XSyncIdle: cannot open display')
+            return
+        event_base, error_base = ctypes.c_int(), ctypes.c_int()
+        major, minor = ctypes.c_int(), ctypes.c_int()
+        if (not self.xext.XSyncQueryExtension(self.dpy,
+                    ctypes.byref(event_base), ctypes.byref(error_base))
+                or not self.xext.XSyncInitialize(self.dpy,
+                    ctypes.byref(major), ctypes.byref(minor))):
+            prt('WARN: XSyncIdle: no XSync extension')
+            self.close()
+            return
+        self.event_base = event_base.value
+        self.counter = self._find_counter(b'IDLETIME')
+        if not self.counter:
+            prt('WARN: XSyncIdle: no IDLETIME counter')
+            self.close()
+            return
+        self.notifier = QSocketNotifier(self.x11.XConnectionNumber(self.dpy),
+                                        QSocketNotifier.Read)
+        self.notifier.activated.connect(self._drain)
+        self.active = True
+        prt(f'XSyncIdle: IDLETIME alarms (XSync {major.value}.{minor.value})')
+
+    def _find_counter(self, name):
+        count = ctypes.c_int()
+        counters = self.xext.XSyncListSystemCounters(self.dpy, ctypes.byref(count))
+        if not counters:
+            return None
+        rv = None
+        for idx in range(count.value):
+            if counters[idx].name == name:
+                rv = counters[idx].counter
+                break
+        self.xext.XSyncFreeSystemCounterList(counters)
+        return rv
+
+    def idle_ms(self):
+        """ Current idle time in ms (one round trip; no fork) """
+        value = XSyncValue()
+        self.xext.XSyncQueryCounter(self.dpy, self.counter, ctypes.byref(value))
+        self._drain()
+        return value.value()
+
+    def _create_alarm(self, wait_ms, test_type):
+        attrs = XSyncAlarmAttributes()
+        attrs.trigger.counter = self.counter
+        attrs.trigger.value_type = XSyncAbsolute
+        attrs.trigger.wait_value = XSyncValue.of(wait_ms)
+        attrs.trigger.test_type = test_type
+        attrs.delta = XSyncValue.of(0)
+        attrs.events = 1
+        flags = (XSyncCACounter | XSyncCAValueType | XSyncCAValue
+                 | XSyncCATestType | XSyncCADelta | XSyncCAEvents)
+        self.alarms.append(self.xext.XSyncCreateAlarm(self.dpy, flags,
+                                                      ctypes.byref(attrs)))
+
+    def arm(self, thresholds_ms):
+        """ (Re)arm alarms at the given idle thresholds (ms) that are still
+        ahead, plus a "user returned" alarm if already idle. """
+        idle_ms = self.idle_ms()
+        ahead = sorted({int(ms) for ms in thresholds_ms if ms > idle_ms})
+        returned_ms = idle_ms - 1 if idle_ms >= 1000 else None
+        armed = (tuple(ahead), returned_ms is not None)
+        if armed == self.armed and returned_ms is None:
+            return # nothing new to arm
+        self.disarm()
+        for wait_ms in ahead:
+            self._create_alarm(wait_ms, XSyncPositiveTransition)
+        if returned_ms is not None:
+            self._create_alarm(returned_ms, XSyncNegativeTransition)
+        self.armed = armed
+        self.x11.XFlush(self.dpy)
+
+    def disarm(self):
+        """ Destroy any armed alarms """
+        for alarm in self.alarms:
+            self.xext.XSyncDestroyAlarm(self.dpy, alarm)
+        self.alarms, self.armed = [], None
+
+    def _drain(self, _fd=None):
+        fired, event = False, XEvent()
+        while self.dpy and self.x11.XPending(self.dpy):
+            self.x11.XNextEvent(self.dpy, ctypes.byref(event))
+            if event.type == self.event_base + XSyncAlarmNotify:
+                fired = True
+        if fired:
+            self.armed = None # must re-arm
+            self.on_alarm()
+
+    def close(self):
+        """ Release the X connection """
+        if self.notifier:
+            self.notifier.setEnabled(False)
+            self.notifier = None
+        if self.dpy:
+            self.disarm()
+            self.x11.XCloseDisplay(self.dpy)
+            self.dpy = None
+        self.active = False
+
+
+class XSelectionWatch(QObject):
+    """ Follows the owner of a selection; 'name' may contain '{screen}'
+    for the default screen (e.g., '_NET_SYSTEM_TRAY_S{screen}').
+     - owner is the owning window (0 if none)
+     - on_change(owner) is called (from the event loop) on each change """
+    def __init__(self, name, on_change, display=None):
+        super().__init__()
+        self.on_change = on_change
+        self.active, self.owner = False, 0
+        self.dpy, self.notifier, self.event_base = None, None, 0
+        libs, xfixes = load_libs(), load_xfixes()
+        if not libs or not xfixes:
+            return
+        self.x11 = libs[0]
+        self.dpy = self.x11.XOpenDisplay(display.encode() if display else None)
+        if not self.dpy:
+            return
+        event_base, error_base = ctypes.c_int(), ctypes.c_int()
+        if not xfixes.XFixesQueryExtension(self.dpy, ctypes.byref(event_base),
+                                           ctypes.byref(error_base)):
+            prt('WARN: XSelectionWatch: no XFixes extension')
+            self.close()
+            return
+        self.event_base = event_base.value
+        name = name.format(screen=self.x11.XDefaultScreen(self.dpy))
+        self.atom = self.x11.XInternAtom(self.dpy, name.encode(), 0)
+        xfixes.XFixesSelectSelectionInput(self.dpy, self.x11.XDefaultRootWindow(self.dpy),
+                                          self.atom, XFixesSelectionAllMasks)
+        self.owner = self.x11.XGetSelectionOwner(self.dpy, self.atom)
+        self.x11.XFlush(self.dpy)
+        self.notifier = QSocketNotifier(self.x11.XConnectionNumber(self.dpy),
+                                        QSocketNotifier.Read)
+        self.notifier.activated.connect(self._drain)
+        self.active = True
+
+    def _drain(self, _fd=None):
+        changed, event = False, XEvent()
+        while self.dpy and self.x11.XPending(self.dpy):
+            self.x11.XNextEvent(self.dpy, ctypes.byref(event))
+            if event.type == self.event_base + XFixesSelectionNotify:
+                changed = True
+        if changed:
+            self.owner = self.x11.XGetSelectionOwner(self.dpy, self.atom)
+            self.on_change(self.owner)
+
+    def close(self):
+        """ Release the X connection """
+        if self.notifier:
+            self.notifier.setEnabled(False)
+            self.notifier = None
+        if self.dpy:
+            self.x11.XCloseDisplay(self.dpy)
+            self.dpy = None
+        self.active = False
+
+
+XSET_RE = re.compile(r'^(?:sleep\s+(?P<delay>[\d.]+)\s*;\s*)?(?:exec\s+)?xset\s+'
+                     r'(?:s\s+(?P<saver>reset|activate)'
+                     r'|dpms\s+force\s+(?P<level>on|off|standby|suspend))\s*$')
+
+
+def x11_natives(plans):
+    """ The commands of 'plans' that XControl can do itself (plain 'xset
+    s reset', 'xset dpms force off', ... with an optional 'sleep N;' in
+    front) as {key: SimpleNamespace(saver, level, delay_s)} """
+    natives = {}
+    for key, plan in plans.items():
+        match = XSET_RE.match(plan.text.strip()) if plan and plan.text else None
+        if match:
+            natives[key] = SimpleNamespace(saver=match.group('saver'),
+                    level=match.group('level'), delay_s=float(match.group('delay') or 0))
+    return natives
+
+
+class XControl:
+    """ Screen saver and DPMS control over one X connection ('dpy' may be
+    one already open, e.g., XSyncIdle's, which is then not closed here).
+    'active' is False if libX11/the display is unavailable. """
+    def __init__(self, dpy=None, display=None):
+        self.active, self.owned, self.dpms = False, False, False
+        self.dpy, self.timer, self.pending = None, None, None
+        libs = load_libs()
+        if not libs:
+            return
+        self.x11, self.xext = libs
+        self.dpy = dpy
+        if not self.dpy:
+            self.dpy = self.x11.XOpenDisplay(display.encode() if display else None)
+            self.owned = True
+        if not self.dpy:
+            return
+        event_base, error_base = ctypes.c_int(), ctypes.c_int()
+        self.dpms = bool(self.xext.DPMSQueryExtension(self.dpy,
+                ctypes.byref(event_base), ctypes.byref(error_base))
+                and self.xext.DPMSCapable(self.dpy))
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(lambda: self._do(self.pending))
+        self.active = True
+
+    def run(self, native):
+        """ Do what x11_natives() found, after its delay (if any); returns
+        False if it cannot be done here. """
+        if not self.active or (native.level and not self.dpms):
+            return False
+        if native.delay_s > 0: # replaces any pending one
+            self.pending = native
+            self.timer.start(int(native.delay_s * 1000))
+        else:
+            if native.level: # e.g., 'on' cancels a pending 'off'
+                self.timer.stop()
+            self._do(native)
+        return True
+
+    def _do(self, native):
+        if native.saver == 'reset':
+            self.x11.XResetScreenSaver(self.dpy)
+        elif native.saver == 'activate':
+            self.x11.XForceScreenSaver(self.dpy, ScreenSaverActive)
+        elif native.level:
+            self.xext.DPMSEnable(self.dpy) # as 'xset dpms force' does
+            self.xext.DPMSForceLevel(self.dpy, DPMS_LEVELS[native.level])
+        self.x11.XFlush(self.dpy)
+
+    def dpms_level(self):
+        """ The current DPMS level name (or None if no DPMS) """
+        if not self.active or not self.dpms:
+            return None
+        level, state = ctypes.c_ushort(), ctypes.c_ubyte()
+        self.xext.DPMSInfo(self.dpy, ctypes.byref(level), ctypes.byref(state))
+        names = {val: name for name, val in DPMS_LEVELS.items()}
+        return names.get(level.value, None)
+
+    def close(self):
+        """ Release the X connection (if ours) """
+        if self.timer:
+            self.timer.stop()
+        if self.dpy and self.owned:
+            self.x11.XCloseDisplay(self.dpy)
+        self.dpy = None
+        self.active = False
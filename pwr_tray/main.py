@@ -12,6 +12,9 @@ This code is designed to control power matters from the tray.
 
 import os
 import sys
+import time
+import math
+STARTED_MONO = time.monotonic() # for the start-up profile
 needed = '/usr/lib/python3/dist-packages'
 if needed not in sys.path:
     sys.path.append(needed) # pick up external dependencies
@@ -20,20 +23,39 @@ import re
 import subprocess
 import json
 import shutil
-from ruamel.yaml import YAML
 import atexit
-import time
-import traceback
 from types import SimpleNamespace
-import psutil
-from PyQt5.QtWidgets import QApplication, QSystemTrayIcon, QMenu, QAction #, QMessageBox
-from PyQt5.QtGui import QIcon, QCursor
-from PyQt5.QtCore import QTimer
+from collections import deque
+from PyQt5.QtWidgets import QApplication, QSystemTrayIcon, QMenu #, QMessageBox
+from PyQt5.QtGui import QCursor
 
 import pwr_tray.Utils as Utils
-from pwr_tray.Utils import prt, PyKill
-from pwr_tray.SwayIdleMgr import SwayIdleManager
+from pwr_tray.Utils import prt, dbg
 from pwr_tray.IniTool import IniTool
+from pwr_tray.Logind import InhibitorWatcher, SleepWatcher
+from pwr_tray.Battery import SysfsBattery
+from pwr_tray.Mpris import MprisWatcher
+from pwr_tray.Scheduler import DeadlineScheduler
+from pwr_tray.ConfigWatcher import ConfigWatcher
+from pwr_tray.TrayWatcher import TrayWatcher
+from pwr_tray.Instance import Instance, request
+from pwr_tray.CmdRunner import CmdRunner, compile_plans
+from pwr_tray.ProbeRunner import ProbeRunner
+import pwr_tray.Policy as Policy
+from pwr_tray.TickStats import TickStats, note_spawn, show_file
+import pwr_tray.DeCache as DeCache
+import pwr_tray.DBusTool as DBusTool
+from pwr_tray.IconCache import IconCache
+from pwr_tray.KeyedMenu import KeyedMenu
+
+startup_phases = [] # (name, secs) in start-up order
+_phase_mono = [STARTED_MONO]
+
+def startup_phase(name):
+    """ Charge the time since the previous phase to 'name' """
+    now = time.monotonic()
+    startup_phases.append((name, now - _phase_mono[0]))
+    _phase_mono[0] = now
 
 class PwrTray:
     """ pwr-tray main class.
@@ -50,22 +72,41 @@ class PwrTray:
                           'UnlockedMoon', # LockOnly and Locking Soon
                           'StopSign',     # systemd inhibited
                           ] )
+    # alternate icon sets ([Settings] icon_set): a base maps to an svg of the
+    # subdir or to another base (e.g., the moons use the plain mode icons);
+    # unlisted bases use the default icons
+    icon_sets = {'SetA': {'SettingSun': 'pwr-uninh', 'FullSun': 'pwr-inh',
+                          'Unlocked': 'pwr-no-sleep', 'RisingMoon': 'SettingSun',
+                          'UnlockedMoon': 'Unlocked'},
+                 'SetB': {'SettingSun': 'NormMode', 'Unlocked': 'LockOnlyMode',
+                          'GoingDown': 'LoBattery', 'RisingMoon': 'SettingSun',
+                          'UnlockedMoon': 'Unlocked'},
+                 'SetC': {'SettingSun': 'New-NormMode', 'FullSun': 'New-PresMode',
+                          'Unlocked': 'New-LockOnly', 'GoingDown': 'New-LowBattery',
+                          'RisingMoon': 'SettingSun', 'UnlockedMoon': 'Unlocked'},
+                }
     singleton = None
+    instance = None # the Instance lock/control socket
 
     @staticmethod
-    def load_de_config(config_dir):
-        """Load DE commands YAML config.
-        - Always copies default commands.yaml to config dir (so user sees latest)
-        - If my-commands.yaml exists in config dir, loads that instead
+    def de_config_path(config_dir):
+        """The DE commands YAML in effect.
+        - Copies default commands.yaml to config dir if changed (so user sees latest)
+        - If my-commands.yaml exists in config dir, that is used instead
         """
-        yaml = YAML()
-        Utils.copy_to_folder('commands.yaml', config_dir)
+        Utils.copy_to_folder('commands.yaml', config_dir, if_changed=True)
         user_yaml = os.path.join(config_dir, 'my-commands.yaml')
         if not os.path.exists(user_yaml):
             user_yaml = os.path.join(config_dir, 'commands.yaml')
+        return user_yaml
+
+    @staticmethod
+    def load_de_config(user_yaml):
+        """Load DE commands YAML config."""
+        from ruamel.yaml import YAML # pylint: disable=import-outside-toplevel
         prt(f'loading DE config: {user_yaml}')
         with open(user_yaml, 'r', encoding='utf-8') as f:
-            return dict(yaml.load(f))
+            return dict(YAML().load(f))
 
     @staticmethod
     def detect_de(de_json, force_de=None):
@@ -95,6 +136,8 @@ class PwrTray:
             must = (de_json['defaults'].get('must_haves', [])
                     + scfg.get('must_haves', [])
                     + entry.get('must_haves', []))
+            if merged.get('idle_method') == 'ext-idle': # in-process instead
+                must = [cmd for cmd in must if cmd != 'swayidle']
             merged['must_haves'] = sorted(set(must))
             return merged
 
@@ -116,23 +159,39 @@ class PwrTray:
         assert False, (f'no DE matched: {desktop_str!r} / {session_type!r}'
                        f' (known: {known})')
 
-    def __init__(self, ini_tool, quick=False, force_de=None):
+    def __init__(self, ini_tool, quick=False, force_de=None, fixed_poll=False,
+                 profile=False):
         PwrTray.singleton = self
+        self.profile = profile # a one-shot start-up profile; leave the session be
         self.app = QApplication([])
         self.app.setQuitOnLastWindowClosed(False)
-        while not QSystemTrayIcon.isSystemTrayAvailable():
-            prt("System tray is not available. Retry in 1 second...")
-            time.sleep(1.0)
-        prt("System tray is available. Continuing...")
+        startup_phase('qt-app')
+        self.tray = TrayWatcher(on_change=self.on_tray_changed)
+        startup_phase('tray')
 
         self.ini_tool = ini_tool
         self.battery = SimpleNamespace(present=None,
                        plugged=True, percent=100, selector='Settings')
+        self.icon_cache = None
+        self.wm_ipc, self.wm_natives = None, {} # see setup_wm_ipc()
         self.reconfig()
         self.quick = quick
 
-        self.loop = 0
-        self.loop_sample = (1 if quick else 15)
+        self.poll_s = 2.000
+        self.countdown_mins = 10 # with icon_countdown, badge the last minutes
+        self.return_poll_s = 30 # idle sampling once past a threshold
+        self.sample_due_mono = 0 # when the idle policy is next evaluated
+        self.scheduler = DeadlineScheduler(self.on_timeout,
+                fixed_s=self.poll_s if fixed_poll else None)
+        self.runner = CmdRunner()
+        self.probes = ProbeRunner(on_breaker=self.on_probe_breaker)
+        self.idle_probe_ms = None # an idle time command's answer, if new
+        self.inhibitors_updated = False # per the last inhibitors probe
+        self.polled_play_state = '' # per the last playerctl probe
+        self.stats = TickStats()
+        self.resumes = deque(maxlen=20) # per resume: when and ready_ms
+        self.resume_began = None # (stats mark, monotonic) until ready
+        self.suspending = False # locking before a suspend
 
         ## self.singleton.presentation_mode = False
         self.singleton.mode = 'SleepAfterLock' # or 'LockOnly' or 'Presentation'
@@ -140,35 +199,29 @@ class PwrTray:
         self.was_inhibited = None
         self.was_play_state = ''
         self.was_selector = None
-        self.was_output = ''
         self.here_dir = os.path.dirname(os.path.abspath(__file__))
-        self.svgs = []
-        self.icons = []
-        for base in self.svg_info.bases:
-            self.svgs.append(f'{base}-v{self.svg_info.version}.svg')
-        for resource in self.svgs + ['lockpaper.png']:
-            if not os.path.isfile(resource):
-                Utils.copy_to_folder(resource, ini_tool.folder)
-            if not os.path.isfile(resource):
-                prt(f'WARN: cannot find {repr(resource)}')
-                continue
-            self.icons.append(QIcon(os.path.join(self.ini_tool.folder, resource)))
+        if not os.path.isfile('lockpaper.png'):
+            Utils.copy_to_folder('lockpaper.png', ini_tool.folder)
+        self.icon_cache = IconCache(self.ini_tool.icon_cache_dir,
+                                    scale=self.app.devicePixelRatio())
+        self.icon_set = None
+        self.load_icons()
 
             # states are Awake, Locked, Blanked, Asleep
             # when is idle time
         self.tray_icon = QSystemTrayIcon(self.icons[0], self.app)
         self.tray_icon.setToolTip("pwr-tray")
-        self.tray_icon.setVisible(True)
+        self.tray_icon.setVisible(self.tray.available # else when one appears
+                                  and not profile)
+        startup_phase('icons')
         self.state = SimpleNamespace(name='Awake', when=0)
 
         self.running_idle_s = 0.000
-        self.poll_s = 2.000
         self.poll_100ms = False
         self.lock_began_secs = None   # TBD: remove
-        self.inh_lock_began_secs = False # TBD: refactor?
         self.rebuild_menu = False
         self.picks_file = ini_tool.picks_path
-        self.current_icon_num = -1  # triggers immediate icon update
+        self.current_icon = None  # triggers immediate icon update
         self.enable_playerctl = True
 
         self.restore_picks()
@@ -180,12 +233,110 @@ class PwrTray:
 
         # self.down_state = self.opts.down_state
 
-        # Load DE config from JSON and detect environment
-        de_json = self.load_de_config(ini_tool.folder)
-        self.de_config = self.detect_de(de_json, force_de=force_de)
+        startup_phase('config')
+
+        self.force_de = force_de
+        self.load_commands()
+        startup_phase('commands')
+
+        self.power = SysfsBattery(on_change=self.on_power_changed)
+        startup_phase('battery')
+        self.inhibitors = InhibitorWatcher(on_change=self.scheduler.wake)
+        startup_phase('inhibitors')
+        self.mpris = MprisWatcher(on_change=self.on_play_state_changed)
+        # media players are watched via MPRIS on the session bus, else 'playerctl'
+        self.media_watch = ('MPRIS' if self.mpris.active
+                else 'playerctl' if shutil.which('playerctl') else '')
+        startup_phase('mpris')
+        # pylint: disable=import-outside-toplevel
+        self.idle_alarms = None # XSyncIdle or WaylandIdle
+        idle_method = self.de_config.get('idle_method')
+        if idle_method == 'poll' and not self.is_wayland:
+            from pwr_tray.X11Tool import XSyncIdle
+            self.idle_alarms = XSyncIdle(on_alarm=self.on_idle_alarm)
+            if not self.idle_alarms.active:
+                prt('idle: using get_idle_ms command')
+                self.idle_alarms = None
+        elif idle_method == 'ext-idle':
+            from pwr_tray.WaylandIdle import WaylandIdle
+            self.idle_alarms = WaylandIdle(on_alarm=self.on_idle_alarm,
+                                           on_lost=self.on_idle_alarms_lost)
+            if not self.idle_alarms.active:
+                self.idle_alarms = None
+                if shutil.which('swayidle'):
+                    prt('WARN: idle: no ext-idle-notify-v1; falling back to swayidle')
+                    idle_method = 'swayidle'
+                else:
+                    prt('WARN: idle: no ext-idle-notify-v1 and no swayidle;'
+                        ' idle time is unknown')
+
+        self.idle_manager = None
+        if idle_method == 'swayidle':
+            from pwr_tray.SwayIdleMgr import SwayIdleManager
+            self.idle_manager = SwayIdleManager(self)
+        self.x_control, self.x_natives = None, {}
+        self.setup_x_control()
+        self.setup_wm_ipc()
+        startup_phase('idle')
+
+        self.menu_items = None # KeyedMenu of self.menu
+        self.menu = None
+        self.build_menu()
+        startup_phase('menu')
+        self.tray_icon.activated.connect(self.on_tray_icon_activated)
+        if self.idle_manager and not profile:
+            self.idle_manager_start()
+        self.sleep_watcher = None # no second sleep hook while profiling
+        if not profile:
+            self.sleep_watcher = SleepWatcher(on_sleep=self.on_prepare_for_sleep,
+                                              on_resume=self.on_resume)
+            if not self.idle_manager: # else swayidle's before-sleep clause locks
+                self.sleep_watcher.hold_delay('Lock the screen')
+
+        # probes that are not (yet) event driven: name -> period in secs
+        self.poll_periods = {}
+        if not self.tray.active:
+            self.poll_periods['tray'] = 10
+        if self.idle_manager and not self.idle_manager.event_driven:
+            self.poll_periods['swayidle'] = 10
+        self.poll_periods['inhibitors'] = (self.inhibitors.refresh_s
+                if self.inhibitors.native else self.poll_s)
+        if self.media_watch == 'playerctl':
+            self.poll_periods['player'] = self.poll_s
+
+        self.config_watcher = None if profile else ConfigWatcher(ini_tool.folder,
+                ['config.ini', 'my-commands.yaml', 'picks.json'],
+                self.on_config_files_changed)
+        self.scheduler.arm(0.1)
+        startup_phase('watchers')
+        prt(f'startup: {time.monotonic() - STARTED_MONO:.3f}s;',
+            ' '.join(f'{name}={secs*1000:.0f}ms' for name, secs in startup_phases))
+
+    def load_commands(self):
+        """ Load the DE commands (commands.yaml or my-commands.yaml), detect
+        the DE, and resolve the command variables; the result is cached
+        (see DeCache) so this is normally just a hash and a small read. """
+        user_yaml = self.de_config_path(self.ini_tool.folder)
+        with open(user_yaml, 'rb') as f:
+            key = DeCache.cache_key(f.read(), self.force_de)
+        cached = DeCache.load(self.ini_tool.cache_path, key)
+        if cached:
+            self.de_config, self.variables, self.plans = cached
+            prt(f'DE config: {self.de_config["name"]!r} (cached for {user_yaml})')
+        else:
+            self.resolve_commands(user_yaml)
+            DeCache.save(self.ini_tool.cache_path, key, self.de_config,
+                         self.variables, self.plans)
         self.graphical = self.de_config['name']
         self.is_wayland = self.de_config['session_type'] == 'wayland'
 
+    def resolve_commands(self, user_yaml):
+        """ Parse the YAML, detect the DE, and resolve the command variables
+        into self.de_config, self.variables and self.plans. """
+        # Load DE config from YAML and detect environment
+        de_json = self.load_de_config(user_yaml)
+        self.de_config = self.detect_de(de_json, force_de=self.force_de)
+
         # Build variables: defaults merged with matched desktop commands
         self.variables = dict(de_json['defaults'])
         cmd_keys = set(self.variables.keys()) - {'must_haves'}
@@ -206,36 +357,105 @@ class PwrTray:
                     lambda m: self.variables.get(m.group(1), m.group(0)),
                     val)
 
-        # qdbus/qdbus6 auto-detection: replace 'qdbus ' in any command value
+        # qdbus/qdbus6 auto-detection: replace 'qdbus ' in any command value;
+        # structured D-Bus entries are called in-process, with qdbus (if any)
+        # as the fallback
         has_qdbus = any(isinstance(v, str) and 'qdbus ' in v
                         for v in self.variables.values())
-        if has_qdbus:
+        qdbus_name = None
+        if has_qdbus or any(isinstance(v, dict) for v in self.variables.values()):
             qdbus_cmd = shutil.which('qdbus') or shutil.which('qdbus6')
-            assert qdbus_cmd, 'neither qdbus nor qdbus6 found on $PATH'
-            qdbus_name = os.path.basename(qdbus_cmd)
-            if qdbus_name != 'qdbus':
+            assert qdbus_cmd or not has_qdbus, 'neither qdbus nor qdbus6 found on $PATH'
+            qdbus_name = os.path.basename(qdbus_cmd) if qdbus_cmd else None
+            if qdbus_name and qdbus_name != 'qdbus':
                 for key, val in list(self.variables.items()):
                     if isinstance(val, str) and 'qdbus ' in val:
                         self.variables[key] = val.replace('qdbus ', f'{qdbus_name} ')
 
-        self.has_playerctl = bool(shutil.which('playerctl'))
+        # Compile the commands once; rebuilt only if the yaml changes
+        self.plans = compile_plans(self.variables, qdbus=qdbus_name)
 
-        self.idle_manager = (SwayIdleManager(self)
-            if self.de_config.get('idle_method') == 'swayidle' else None)
-
-        self.menu_items = []
-        self.menu = None
-        self.build_menu()
-        self.tray_icon.activated.connect(self.on_tray_icon_activated)
+    def reload_commands(self):
+        """ my-commands.yaml changed: re-resolve the commands in place,
+        keeping the current ones if the new file is broken. """
+        was = (self.de_config, self.graphical, self.is_wayland, self.variables,
+               self.plans)
+        try:
+            self.load_commands()
+        except Exception as exc:
+            prt(f'WARN: keeping current DE commands: {exc}')
+            (self.de_config, self.graphical, self.is_wayland, self.variables,
+                self.plans) = was
+            return
         if self.idle_manager:
+            self.idle_manager.build_clauses()
             self.idle_manager_start()
-        self._resume_proc = self._start_resume_monitor()
-        self._resume_buf = b''
-
-        self.timer = QTimer()
-        self.timer.setInterval(100) # 100 is initial ... gets recomputed
-        self.timer.timeout.connect(self.on_timeout)
-        self.timer.start()
+        self.setup_x_control()
+        self.setup_wm_ipc()
+        self.rebuild_menu = True
+
+    def setup_x_control(self):
+        """ On X11, do the plain 'xset' commands (reset_idle, monitors_off,
+        ...) over a kept X connection rather than by forking. """
+        if self.is_wayland or not os.environ.get('DISPLAY', ''):
+            return
+        # pylint: disable=import-outside-toplevel
+        from pwr_tray.X11Tool import XControl, x11_natives
+        self.x_natives = x11_natives(self.plans)
+        if self.x_natives and not self.x_control:
+            self.x_control = XControl(dpy=getattr(self.idle_alarms, 'dpy', None))
+            if not self.x_control.active:
+                self.x_control = None
+        if self.x_control:
+            prt(f'x11: in-process {sorted(self.x_natives)}'
+                f'{"" if self.x_control.dpms else " (no DPMS)"}')
+
+    def setup_wm_ipc(self):
+        """ On i3/sway, send 'i3-msg'/'swaymsg' commands over a kept IPC
+        socket, and follow fullscreen windows (for fullscreen_presentation). """
+        if not (os.environ.get('SWAYSOCK', '') or os.environ.get('I3SOCK', '')):
+            return
+        # pylint: disable=import-outside-toplevel
+        from pwr_tray.WmIpc import WmIpc, wm_natives
+        self.wm_natives = wm_natives(self.plans)
+        if not self.wm_ipc:
+            self.wm_ipc = WmIpc(on_fullscreen=self.on_fullscreen_changed)
+            if not self.wm_ipc.active:
+                self.wm_ipc = None
+        if self.wm_ipc:
+            prt(f'WM IPC: in-process {sorted(self.wm_natives)}')
+
+    def is_fullscreen_presentation(self):
+        """ Is a window fullscreen and should that mean Presentation mode? """
+        return bool(self.wm_ipc and self.wm_ipc.fullscreen
+                    and self.get_params('Settings').fullscreen_presentation)
+
+    def on_fullscreen_changed(self, fullscreen):
+        """ WmIpc callback: a window went (or no longer is) fullscreen """
+        if not self.get_params('Settings').fullscreen_presentation:
+            return
+        prt(f'fullscreen={fullscreen}: effective mode={self.get_effective_mode()}')
+        self.rebuild_menu = True
+        self.idle_manager_start()
+        self.sample_soon()
+
+    def on_config_files_changed(self, names):
+        """ ConfigWatcher callback with the basenames of changed files """
+        prt(f'config files changed: {sorted(names)}')
+        if 'config.ini' in names and self.ini_tool.update_config():
+            self.apply_log_params()
+            self.load_icons()
+            if not self.quick:
+                self.restore_picks() # re-apply picks to re-parsed sections
+            self.rebuild_menu = True
+            self.idle_manager_start()
+        if 'picks.json' in names and not self.quick:
+            self.restore_picks()
+            self.rebuild_menu = True
+            self.idle_manager_start()
+        if 'my-commands.yaml' in names:
+            self.reload_commands()
+        self.scheduler.wake()
 
     def get_params(self, selector=None):
         selector = self.battery.selector if selector is None else selector
@@ -262,13 +482,54 @@ class PwrTray:
         return self.ini_tool.get_rotated_vals(selector, 'sleep_min_list', first)
 
     def get_effective_mode(self):
-        """TBD"""
-        return 'SleepAfterLock' if self.battery.selector == 'LoBattery' else self.mode
+        """ The mode in effect: SleepAfterLock on LoBattery, Presentation
+        while a window is fullscreen (if fullscreen_presentation), else
+        the picked mode """
+        if self.battery.selector == 'LoBattery':
+            return 'SleepAfterLock'
+        return 'Presentation' if self.is_fullscreen_presentation() else self.mode
 
     def reconfig(self):
         """ update/fix config """
         if self.ini_tool.update_config():
             self.rebuild_menu = True
+            self.apply_log_params()
+
+    def icon_svgs(self, icon_set):
+        """ The SVG files (in the config folder) of 'icon_set' by state
+        number; each is copied there first if missing. """
+        mapping = self.icon_sets.get(icon_set, {})
+        svgs = []
+        for base in self.svg_info.bases:
+            name = mapping.get(base, base)
+            name = mapping.get(name, name) # e.g., RisingMoon -> SettingSun -> ...
+            if name not in self.svg_info.bases:
+                name = f'{icon_set}/{name}'
+            svgs.append(f'{name}-v{self.svg_info.version}.svg')
+        for resource in svgs:
+            if not os.path.isfile(resource):
+                os.makedirs(os.path.dirname(resource) or '.', exist_ok=True)
+                Utils.copy_to_folder(resource, self.ini_tool.folder)
+        return [os.path.join(self.ini_tool.folder, svg) for svg in svgs]
+
+    def load_icons(self):
+        """ Load the icons of the configured icon set (if it changed) """
+        icon_set = self.get_params('Settings').icon_set
+        if icon_set not in self.icon_sets and icon_set != 'Default':
+            prt(f'WARN: unknown icon_set {icon_set!r}'
+                f' (choices: Default {" ".join(self.icon_sets)})')
+            icon_set = 'Default'
+        if icon_set == self.icon_set:
+            return
+        self.icon_set = icon_set
+        self.icons = self.icon_cache.load(self.icon_svgs(icon_set))
+        self.current_icon = None # re-show
+
+    def apply_log_params(self):
+        """ Log rotation choices come from [Settings] """
+        params = self.get_params('Settings')
+        Utils.prt_gens = max(1, params.log_gens)
+        Utils.prt_compress = params.log_gzip
 
     @staticmethod
     def save_picks():
@@ -291,10 +552,12 @@ class PwrTray:
                 picks_str = json.dumps(picks)
                 with open(this.picks_file, 'w', encoding='utf-8') as f:
                     f.write(picks_str + '\n')
-                print("Picks saved:", picks_str)
-                this.poll_100ms = True
+                if getattr(this, 'config_watcher', None):
+                    this.config_watcher.note_written('picks.json')
+                prt("Picks saved:", picks_str)
+                this.sample_soon()
             except Exception as e:
-                print(f"An error occurred while saving picks: {e}", file=sys.stderr)
+                prt(f"WARN: An error occurred while saving picks: {e}")
 
 
     def restore_picks(self):
@@ -317,24 +580,111 @@ class PwrTray:
 
 
 
-    def _get_down_state(self):
-        return 'PowerDown' if self.get_params().power_down else 'Suspend'
-
     def update_running_idle_s(self):
-        """ Update the running idle seconds (called after each regular timeout) """
-        cmd = self.variables['get_idle_ms']
-        scale = 1
-        if not cmd:
-            cmd = self.variables.get('get_idle_s', '')
-            scale = 1000
-        if cmd:
-            try:
-                xidle = int(subprocess.check_output(cmd.split()).strip())
-                xidle_ms = xidle * scale
-                xidle_ms *= 2 if self.quick else 1  # time warp
-                self.running_idle_s = round(xidle_ms/1000, 3)
-            except Exception as e:
-                prt(f'WARN: idle time command failed: {e}')
+        """ Update the running idle seconds.  Returns False if that awaits
+        the idle time command, which runs on the probe pool (its result
+        wakes the scheduler and is taken by the next call). """
+        if self.idle_alarms:
+            xidle_ms = self.idle_alarms.idle_ms()
+        elif self.idle_probe_ms is not None:
+            xidle_ms, self.idle_probe_ms = self.idle_probe_ms, None
+        else:
+            plan, scale = self.plans.get('get_idle_ms', None), 1
+            if not plan:
+                plan, scale = self.plans.get('get_idle_s', None), 1000
+            if not plan:
+                return True
+            self.probes.submit('idle', lambda: self.probe_idle_ms(plan, scale),
+                               self.on_idle_probe, deadline_s=2)
+            return False
+        xidle_ms *= 2 if self.quick else 1  # time warp
+        self.running_idle_s = round(xidle_ms/1000, 3)
+        return True
+
+    @staticmethod
+    def probe_idle_ms(plan, scale):
+        """ Probe pool: run the idle time command """
+        note_spawn()
+        return int(subprocess.check_output(plan.argv or plan.text,
+                shell=not plan.argv, timeout=5).strip()) * scale
+
+    def on_idle_probe(self, xidle_ms):
+        """ The idle time command answered; evaluate the policy with it """
+        self.idle_probe_ms = xidle_ms
+        self.scheduler.wake()
+
+    def get_idle_limits(self):
+        """ The idle seconds at which the policy acts for the current selector """
+        lock_s = self.get_lock_min_list()[0]*60
+        return SimpleNamespace(lock_s=lock_s,
+                down_s=self.get_sleep_min_list()[0]*60 + lock_s,
+                blank_s=5 if self.quick else 20,
+                moon_s=lock_s - min(60, lock_s/8))
+
+    def get_idle_thresholds(self):
+        """ The idle seconds at which the idle policy (or icon) may act """
+        lim, facts = self.get_idle_limits(), self.policy_facts()
+        secs = Policy.thresholds(facts) + [lim.moon_s]
+        if Policy.policy_mode(facts) == 'Presentation':
+            pass # held; no countdown
+        elif self.get_params('Settings').icon_countdown: # each minute's badge
+            secs += [lim.lock_s - mins*60 for mins in range(1, self.countdown_mins+1)
+                     if lim.lock_s - mins*60 > 0]
+        return secs
+
+    def arm_idle_alarms(self):
+        """ With XSync (or ext-idle-notify), arm alarms at each idle threshold
+        that the policy may act upon so that it runs exactly when one is
+        crossed. """
+        if not self.idle_alarms:
+            return
+        scale = 500 if self.quick else 1000  # time warp
+        self.idle_alarms.arm([sec*scale for sec in self.get_idle_thresholds()])
+
+    def on_idle_alarm(self):
+        """ Idle alarm: an idle threshold was crossed or the user returned,
+        so evaluate the idle policy now. """
+        self.sample_due_mono = 0
+        self.scheduler.wake()
+
+    def on_idle_alarms_lost(self):
+        """ The compositor dropped the ext-idle-notify connection: reconnect
+        once (e.g., it restarted), else fall back to swayidle (or, lacking
+        that, to the idle time command) rather than read idle 0 forever. """
+        # pylint: disable=import-outside-toplevel
+        from pwr_tray.WaylandIdle import WaylandIdle
+        self.idle_alarms = WaylandIdle(on_alarm=self.on_idle_alarm,
+                                       on_lost=self.on_idle_alarms_lost)
+        if not self.idle_alarms.active:
+            self.idle_alarms = None
+            if shutil.which('swayidle'):
+                prt('WARN: idle: ext-idle-notify lost; falling back to swayidle')
+                from pwr_tray.SwayIdleMgr import SwayIdleManager
+                self.idle_manager = SwayIdleManager(self)
+                self.idle_manager_start()
+                if not self.idle_manager.event_driven:
+                    self.poll_periods['swayidle'] = 10
+            else:
+                prt('WARN: idle: ext-idle-notify lost; using the idle time command')
+        self.on_idle_alarm()
+
+    def sample_soon(self):
+        """ Evaluate the idle policy shortly (e.g., after a change of picks) """
+        self.poll_100ms = True
+        self.scheduler.wake(0.1)
+
+    def next_sample_s(self):
+        """ Wall seconds until the idle policy could next have work to do.
+        Idle time grows at most one second per second, so the nearest
+        threshold ahead bounds it; once past one, we must sample for the
+        user returning (unless an idle alarm tells us). """
+        idle_s, thresholds = self.running_idle_s, self.get_idle_thresholds()
+        ahead_s = [sec - idle_s for sec in thresholds if sec > idle_s]
+        delay_s = min(ahead_s) + 0.5 if ahead_s else 3600
+        passed = len(ahead_s) < len(thresholds) or self.state.name != 'Awake'
+        if passed and not self.idle_alarms:
+            delay_s = min(delay_s, self.return_poll_s)
+        return delay_s / (2 if self.quick else 1) # time warp
 
     def DB(self):
         """ is debug on? """
@@ -343,7 +693,7 @@ class PwrTray:
 
     def effective_mode(self):
         """ TBD """
-        return 'SleepAfterLock' if self.battery.selector == 'LoBattery' else self.mode
+        return self.get_effective_mode()
 
     def show_icon(self, inhibited=''):
         """ Display Icon if updated """
@@ -354,53 +704,42 @@ class PwrTray:
                 else 4 if inhibited == 'player'
                 else 0 if emode in ('SleepAfterLock',)
                 else 2)
-        lock_secs = self.get_lock_min_list()[0]*60
-        # down_secs = self.get_sleep_min_list()[0]*60 + lock_secs
-        moon_when = lock_secs - min(60 , lock_secs/8)
+        lim = self.get_idle_limits()
+        moon_when = lim.moon_s
         if num == 0 and self.running_idle_s >= moon_when:
             num = 5
         elif num == 2 and self.running_idle_s >= moon_when:
             num = 6
         # prt(f'{num=} {self.running_idle_s=} {moon_when=}')
-
-        if num != self.current_icon_num:
-            self.tray_icon.setIcon(self.icons[num])
-            self.current_icon_num = num
+        badge = None
+        if num in (0, 2, 5, 6) and self.get_params('Settings').icon_countdown:
+            left_s = lim.lock_s - self.running_idle_s
+            if self.running_idle_s > 0 and 0 < left_s <= self.countdown_mins*60:
+                badge = str(math.ceil(left_s/60)) # minutes until locking
+
+        if (num, badge) != self.current_icon:
+            self.tray_icon.setIcon(self.icon_cache.icon(num, badge))
+            self.current_icon = (num, badge)
             return True # changed
         return False # unchanged
 
     def check_inhibited(self):
-        pipe = subprocess.Popen(
-                # ['systemd-inhibit', '--no-legend', '--no-pager', '--mode=block'],
-                ['systemd-inhibit', '--no-pager', '--mode=block'],
-                stdout=subprocess.PIPE)
-        output, _ = pipe.communicate()
-        output = output.decode('utf-8')
-        lines = output.splitlines()
-        if self.DB() and 'No inhibitors' not in output:
-            prt('DB', 'systemd-inhibit:', output.strip())
-        rows = []
-        inhibited = ''
-        for count, line in enumerate(lines):
-            if count == 0:
-                rows.append(line.strip())
-                continue
-            if 'block' not in line:
-                continue
-            if count == 1:
-                if ('xfce4-power-man' not in line
-                        and 'org_kde_powerde' not in line):
-                    inhibited = 'systemd'
-                    rows.append(line)
-            else:
-                inhibited = 'systemd'
-                rows.append(line)
-        if len(rows) == 1:
-            rows = []
-        if self.has_playerctl and self.enable_playerctl:
-            child = subprocess.run('playerctl status'.split(), check=False,
-                        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
-            play_state = child.stdout.decode('utf-8').strip().lower()
+        """ Returns the blocking inhibitor records and whether they
+        changed since the last call. """
+        mark = self.stats.start()
+        updated, self.inhibitors_updated = self.inhibitors_updated, False
+        snap = self.inhibitors.snapshot()
+        self.probes.submit('inhibitors', lambda: self.inhibitors.probe(snap),
+                           self.on_inhibitors_probe, deadline_s=3)
+        mark = self.stats.lap('inhibitors', mark)
+        records = self.inhibitors.records
+        if updated and self.DB():
+            dbg('inhibitors:', [f'{rec.who}/{rec.what}' for rec in records]
+                    if records else 'none')
+        inhibited = 'systemd' if records else ''
+        if self.media_watch and self.enable_playerctl:
+            play_state = self.get_play_state()
+            self.stats.lap('player', mark)
             if play_state == 'playing':
                 inhibited = 'player'
             if self.was_play_state != play_state:
@@ -410,28 +749,72 @@ class PwrTray:
         emode = self.effective_mode()
 
         if self.show_icon(inhibited=inhibited):
-            self.poll_100ms = True
+            self.sample_soon()
             self.idle_manager_start()
 
         self.was_effective_mode = emode
         self.was_selector = self.battery.selector
-        was_output = self.was_output
-        self.was_output = output
         self.was_inhibited = inhibited
-        return rows, bool(was_output != output)
+        return records, updated
+
+    def on_inhibitors_probe(self, listing):
+        """ The inhibitors were re-listed; if they changed, act now """
+        if self.inhibitors.apply(listing):
+            self.inhibitors_updated = True
+            self.scheduler.wake()
+
+    def get_play_state(self):
+        """ The media player state (e.g., 'playing'); from the MPRIS watcher
+        if on the session bus, else the last answer of 'playerctl' (asked
+        again on the probe pool since a wedged player can hang it). """
+        if self.mpris.active:
+            return self.mpris.play_state
+        self.probes.submit('player', self.probe_play_state,
+                           self.on_player_probe, deadline_s=2)
+        return self.polled_play_state
+
+    @staticmethod
+    def probe_play_state():
+        """ Probe pool: ask 'playerctl' """
+        note_spawn()
+        child = subprocess.run('playerctl status'.split(), check=False,
+                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=5)
+        return child.stdout.decode('utf-8').strip().lower()
+
+    def on_player_probe(self, play_state):
+        """ playerctl answered; if the state changed, act now """
+        if play_state != self.polled_play_state:
+            self.polled_play_state = play_state
+            self.scheduler.wake()
+
+    def on_probe_breaker(self):
+        """ A probe stopped (or resumed) answering; update the menu flag """
+        self.rebuild_menu = True
+        self.scheduler.wake()
+
+    def retry_probes(self, _=None):
+        """ Menu item: retry the probes whose breakers are open """
+        prt('+', f'retry probes: {self.probes.tripped()}')
+        self.probes.reset()
+
+    def on_play_state_changed(self, _play_state):
+        """ MPRIS signal callback: re-evaluate the inhibition right away """
+        if self.enable_playerctl:
+            _, updated = self.check_inhibited()
+            self.rebuild_menu = self.rebuild_menu or updated
 
     def update_battery_status(self):
+        """ Map the power state (kept current by SysfsBattery) to the selector """
         if self.battery.present is False:
             return
-        battery = psutil.sensors_battery()
-        if battery is None:
+        if not self.power.present:
             self.battery.present = False
             return
         was_plugged = self.battery.plugged
         was_selector = self.battery.selector
 
-        self.battery.plugged = battery.power_plugged
-        self.battery.percent = round(battery.percent, 1)
+        self.battery.plugged = self.power.plugged
+        self.battery.percent = round(self.power.percent, 1)
         if self.battery.plugged:
             self.battery.selector = 'Settings'
         elif self.battery.percent > self.get_params().lo_battery_pct:
@@ -440,16 +823,14 @@ class PwrTray:
             self.battery.selector = 'LoBattery'
         if was_plugged != self.battery.plugged or was_selector != self.battery.selector:
             self.rebuild_menu = True
-#   IF WANTING TIME LEFT
-#       secsleft = battery.secsleft
-#       if secsleft == psutil.POWER_TIME_UNLIMITED:
-#           time_left = "Calculating..."
-#       elif secsleft == psutil.POWER_TIME_UNKNOWN:
-#           time_left = "Unknown"
-#       else:
-#           hours, remainder = divmod(secsleft, 3600)
-#           minutes, seconds = divmod(remainder, 60)
-#           time_left = f"{hours:02}:{minutes:02}"
+
+    def on_power_changed(self):
+        """ SysfsBattery callback: switch selector right away if needed """
+        self.update_battery_status()
+        if self.rebuild_menu:
+            prt(f'battery: plugged={self.battery.plugged}'
+                f' {self.battery.percent}% -> {self.battery.selector}')
+            self.scheduler.wake()
 
     def reset_xidle_ms(self):
         """ TBD"""
@@ -463,89 +844,118 @@ class PwrTray:
         self.state.when = self.running_idle_s
 
     def on_timeout(self):
-        """TBD"""
-        self.loop += 1
-        if self.DB():
-            prt('DB', f'on_timeout() {self.loop=}/{self.loop_sample} ...')
-        if not QSystemTrayIcon.isSystemTrayAvailable():
-            prt('SystemTray is gone ... restarting')
-            self.restart_self(None)
-
-        self._check_resume()
-        self.reconfig()
-        if self.idle_manager:
+        """ Runs at the scheduler's deadline (or early for an external event):
+        does the probes and, when due, evaluates the idle policy. """
+        now_mono = time.monotonic()
+        Utils.prt_level = Utils.DEBUG if self.DB() else Utils.INFO
+        dbg('on_timeout() wakeups:', self.scheduler.wakeups)
+        tick_mark = mark = self.stats.start()
+        if not self.tray.active:
+            self.tray.check(polled=True)
+            mark = self.stats.lap('tray', mark)
+
+        if self.idle_manager and not self.idle_manager.event_driven:
             self.idle_manager.checkup()
+            mark = self.stats.lap('swayidle', mark)
         self.update_battery_status()
+        mark = self.stats.lap('battery', mark)
 
-        rows, updated = self.check_inhibited()
+        records, updated = self.check_inhibited() # times its own probes
         if updated or self.rebuild_menu:
-            self.build_menu(rows)
+            mark = self.stats.start()
+            self.build_menu(records)
             self.rebuild_menu = False
             prt('re-built menu')
+            self.stats.lap('menu', mark)
 
-        if self.loop >= self.loop_sample:
-            self.update_running_idle_s()
-            lock_secs = self.get_lock_min_list()[0]*60
-            down_secs = self.get_sleep_min_list()[0]*60 + lock_secs
-            blank_secs = 5 if self.quick else 20
-#           if 0 <= int(self.get_params().dim_pct_brightness) < 100:
-#               dim_secs = int(round(lock_secs * int(self.get_params().dim_pct_lock_min) / 100, 0))
-#           else:
-#               dim_secs = 2000 + lock_secs * 2  # make it never happen
-
-            emit = f'idle_s={self.running_idle_s} state={self.state.name},{self.state.when}s'
-            emode = self.get_effective_mode()
-            if emode in ('LockOnly', 'SleepAfterLock'):
-                emit += f' @{self.get_lock_min_list()[0]}m'
-            if emode in ('SleepAfterLock', ):
-                emit += f'+{self.get_sleep_min_list()[0]}m'
-            if self.battery.selector != 'Settings':
-                emit += f' {self.battery.selector}'
-            prt(emit)
-
-            if emode in ('Presentation',) or self.was_inhibited:
-                if self.idle_manager:
-                    self.reset_xidle_ms() # idle_manager handles timeouts
-                elif self.running_idle_s > min(50, lock_secs*0.40):
-                    self.reset_xidle_ms() # we don't know when
-
-            elif (self.running_idle_s >= down_secs and emode not in ('LockOnly',)
-                    and self.state.name in ('Awake', 'Locked', 'Blanked')):
-                if self._get_down_state() == 'PowerOff':
-                    self.poweroff(None)
-                else:
-                    self.suspend(None)
-
-            elif (self.running_idle_s >= lock_secs and emode not in ('Presentation',)
-                    and self.state.name in ('Awake', 'Dim')):
-                self.lock_screen(None)
-
-#           elif (self.running_idle_s >= dim_secs and emode not in ('Presentation',)
-#                   and self.state.name in ('Awake',)):
-#               self.dimmer(None)
+        if (self.poll_100ms or now_mono >= self.sample_due_mono
+                or self.idle_probe_ms is not None):
+            mark = self.stats.start()
+            if self.update_running_idle_s():
+                self.run_idle_policy(now_mono)
+            else: # the idle time command answers via on_idle_probe()
+                self.sample_due_mono = now_mono + self.poll_s
+            self.stats.lap('idle', mark)
 
-            elif (self.running_idle_s >= self.state.when + blank_secs
-                    and self.get_params().turn_off_monitors
-                    and emode not in ('Presentation',)
-                    and self.state.name in ('Locked',)):
-                self.blank_primitive()
-
-            elif self.inh_lock_began_secs:
-                self.inh_lock_began_secs = False
-
-            elif self.running_idle_s < lock_secs and self.state.name not in ('Awake', ):
-                self.set_state('Awake')
-
-            self.loop = 0
+        self.stats.lap('tick', tick_mark)
+        if self.stats.summary_due():
+            self.report_stats()
 
         if self.poll_100ms:
-            poll_ms = 100
             self.poll_100ms = False
-            self.loop = self.loop_sample
-            prt(f'{poll_ms=}')
+            self.sample_due_mono = 0
+            delay_s = 0.1
+            prt(f'{delay_s=}')
         else:
-            poll_ms = int(self.poll_s * 1000)
-        self.timer.setInterval(poll_ms)
+            delay_s = min([self.sample_due_mono - now_mono]
+                          + list(self.poll_periods.values()))
+        self.scheduler.arm(delay_s)
+
+    def policy_facts(self):
+        """ The inputs of the idle policy (see Policy.decide()) as of now """
+        lim, params = self.get_idle_limits(), self.get_params()
+        return SimpleNamespace(idle_s=self.running_idle_s, state=self.state.name,
+                state_when_s=self.state.when, mode=self.get_effective_mode(),
+                inhibited=bool(self.was_inhibited), lock_s=lim.lock_s,
+                down_s=lim.down_s, blank_s=lim.blank_s,
+                can_blank=bool(params.turn_off_monitors and self.variables['monitors_off']),
+                power_off=bool(params.power_down), external=bool(self.idle_manager))
+
+    def run_idle_policy(self, now_mono):
+        """ Lock, blank or suspend per the (just updated) idle time; the
+        decision is Policy.decide()'s and is carried out here """
+        facts = self.policy_facts()
+        emit = f'idle_s={self.running_idle_s} state={self.state.name},{self.state.when}s'
+        if facts.mode in ('LockOnly', 'SleepAfterLock'):
+            emit += f' @{self.get_lock_min_list()[0]}m'
+        if facts.mode in ('SleepAfterLock', ):
+            emit += f'+{self.get_sleep_min_list()[0]}m'
+        if self.battery.selector != 'Settings':
+            emit += f' {self.battery.selector}'
+        emit += f' wakeups={self.scheduler.per_hour()}/h'
+        prt(emit)
+
+        decision = Policy.decide(facts)
+        if decision.rule and decision.rule != 'held':
+            dbg(f'policy: {decision.rule} -> {decision.action} {decision.state}')
+        if decision.action == 'reset_idle':
+            self.reset_xidle_ms()
+        elif decision.action == 'suspend':
+            self.suspend(None)
+        elif decision.action == 'poweroff':
+            self.poweroff(None)
+        elif decision.action == 'lock':
+            self.lock_screen(None)
+        elif decision.action == 'blank':
+            self.blank_primitive()
+        elif decision.state:
+            if decision.rule == 'wake' and self.state.name == 'Blanked':
+                self.run_command('monitors_on') # as swayidle's after-resume
+            self.set_state(decision.state)
+
+        self.arm_idle_alarms()
+        self.sample_due_mono = now_mono + self.next_sample_s()
+        self.note_resume_ready()
+
+    def report_stats(self, popup=False):
+        """ Log the tick stats (and write stats.json for 'pwr-tray --stats');
+        with 'popup', show them in a tray notification too. """
+        lines = self.stats.summary_lines()
+        for line in lines:
+            prt(line)
+        commands = {key: {'count': stat.count, 'fails': stat.fails,
+                          'last_ms': round(stat.last_s*1000), 'max_ms': round(stat.max_s*1000)}
+                    for key, stat in self.runner.stats.items()}
+        self.stats.dump(self.ini_tool.stats_path, extra={'de': self.graphical,
+                'wakeups_per_hour': self.scheduler.per_hour(), 'commands': commands,
+                'resumes': list(self.resumes), 'probes': self.probes.stats()})
+        if popup:
+            self.tray_icon.showMessage('pwr-tray stats', '\n'.join(lines[1:]),
+                                       QSystemTrayIcon.Information, 15000)
+
+    def show_stats(self, _=None):
+        """ Menu item: pop up the tick stats """
+        self.report_stats(popup=True)
 
     def _toggle_battery(self, _=None):
         if self.battery.present is False:
@@ -578,7 +988,7 @@ class PwrTray:
         return rv
 
     def toggle_playerctl(self):
-        if self.has_playerctl:
+        if self.media_watch:
             self.enable_playerctl = not bool(self.enable_playerctl)
             self.save_picks()
             self.rebuild_menu = True
@@ -602,88 +1012,92 @@ class PwrTray:
         rv = f'{mins[0]}m' + ('' if mins[0] == mins[1] else f'->{mins[1]}m')
         return rv
 
-    def build_menu(self, rows=None):
-        """TBD"""
+    def build_menu(self, records=None):
+        """ Bring the menu up to date; 'records' are the blocking inhibitors.
+        Rows are keyed and their QActions kept (see KeyedMenu), so this only
+        changes the text/visibility of rows that differ. """
         # pylint: disable=unnecessary-lambda
         def has_cmd(label):
             return bool(self.variables.get(label, None))
 
-        def add_item(text, callback):
-            nonlocal self
-            item = QAction(text)
-            item.triggered.connect(callback)
-            self.menu.addAction(item)
-            self.menu_items.append(item)
+        items = []
+        def add_item(key, text, callback, visible=True):
+            items.append((key, text, callback, visible))
 
         first_menu = self.menu is None
         if first_menu:
             self.menu = QMenu()
-        else:
-            self.menu.clear()
-        self.menu_items = []
-
-        if rows:
-            for row in rows:
-                add_item(row, self.dummy)
-
-        if self.mode not in ('Presentation',):
-            add_item(f'🅟 Presentation ⮜ {self.mode} Mode', self.enable_presentation_mode)
-
-        if self.mode not in ('LockOnly',):
-            add_item(f'🅛 LockOnly ⮜ {self.mode} Mode', self.enable_nosleep_mode)
-
-        if self.mode not in ('SleepAfterLock',):
-            add_item(f'🅢 SleepAfterLock ⮜ {self.mode} Mode', self.enable_normal_mode)
-
-        add_item(f'{self.graphical}:  ▷ Lock Screen', self.lock_screen)
-
-        if (self.get_params().turn_off_monitors and self.variables['monitors_off']):
-            add_item('   ▷ Blank Monitors', self.blank_quick)
-
-        if has_cmd('reload_wm'):
-            add_item('   ▷ Reload', self.reload_wm)
-
-        if has_cmd('restart_wm'):
-            add_item('   ▷ Restart', self.restart_wm)
-
-        add_item('   ▷ Log Off', self.exit_wm)
-        add_item('System:  ▼ Suspend', self.suspend)
-        add_item('    ▼ Reboot', self.reboot)
-        add_item('    ▼ PowerOff', self.poweroff)
+            self.menu_items = KeyedMenu(self.menu)
+
+        seen = {}
+        for rec in records or []:
+            text = f'⛔ {rec.who}: {rec.why} [{rec.what}]'
+            seen[text] = seen.get(text, 0) + 1 # keys must be unique
+            add_item(f'inhibitor:{seen[text]}:{text}', text, self.dummy)
+        tripped = self.probes.tripped()
+        add_item('probes', f'⚠ Not answering: {", ".join(tripped)} (retry)',
+                 self.retry_probes, bool(tripped))
+
+        add_item('Presentation', f'🅟 Presentation ⮜ {self.mode} Mode',
+                 self.enable_presentation_mode, self.mode not in ('Presentation',))
+        add_item('LockOnly', f'🅛 LockOnly ⮜ {self.mode} Mode',
+                 self.enable_nosleep_mode, self.mode not in ('LockOnly',))
+        add_item('SleepAfterLock', f'🅢 SleepAfterLock ⮜ {self.mode} Mode',
+                 self.enable_normal_mode, self.mode not in ('SleepAfterLock',))
+
+        add_item('lock', f'{self.graphical}:  ▷ Lock Screen', self.lock_screen)
+        add_item('blank', '   ▷ Blank Monitors', self.blank_quick,
+                 bool(self.get_params().turn_off_monitors and self.variables['monitors_off']))
+        add_item('reload_wm', '   ▷ Reload', self.reload_wm, has_cmd('reload_wm'))
+        add_item('restart_wm', '   ▷ Restart', self.restart_wm, has_cmd('restart_wm'))
+        add_item('logoff', '   ▷ Log Off', self.exit_wm)
+        add_item('suspend', 'System:  ▼ Suspend', self.suspend)
+        add_item('reboot', '    ▼ Reboot', self.reboot)
+        add_item('poweroff', '    ▼ PowerOff', self.poweroff)
 
         selector, percent = self.battery.selector, self.battery.percent
-        add_item('🗲 Plugged In' if selector == 'Settings'
+        add_item('battery', '🗲 Plugged In' if selector == 'Settings'
                      else (('█' if selector == 'HiBattery' else '▃') + f' {selector}')
                 + (f' {percent}%' if percent < 100 or selector != 'Settings' else '')
                 , self._toggle_battery)
 
         # if self.mode not in ('Presentation',) and len(self.opts.lock_min_list) > 1:
-        add_item(f'  ♺ Lock: {self._lock_rotate_str()}',
+        add_item('lock_mins', f'  ♺ Lock: {self._lock_rotate_str()}',
                  lambda: self._lock_rotate_next())
 
         # if self.mode in ('SleepAfterLock',) and len(self.opts.sleep_min_list) > 1:
-        add_item(f'  ♺ Sleep (after Lock): {self._sleep_rotate_str()}',
+        add_item('sleep_mins', f'  ♺ Sleep (after Lock): {self._sleep_rotate_str()}',
                  lambda: self._sleep_rotate_next())
 
-        label = '🎝 PlayerCtl: '
-        label += ('not installed' if not self.has_playerctl
+        label = f'🎝 Media ({self.media_watch}): ' if self.media_watch else '🎝 Media: '
+        label += ('unavailable' if not self.media_watch
                    else 'Enabled' if self.enable_playerctl
                    else 'Disabled')
-        add_item(label, self.toggle_playerctl)
-        if self.get_params().gui_editor:
-            add_item('🖹  Edit Applet Config', self.edit_config)
+        add_item('playerctl', label, self.toggle_playerctl)
+        add_item('edit_config', '🖹  Edit Applet Config', self.edit_config,
+                 bool(self.get_params().gui_editor))
+        add_item('stats', '📊 Tick Stats', self.show_stats)
 
-        add_item('☓ Quit this Applet', self.quit_self)
+        add_item('quit', '☓ Quit this Applet', self.quit_self)
 
-        add_item('↺ Restart this Applet', self.restart_self)
+        add_item('restart', '↺ Restart this Applet', self.restart_self)
 
+        self.menu_items.update(items)
         if first_menu:
             self.tray_icon.setContextMenu(self.menu)
 
-        if not self.tray_icon.isVisible():
-            prt('self.tray_icon.isVisible() is False ... restarting app')
-            time.sleep(0.5)
-            self.restart_self(None)
+    def on_tray_changed(self, available):
+        """ TrayWatcher callback: (re-)register the icon with the tray
+        in-process whenever one (re)appears, e.g., after a panel restart. """
+        if not available:
+            prt('tray: gone; the icon returns when a tray does')
+            return
+        if self.profile:
+            return
+        if self.tray_icon.isVisible():
+            self.tray_icon.hide() # forget the registration with the old host
+        self.tray_icon.show()
+        prt('tray: icon (re-)registered')
 
     def on_tray_icon_activated(self, reason):
         if reason == QSystemTrayIcon.Context:  # Right click
@@ -703,18 +1117,36 @@ class PwrTray:
         """TBD"""
 
     @staticmethod
-    def run_command(key):
+    def run_command(key, on_done=None, settle_s=None):
+        """ Start the DE command for 'key' (if any) without waiting;
+        see CmdRunner.run().  Returns the job or None. """
         this = PwrTray.singleton
-        command = this.variables.get(key, None)
-
-        if command:
-            prt(f'+ {command}')
-            if  re.match(r'^(\s\w\-)*$', command):
-                result = subprocess.run(command.split(), check=False)
-            else:
-                result = subprocess.run(command, check=False, shell=True)
-            if result.returncode != 0:
-                prt(f'   NOTE: returncode={result.returncode}')
+        native = this.x_natives.get(key, None)
+        if native and this.x_control and this.x_control.run(native):
+            dbg(f'{key}: done in-process')
+            return None
+        native = this.wm_natives.get(key, None)
+        if native and this.wm_ipc and this.wm_ipc.run(native):
+            dbg(f'{key}: sent via WM IPC')
+            return None
+        plan = this.plans.get(key, None)
+        if plan and plan.dbus:
+            if DBusTool.call_entry(plan.dbus,
+                    on_error=lambda msg: this.on_dbus_call_failed(key, msg)):
+                dbg(f'{key}: sent via D-Bus')
+                return None
+            if not plan.text:
+                prt(f'WARN: {key}: D-Bus call not sent and no qdbus fallback')
+                return None
+        return this.runner.run(key, plan, on_done=on_done, settle_s=settle_s)
+
+    def on_dbus_call_failed(self, key, message):
+        """ A structured D-Bus command failed; try its qdbus form (if any) """
+        plan = self.plans.get(key, None)
+        prt(f'WARN: {key}: D-Bus call failed: {message}'
+            + (f'; trying {plan.text!r}' if plan and plan.text else ''))
+        if plan and plan.text:
+            self.runner.run(key, plan)
 
     @staticmethod
     def quit_self(_):
@@ -733,11 +1165,27 @@ class PwrTray:
         if this:
             this.tray_icon.hide()
         PwrTray.save_picks()
+        if PwrTray.instance:
+            PwrTray.instance.release() # so the new one need not ask us to quit
         project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         args = [sys.executable, '-m', 'pwr_tray.main'] + sys.argv[1:]
         subprocess.Popen(args, cwd=project_root)
+        Utils.prt_flush()
         os._exit(0)
 
+    def on_quit_request(self):
+        """ Control socket 'quit' (a new instance is starting) """
+        prt('+', 'quitting applet (replaced by a new instance)...')
+        self.save_picks()
+        self.tray_icon.hide()
+        self.app.quit()
+        return f'bye {os.getpid()}'
+
+    def on_stats_request(self):
+        """ Control socket 'stats' (for 'pwr-tray --stats') """
+        self.report_stats()
+        return 'ok'
+
     @staticmethod
     def edit_config(_):
         this = PwrTray.singleton
@@ -746,25 +1194,37 @@ class PwrTray:
                 ini_path = this.ini_tool.ini_path
                 arguments = this.get_params().gui_editor.split()
                 arguments.append(ini_path)
-                prt('+', 'running:', arguments)
-                subprocess.run(arguments, check=True)
+                this.runner.run('edit_config', arguments)
             except Exception as e:
                 prt(f"Edit Config ERR: {e}")
 
     @staticmethod
     def suspend(_):
-        """TBD"""
+        """ Lock, then suspend once the locker has forked (or has been
+        running a moment if it does not fork). """
         this = PwrTray.singleton
+        if this.suspending or this.runner.busy('suspend'):
+            prt('suspend: already in progress')
+            return
         this.set_state('Asleep')
         this.reset_xidle_ms()
-        PwrTray.run_command('locker')
-        PwrTray.run_command('suspend')
-        # systemctl suspend blocks until resume
-        prt('suspend: resumed')
+        this.suspending = True
+
+        def on_suspend_done(job):
+            if job.rc != 0:
+                prt('WARN: suspend failed')
+
+        def go_down(_job=None):
+            this.suspending = False
+            PwrTray.run_command('suspend', on_done=on_suspend_done)
+
+        if not PwrTray.run_command('locker', on_done=go_down, settle_s=1.0):
+            go_down()
 
     @staticmethod
     def poweroff(_):
-        """TBD"""
+        """ Power off (as Asleep, so the policy does not ask again) """
+        PwrTray.singleton.set_state('Asleep')
         PwrTray.run_command('poweroff')
 
     @staticmethod
@@ -785,12 +1245,20 @@ class PwrTray:
     @staticmethod
     def lock_screen(_):
         this = PwrTray.singleton
-        PwrTray.run_command('locker')
-        this.update_running_idle_s()
+        PwrTray.run_command('locker', on_done=this.on_locker_done)
+        if this.idle_alarms: # in-process, so current; else keep the last sample
+            this.update_running_idle_s()
 #       if 0 <= int(thisget_params()params.dim_pct_brightness) < 100:
 #           this.undim(None)
         this.set_state('Locked')
 
+    def on_locker_done(self, job):
+        """ A locker that failed has not locked; let the policy retry """
+        if job.rc != 0:
+            prt('WARN: locker failed; not locked')
+            if self.state.name == 'Locked':
+                self.set_state('Awake')
+
     def blank_primitive(self, lock_screen=False):
         """TBD"""
         cmd = self.variables['monitors_off']
@@ -798,10 +1266,7 @@ class PwrTray:
             if lock_screen:
                 # self.lock_screen(None, before='sleep 1.5; ')
                 self.lock_screen(None)
-            prt('+', cmd)
-            result = subprocess.run(cmd, shell=True, check=False)
-            if result.returncode != 0:
-                prt(f'   NOTE: returncode={result.returncode}')
+            self.run_command('monitors_off')
             self.set_state('Blanked')
 
         else:
@@ -829,7 +1294,7 @@ class PwrTray:
         """TBD"""
         this = PwrTray.singleton
         this.mode = 'Presentation'
-        this.was_output = 'Changed Mode'
+        this.rebuild_menu = True
         prt('+', f'{this.mode=}')
         this.save_picks()
         this.idle_manager_start()
@@ -839,7 +1304,7 @@ class PwrTray:
         """TBD"""
         this = PwrTray.singleton
         this.mode = 'LockOnly'
-        this.was_output = 'Changed Mode'
+        this.rebuild_menu = True
         prt('+', f'{this.mode=}')
         this.save_picks()
         this.idle_manager_start()
@@ -849,45 +1314,60 @@ class PwrTray:
         """TBD"""
         this = PwrTray.singleton
         this.mode = 'SleepAfterLock'
-        this.was_output = 'Changed Mode'
+        this.rebuild_menu = True
         prt('+', f'{this.mode=}')
         this.save_picks()
         this.idle_manager_start()
 
-    def _start_resume_monitor(self):
-        """Start dbus-monitor subprocess for resume detection (non-blocking)."""
-        try:
-            proc = subprocess.Popen(
-                ['dbus-monitor', '--system',
-                 "type='signal',interface='org.freedesktop.login1.Manager',"
-                 "member='PrepareForSleep'"],
-                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
-            os.set_blocking(proc.stdout.fileno(), False)
-            prt('resume monitor: started')
-            return proc
-        except FileNotFoundError:
-            prt('WARN: dbus-monitor not found; resume detection disabled')
-            return None
-
-    def _check_resume(self):
-        """Poll dbus-monitor for resume signal (called from on_timeout)."""
-        if not self._resume_proc:
+    def on_prepare_for_sleep(self):
+        """ logind is about to suspend (by us or otherwise, e.g., the lid) """
+        prt(f'going to sleep (state={self.state.name})')
+        release = self.sleep_watcher.release_delay
+        if not self.idle_manager and self.state.name == 'Awake':
+            # lock first (as swayidle's before-sleep would); logind waits
+            def on_locked(job):
+                if not job.running:
+                    self.on_locker_done(job)
+                release()
+            self.set_state('Locked')
+            if not PwrTray.run_command('locker', on_done=on_locked, settle_s=1.0):
+                release()
+        else:
+            release() # locked already (or swayidle locks)
+        Utils.prt_flush(timeout=0.5) # the log is complete if we never wake
+
+    def on_resume(self):
+        """ logind resumed: re-probe everything and reconcile the state in one
+        pass now rather than over the next ticks.  The children (monitors_on,
+        a swayidle restart) are started first and not waited upon, and the
+        blocking probes run at once on the probe pool; the time from the
+        signal to an up-to-date tray is kept per resume (see
+        note_resume_ready()). """
+        self.resume_began = (self.stats.start(), time.monotonic())
+        prt('resume detected')
+        if self.state.name == 'Blanked': # we blanked; the locker is still up
+            self.run_command('monitors_on')
+            self.set_state('Locked')
+        if self.idle_manager:
+            self.idle_manager.checkup()
+        self.power.read()
+        self.inhibitors.mark_dirty()
+        self.rebuild_menu = True
+        self.sample_due_mono = 0
+        self.on_timeout() # battery, inhibitors, menu, icon, and idle policy
+
+    def note_resume_ready(self):
+        """ After the idle policy ran: if that was the first since a resume,
+        keep the time from the resume signal to here """
+        if not self.resume_began:
             return
-        try:
-            chunk = os.read(self._resume_proc.stdout.fileno(), 4096)
-            if chunk:
-                self._resume_buf += chunk
-                if b'boolean false' in self._resume_buf:
-                    prt('resume detected')
-                    self._resume_buf = b''
-                    self.poll_100ms = True  # trigger immediate re-poll
-                # Prevent unbounded growth; keep tail for partial matches
-                elif len(self._resume_buf) > 1024:
-                    self._resume_buf = self._resume_buf[-512:]
-        except BlockingIOError:
-            pass
-        except OSError:
-            pass
+        (mark, began_mono), self.resume_began = self.resume_began, None
+        ready_ms = round((time.monotonic() - began_mono) * 1000, 1)
+        self.stats.lap('resume', mark)
+        self.resumes.append({'when': round(time.time()), 'ready_ms': ready_ms,
+                'state': self.state.name, 'idle_s': self.running_idle_s})
+        prt(f'resume: ready in {ready_ms:.0f}ms (state={self.state.name})')
+
     @staticmethod
     def goodbye(message=''):
         prt(f'ENDED {message}')
@@ -910,6 +1390,12 @@ def main():
             help='exec ${EDITOR:-vim} on config.ini file')
     parser.add_argument('-q', '--quick', action='store_true',
             help='quick mode (1m lock + 1m sleep')
+    parser.add_argument('--startup-profile', action='store_true',
+            help='print the time of each start-up phase and exit')
+    parser.add_argument('--stats', action='store_true',
+            help='show the tick stats of the running applet')
+    parser.add_argument('--fixed-poll', action='store_true',
+            help='wake every 2s like older versions (to compare wakeups)')
     parser.add_argument('--de', metavar='NAME',
             help='force desktop (e.g. i3-x11, sway-wayland, kde-wayland)')
     opts = parser.parse_args()
@@ -922,6 +1408,11 @@ def main():
         os.execvp(editor, args)
         sys.exit(1) # just in case ;-)
 
+    if opts.stats:
+        ini_tool = IniTool(paths_only=True)
+        request(ini_tool.folder, 'stats') # refresh it if running
+        sys.exit(show_file(ini_tool.stats_path))
+
     if opts.follow_log:
         ini_tool = IniTool(paths_only=True)
         args = ['tail', '-n50', '-F', ini_tool.log_path]
@@ -931,10 +1422,17 @@ def main():
 
     # os.environ['DISPLAY'] = ':0'
 
+    startup_phase('imports')
+    profile_fd = os.dup(1) if opts.startup_profile else None
     ini_tool = IniTool(paths_only=False)
     Utils.prt_path = ini_tool.log_path
     prt('START-UP', to_stdout=opts.stdout)
-    PyKill().kill_loop('pwr-tray')
+    if not opts.startup_profile: # a one-shot; leave any running applet be
+        PwrTray.instance = Instance(ini_tool.folder)
+        if not PwrTray.instance.acquire():
+            prt('ALERT: cannot replace the running pwr-tray; exiting')
+            sys.exit(1)
+        startup_phase('instance')
     atexit.register(PwrTray.goodbye)
 
 
@@ -942,9 +1440,24 @@ def main():
     if opts.debug:
         for selector in ini_tool.get_selectors():
             ini_tool.params_by_selector[selector].debug_mode = True # one-time override
-
-
-    tray = PwrTray(ini_tool=ini_tool, quick=opts.quick, force_de=opts.de)
+    startup_phase('ini')
+
+
+    tray = PwrTray(ini_tool=ini_tool, quick=opts.quick, force_de=opts.de,
+                   fixed_poll=opts.fixed_poll, profile=opts.startup_profile)
+    if PwrTray.instance:
+        PwrTray.instance.serve({'quit': tray.on_quit_request,
+                                'stats': tray.on_stats_request})
+    if profile_fd is not None:
+        from PyQt5.QtCore import QTimer
+
+        def show_profile():
+            startup_phase('first-event')
+            lines = [f'{name:>12} {secs*1000:8.1f}ms' for name, secs in startup_phases]
+            lines.append(f'{"TOTAL":>12} {(time.monotonic()-STARTED_MONO)*1000:8.1f}ms')
+            os.write(profile_fd, ('\n'.join(lines) + '\n').encode('utf-8'))
+            tray.app.quit()
+        QTimer.singleShot(0, show_profile)
     tray.app.exec_()
 
 if __name__ == "__main__":
@@ -958,6 +1471,7 @@ if __name__ == "__main__":
         sys.exit(1)
 
     except Exception as exc:
+        import traceback
         prt("Caught exception running main(), so exiting ...\n",
             traceback.format_exc(limit=24))
         sys.exit(9)